@@ -1,10 +1,44 @@
 import os
 import json
+import argparse
+import threading
+import openai
 from datetime import datetime
 from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from openai_model import OpenAIModel
+from deepseek_model import DeepSeekModel
+from llm_router import LLMRouter
+from model_dispatcher import ModelDispatcher
+from kpi_schema import KPISchema
+from doc_packing import group_by_period, pack_documents
+from prompt_version import META_KEY, result_meta, prompt_versions, affected_fields, latest_results
+from budget_ledger import BudgetLedger, usage_labels
+from budget_scheduler import BudgetScheduler
+from llm_cache import LLMCache
+from llm_registry import LLMRegistry
+from openai_batch import OpenAIBatch, FINAL_STATUSES
 from url_handler import URLHandler
-from pdf_handler import PDFHandler
+from pdf_handler import PDFHandler, iter_extracted_pages, join_pages
+from page_filter import prefilter_pages
+from text_normalizer import normalize_pages, format_stats
+from pdf_text_cache import PDFTextCache
+from settings import Settings
+
+
+# Beskytter read_files.csv og results/ når flere PDF-er blir ferdige samtidig
+_commit_lock = threading.Lock()
+
+# Backender for --router, i foretrukket rekkefølge
+ROUTER_SPECS = [(OpenAIModel, "gpt-4o"), (DeepSeekModel, "deepseek-chat")]
+_routers = {}
+_routers_lock = threading.Lock()
+
+# Hvordan modell velges per PDF (--route)
+ROUTES = ("fixed", "router", "dispatch")
+
+# Modell for små oppfølgingskall som henter manglende/ugyldige KPI-felter
+REPAIR_MODEL = "gpt-4o"
 
 
 def load_instructions(filename: str) -> str:
@@ -12,10 +46,160 @@ def load_instructions(filename: str) -> str:
     with open(filename, "r", encoding="utf-8") as f:
         return f.read()
 
-def run_analysis_for_company(company: str) -> None:
+
+def extract_pdf_text(company: str, pdf_path: str, prefilter_tokens: int | None = None,
+                     normalize: bool = False) -> str:
+    """
+    Henter tekst fra én PDF. Ligger på modulnivå slik at den kan kjøres
+    i en ProcessPoolExecutor (PyPDF2 er CPU-bundet).
+    'prefilter_tokens' og 'normalize': se document_text.
+    """
+    pages = PDFHandler(company).extract_pages(pdf_path)
+    return document_text(os.path.basename(pdf_path), pages, prefilter_tokens, normalize)
+
+
+def document_text(pdf_filename: str, pages: list[str], prefilter_tokens: int | None = None,
+                  normalize: bool = False) -> str:
+    """
+    Teksten som sendes til LLM for én PDF. Med normalize=True fjernes topp-/bunntekster,
+    sidetall, orddeling og juridisk standardtekst først (text_normalizer.py). Med
+    'prefilter_tokens' sendes bare sidene med høyest KPI-poengsum (page_filter.py)
+    innenfor så mange tokens.
+    """
+    if normalize:
+        pages, stats = normalize_pages(pages)
+        print(f"{pdf_filename}: normalisert {format_stats(stats)}")
+    if not prefilter_tokens:
+        return join_pages(pages)
+    text, stats = prefilter_pages(pages, prefilter_tokens)
+    if stats["pages_out"] < stats["pages_in"]:
+        print(f"{pdf_filename}: sender {stats['pages_out']} av {stats['pages_in']} sider "
+              f"({stats['tokens_in']} -> {stats['tokens_out']} tokens)")
+    return text
+
+
+def get_router(instructions: str) -> LLMRouter:
+    """Delt router per instruksjonssett, så latensstatistikken samles på tvers av PDF-er."""
+    with _routers_lock:
+        if instructions not in _routers:
+            _routers[instructions] = LLMRouter.from_specs(
+                instructions, ROUTER_SPECS, model_kwargs={"json_mode": True}, hedge=True
+            )
+        return _routers[instructions]
+
+
+def analyze_pdf_text(instructions: str, pdf_text: str, route: str = "fixed", document: str = "") -> str:
+    """
+    Kjører LLM med instruksjoner + PDF-tekst og returnerer rå respons.
+    route="fixed": gpt-4o for alt.
+    route="router": provider velges etter nylig latens/feilrate, med failover og hedging.
+    route="dispatch": modell-tier velges etter dokumentets størrelse (Settings().model_tiers).
+    """
+    if route == "router":
+        return get_router(instructions).run(pdf_text)
+    if route == "dispatch":
+        return ModelDispatcher(instructions, json_mode=True).run(pdf_text, document=document)
+    # Samme instans (og HTTP-pool) gjenbrukes for alle PDF-er og tråder
+    llm_model = LLMRegistry().get_model(OpenAIModel, instructions, "gpt-4o", json_mode=True)
+    return llm_model.run(pdf_text)
+
+
+def estimate_model(instructions: str, pdf_text: str, route: str = "fixed") -> str:
+    """Modellen kostnaden for en PDF estimeres med (budsjettstyrt kjøring)."""
+    if route == "router":
+        return ROUTER_SPECS[0][1]
+    if route == "dispatch":
+        return ModelDispatcher(instructions).choose_tier(pdf_text)[0][2]
+    return "gpt-4o"
+
+
+def enforce_schema(instructions: str, pdf_text: str, raw_response: str) -> dict | None:
+    """
+    Validerer svaret mot KPI-skjemaet (kpi_schema.py) og henter manglende eller
+    ugyldige felter med små oppfølgingskall. Returnerer None uten skjema.
+    """
+    schema = KPISchema.load(instructions)
+    if schema is None:
+        return None
+    repair_model = LLMRegistry().get_model(OpenAIModel, instructions, REPAIR_MODEL, json_mode=True)
+    data, problems = schema.enforce(repair_model, pdf_text, raw_response)
+    if problems:
+        print(f"Felter som fortsatt er ugyldige: {problems}")
+    return data
+
+
+def mark_pdf_as_read(pdf_handler: PDFHandler, pdf_filename: str) -> None:
+    """Oppdaterer CSV med at vi har lest denne PDF-en (trådsikkert)."""
+    with _commit_lock:
+        read_files = pdf_handler._get_read_files()
+        read_files.add(pdf_filename)
+        pdf_handler._update_read_files(read_files)
+
+
+def save_result(pdf_filename: str, raw_response: str, data: dict | None = None,
+                meta: dict | None = None) -> str:
+    """
+    Parser LLM-responsen og lagrer JSON-resultatet (ett per PDF) i results/.
+    Er 'data' allerede validert (se enforce_schema), lagres den i stedet.
+    'meta' (se prompt_version.result_meta) lagres under "_meta", slik at
+    resultatet kan kjøres på nytt når instruksjonene endres.
+    Returnerer stien til JSON-filen.
     """
-    Kjører analyse på _hver_ PDF for 'company', én etter én.  
+    if data is None:
+        # Forsøk å parse JSON fra respons
+        try:
+            data = json.loads(raw_response)
+        except json.JSONDecodeError:
+            print("Kunne ikke parse JSON fra LLM-respons. Lagre rå respons i en fil.")
+            data = {}
+            # (Valgfritt) lagre den rå responsen
+            os.makedirs("results", exist_ok=True)
+            with open(os.path.join("results", f"{pdf_filename}_raw.txt"), "w", encoding="utf-8") as rf:
+                rf.write(raw_response)
+
+    if meta is not None:
+        data = dict(data, **{META_KEY: meta})
+
+    os.makedirs("results", exist_ok=True)
+    date_str = datetime.now().strftime("%Y%m%d_%H%M%S")
+    json_filename = os.path.splitext(pdf_filename)[0] + f"_{date_str}.json"
+    json_path = os.path.join("results", json_filename)
+
+    with _commit_lock:
+        print(f"Resultat fra OpenAI (JSON) for {pdf_filename}:")
+        print(json.dumps(data, indent=2, ensure_ascii=False))
+
+        # Skriv til temp-fil først, så en avbrutt kjøring ikke etterlater halve filer
+        tmp_path = json_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, json_path)
+
+    return json_path
+
+
+def run_analysis_for_company(company: str, workers: int = 1, route: str = "fixed",
+                             scheduler: BudgetScheduler | None = None, pack: bool = False,
+                             prefilter_tokens: int | None = None, normalize: bool = False) -> None:
+    """
+    Kjører analyse på _hver_ PDF for 'company'.
     Oppretter et JSON-resultat per PDF, med filnavn basert på PDF-ens navn.
+
+    Med workers=1 behandles PDF-ene én etter én. Med workers > 1 kjøres
+    tekstuthenting i en prosesspool og LLM-kall i en trådpool, begge
+    begrenset til 'workers' samtidige jobber. Resultat og read_files.csv
+    oppdateres etter hvert som hver PDF blir ferdig, i vilkårlig rekkefølge.
+    'route' bestemmer hvordan modell velges per PDF (se analyze_pdf_text).
+
+    Med en 'scheduler' hentes teksten fra alle PDF-ene først, og de sendes
+    billigste først så lenge budsjettet holder; resten blir stående som uleste.
+
+    Med pack=True grupperes PDF-ene per kvartal (doc_packing.py), og hver gruppe
+    gir ett samlet resultat i stedet for ett per PDF; med workers > 1 kjøres
+    kvartalene samtidig.
+
+    Med 'prefilter_tokens' sendes bare de mest KPI-relevante sidene av hver PDF,
+    og med normalize=True renses teksten først (se document_text).
     """
     instructions_file = "LLMText/json_instructions.txt"
     if not os.path.exists(instructions_file):
@@ -43,59 +227,396 @@ def run_analysis_for_company(company: str) -> None:
         return
 
     # 3) Loop over hver ulest PDF
-    for pdf_info in unread_list:
-        pdf_filename = pdf_info["filename"]
-        pdf_path = pdf_info["full_path"]
+    if pack:
+        _run_packed(pdf_handler, company, instructions, unread_list, route, scheduler,
+                    prefilter_tokens, normalize, workers)
+    elif workers <= 1 and scheduler is None:
+        for pdf_info in unread_list:
+            pdf_filename = pdf_info["filename"]
+            print(f"\nBehandler PDF: {pdf_filename}")
+            pdf_text = extract_pdf_text(company, pdf_info["full_path"], prefilter_tokens, normalize)
+            _finish_pdf(pdf_handler, instructions, pdf_filename, pdf_text, route, company)
+    elif workers <= 1:
+        texts = {p["filename"]: extract_pdf_text(company, p["full_path"], prefilter_tokens, normalize)
+                 for p in unread_list}
+        for pdf_filename in _cheapest_first(instructions, texts, route, scheduler):
+            print(f"\nBehandler PDF: {pdf_filename}")
+            _finish_pdf(pdf_handler, instructions, pdf_filename, texts[pdf_filename], route, company, scheduler)
+    else:
+        _run_concurrently(pdf_handler, company, instructions, unread_list, workers, route, scheduler,
+                          prefilter_tokens, normalize)
 
-        print(f"\nBehandler PDF: {pdf_filename}")
-        pdf_text = pdf_handler.extract_text_from_pdf(pdf_path)
-
-        if not pdf_text.strip():
-            print(f"PDF '{pdf_filename}' ser ut til å være tom. Hoppes over.")
-            # Merk filen som lest i CSV, så vi ikke kjører den på nytt
-            read_files = pdf_handler._get_read_files()
-            read_files.add(pdf_filename)
-            pdf_handler._update_read_files(read_files)
+    print("Alle uleste PDF-filer er nå behandlet.")
+    print(LLMCache.default().report())
+    print(PDFTextCache.default().report())
+    if route == "router":
+        print(get_router(instructions).report())
+    if scheduler is not None:
+        print(scheduler.report())
+
+
+def _cheapest_first(instructions: str, texts: dict, route: str, scheduler: BudgetScheduler) -> list:
+    """PDF-filnavnene i 'texts' sortert etter estimert kostnad, billigste først."""
+    items = []
+    for pdf_filename, pdf_text in texts.items():
+        tokens, cost = scheduler.estimate(estimate_model(instructions, pdf_text, route), instructions, pdf_text)
+        items.append({"key": pdf_filename, "tokens": tokens, "cost": cost})
+    return [item["key"] for item in scheduler.order(items)]
+
+
+def _finish_pdf(pdf_handler: PDFHandler, instructions: str, pdf_filename: str, pdf_text: str,
+                route: str = "fixed", company: str = "", scheduler: BudgetScheduler | None = None) -> str | None:
+    """
+    Kjører LLM for én uthentet PDF, lagrer resultatet og merker filen som lest.
+    Alle kall føres i forbruksregnskapet under 'company' og PDF-navnet.
+    Returnerer stien til resultatet, eller None hvis PDF-en ble hoppet over.
+    """
+    if not pdf_text.strip():
+        print(f"PDF '{pdf_filename}' ser ut til å være tom. Hoppes over.")
+        # Merk filen som lest i CSV, så vi ikke kjører den på nytt
+        mark_pdf_as_read(pdf_handler, pdf_filename)
+        return None
+
+    if scheduler is not None:
+        tokens, cost = scheduler.estimate(estimate_model(instructions, pdf_text, route), instructions, pdf_text)
+        if not scheduler.try_start(pdf_filename, tokens, cost):
+            print(f"Budsjettet er nådd; '{pdf_filename}' (~${cost:.4f}) blir stående som ulest.")
+            return None
+
+    run_id = scheduler.run_id if scheduler is not None else None
+    try:
+        with usage_labels(company=company, document=pdf_filename, run=run_id):
+            raw_response = analyze_pdf_text(instructions, pdf_text, route, document=pdf_filename)
+            data = enforce_schema(instructions, pdf_text, raw_response)
+    finally:
+        if scheduler is not None:
+            scheduler.finish(pdf_filename)
+
+    # 4) Lagre JSON-resultat (ett per PDF), merket med instruksjonsversjonene
+    meta = result_meta(instructions, KPISchema.load(instructions), company, pdf_filename)
+    json_path = save_result(pdf_filename, raw_response, data, meta)
+
+    # 5) Oppdater CSV med at vi har lest denne PDF-en
+    mark_pdf_as_read(pdf_handler, pdf_filename)
+    return json_path
+
+
+def _run_packed(pdf_handler: PDFHandler, company: str, instructions: str, unread_list: list,
+                route: str = "fixed", scheduler: BudgetScheduler | None = None,
+                prefilter_tokens: int | None = None, normalize: bool = False, workers: int = 1) -> None:
+    """
+    Én LLM-kjøring per kvartal: PDF-ene i gruppen pakkes sammen uten gjentatt tekst.
+    Med workers > 1 hentes teksten på en prosesspool og kvartalene kjøres på en
+    trådpool, som i _run_concurrently. Et kvartal der en av PDF-ene ikke kunne
+    leses, blir stående som ulest.
+    """
+    paths = {p["filename"]: p["full_path"] for p in unread_list}
+    groups = sorted(group_by_period(list(paths)).items())
+    if workers <= 1:
+        for period, filenames in groups:
+            texts = {name: extract_pdf_text(company, paths[name], prefilter_tokens, normalize) for name in filenames}
+            _finish_period(pdf_handler, instructions, company, period, texts, route, scheduler)
+        return
+
+    print(f"\nBehandler {len(groups)} kvartaler for {company} med {workers} workers ...")
+    filenames = {path: name for name, path in paths.items()}
+    texts = {}
+    for pdf_path, pages, error in iter_extracted_pages(list(filenames), workers):
+        pdf_filename = filenames[pdf_path]
+        if error is not None:
+            print(f"Kunne ikke hente tekst fra '{pdf_filename}': {error}")
             continue
+        texts[pdf_filename] = document_text(pdf_filename, pages, prefilter_tokens, normalize)
 
-        # Kjør LLM med instruksjoner + PDF-tekst
-        llm_model = OpenAIModel(
-            instructions=instructions,
-            model_name="gpt-4o"
-        )
-        raw_response = llm_model.run(pdf_text)
+    with ThreadPoolExecutor(max_workers=workers) as llm_pool:
+        futures = {}
+        for period, names in groups:
+            if not all(name in texts for name in names):
+                print(f"Hopper over {period} for {company}: ikke all tekst kunne hentes.")
+                continue
+            futures[llm_pool.submit(
+                _finish_period, pdf_handler, instructions, company, period,
+                {name: texts[name] for name in names}, route, scheduler
+            )] = period
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Analyse feilet for {company} {futures[future]}: {e}")
 
-        # Forsøk å parse JSON fra respons
+
+def _finish_period(pdf_handler: PDFHandler, instructions: str, company: str, period: str, texts: dict,
+                   route: str = "fixed", scheduler: BudgetScheduler | None = None) -> None:
+    """Ett kvartal fra _run_packed: en enkelt PDF går via _finish_pdf, flere pakkes med _finish_group."""
+    if len(texts) == 1:
+        pdf_filename, pdf_text = next(iter(texts.items()))
+        print(f"\nBehandler PDF: {pdf_filename}")
+        _finish_pdf(pdf_handler, instructions, pdf_filename, pdf_text, route, company, scheduler)
+        return
+    print(f"\nBehandler {period} for {company}: {', '.join(sorted(texts))}")
+    _finish_group(pdf_handler, instructions, company, period, texts, route, scheduler)
+
+
+def _finish_group(pdf_handler: PDFHandler, instructions: str, company: str, period: str, texts: dict,
+                  route: str = "fixed", scheduler: BudgetScheduler | None = None) -> None:
+    """Som _finish_pdf, men for en pakket gruppe: ett resultat "<selskap>_<periode>", alle PDF-ene merkes som lest."""
+    group_name = f"{company}_{period}"
+    pdf_text, stats = pack_documents(texts)
+    print(f"Pakket {len(texts)} dokumenter: {stats['chars_in']} -> {stats['chars_out']} tegn, "
+          f"{stats['dropped_lines']} gjentatte linjer fjernet"
+          + (f", duplikater droppet: {', '.join(stats['dropped_documents'])}" if stats["dropped_documents"] else ""))
+
+    if pdf_text.strip():
+        if scheduler is not None:
+            tokens, cost = scheduler.estimate(estimate_model(instructions, pdf_text, route), instructions, pdf_text)
+            if not scheduler.try_start(group_name, tokens, cost):
+                print(f"Budsjettet er nådd; {group_name} (~${cost:.4f}) blir stående som ulest.")
+                return
+
+        run_id = scheduler.run_id if scheduler is not None else None
         try:
-            data = json.loads(raw_response)
-        except json.JSONDecodeError:
-            print("Kunne ikke parse JSON fra LLM-respons. Lagre rå respons i en fil.")
-            data = {}
-            # (Valgfritt) lagre den rå responsen
-            os.makedirs("results", exist_ok=True)
-            with open(os.path.join("results", f"{pdf_filename}_raw.txt"), "w", encoding="utf-8") as rf:
-                rf.write(raw_response)
+            with usage_labels(company=company, document=group_name, run=run_id):
+                raw_response = analyze_pdf_text(instructions, pdf_text, route, document=group_name)
+                data = enforce_schema(instructions, pdf_text, raw_response)
+        finally:
+            if scheduler is not None:
+                scheduler.finish(group_name)
 
-        # 4) Lagre JSON-resultat (ett per PDF)
-        os.makedirs("results", exist_ok=True)
-        date_str = datetime.now().strftime("%Y%m%d_%H%M%S")
-        json_filename = os.path.splitext(pdf_filename)[0] + f"_{date_str}.json"
-        json_path = os.path.join("results", json_filename)
+        meta = result_meta(instructions, KPISchema.load(instructions), company, group_name)
+        meta["pdfs"] = sorted(texts)
+        save_result(group_name, raw_response, data, meta)
+    else:
+        print(f"Alle PDF-ene for {group_name} ser ut til å være tomme. Hoppes over.")
 
-        print("Resultat fra OpenAI (JSON):")
-        print(json.dumps(data, indent=2, ensure_ascii=False))
+    for pdf_filename in texts:
+        mark_pdf_as_read(pdf_handler, pdf_filename)
 
-        with open(json_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
 
-        # 5) Oppdater CSV med at vi har lest denne PDF-en
-        read_files = pdf_handler._get_read_files()
-        read_files.add(pdf_filename)
-        pdf_handler._update_read_files(read_files)
+def _run_concurrently(pdf_handler: PDFHandler, company: str, instructions: str,
+                      unread_list: list, workers: int, route: str = "fixed",
+                      scheduler: BudgetScheduler | None = None, prefilter_tokens: int | None = None,
+                      normalize: bool = False) -> dict:
+    """
+    Uthenting på en prosesspool (på tvers av filer og sideområder i store filer,
+    se pdf_handler.iter_extracted_pages), LLM-kall på en trådpool. Hver PDF committes
+    så snart LLM-kallet for den er ferdig. En feil i én PDF stopper ikke de andre;
+    den blir stående som ulest og tas på nytt ved neste kjøring.
+    Med en 'scheduler' ventes det til all tekst er hentet, og PDF-ene sendes
+    til LLM billigste først.
+    Returnerer {"done": n, "skipped": n, "failed": n}; "skipped" er PDF-er
+    _finish_pdf hoppet over (tomme, eller budsjettet var nådd).
+    """
+    print(f"\nBehandler {len(unread_list)} PDF-er med {workers} workers ...")
+    filenames = {p["full_path"]: p["filename"] for p in unread_list}
+    with ThreadPoolExecutor(max_workers=workers) as llm_pool:
+        llm_futures = {}
+        texts = {}
+        for pdf_path, pages, error in iter_extracted_pages(list(filenames), workers):
+            pdf_filename = filenames[pdf_path]
+            if error is not None:
+                print(f"Kunne ikke hente tekst fra '{pdf_filename}': {error}")
+                continue
+            pdf_text = document_text(pdf_filename, pages, prefilter_tokens, normalize)
+            if scheduler is not None:
+                texts[pdf_filename] = pdf_text
+                continue
+            print(f"Tekst hentet fra {pdf_filename}, sender til LLM ...")
+            llm_futures[llm_pool.submit(
+                _finish_pdf, pdf_handler, instructions, pdf_filename, pdf_text, route, company
+            )] = pdf_filename
 
-    print("Alle uleste PDF-filer er nå behandlet.")
+        if scheduler is not None:
+            # Trådpoolen tar jobbene i innsendt rekkefølge, så billigste starter først
+            for pdf_filename in _cheapest_first(instructions, texts, route, scheduler):
+                llm_futures[llm_pool.submit(
+                    _finish_pdf, pdf_handler, instructions, pdf_filename, texts[pdf_filename],
+                    route, company, scheduler
+                )] = pdf_filename
+
+        counts = {"done": 0, "skipped": 0, "failed": 0}
+        for future in as_completed(llm_futures):
+            pdf_filename = llm_futures[future]
+            try:
+                json_path = future.result()
+            except Exception as e:
+                print(f"Analyse feilet for '{pdf_filename}': {e}")
+                counts["failed"] += 1
+                continue
+            if json_path is None:
+                print(f"Hoppet over: {pdf_filename}")  # tom PDF eller budsjettet nådd, se _finish_pdf
+                counts["skipped"] += 1
+            else:
+                print(f"Ferdig: {pdf_filename} -> {json_path}")
+                counts["done"] += 1
+    print(f"{counts['done']} ferdige, {counts['skipped']} hoppet over, {counts['failed']} feilet.")
+    return counts
+
+
+def run_batch_for_companies(companies: list, batch_name: str, wait: bool = True,
+                            poll_interval: float = 60.0, api_base: str = None,
+                            resubmit_failed: bool = False) -> None:
+    """
+    Backfill via OpenAI sin batch-endepunkt (billigere, men svar kommer senere).
+
+    Første kjøring samler alle uleste PDF-er for 'companies' i én batch og sender
+    den inn. Senere kjøringer med samme 'batch_name' gjenopptar batchen fra
+    operation/batches/<batch_name>.json, poller status og lagrer resultatene
+    per PDF når batchen er ferdig (eller har gått ut på tid; svarene som kom
+    lagres likevel). Med resubmit_failed=True sendes forespørslene som feilet
+    eller ikke ble besvart inn på nytt under samme navn.
+    """
+    instructions_file = "LLMText/json_instructions.txt"
+    if not os.path.exists(instructions_file):
+        raise FileNotFoundError(f"Instruksjonsfilen '{instructions_file}' ble ikke funnet.")
+    instructions = load_instructions(instructions_file)
+
+    model = LLMRegistry().get_model(OpenAIModel, instructions, "gpt-4o", json_mode=True)
+    batch = OpenAIBatch(model, os.path.join("operation", "batches", f"{batch_name}.json"), api_base=api_base)
+
+    if not batch.batch_id:
+        for company in companies:
+            pdf_handler = PDFHandler(company)
+            if not os.path.isdir(pdf_handler._PDFHandler__ticker_path):
+                print(f"Ingen mappe funnet for selskapet '{company}'. Hoppes over.")
+                continue
+            for pdf_info in pdf_handler.list_downloaded_pdfs():
+                if pdf_info["processed"]:
+                    continue
+                pdf_filename = pdf_info["filename"]
+                pdf_text = pdf_handler.extract_text_from_pdf(pdf_info["full_path"])
+                if not pdf_text.strip():
+                    print(f"PDF '{pdf_filename}' ser ut til å være tom. Hoppes over.")
+                    mark_pdf_as_read(pdf_handler, pdf_filename)
+                    continue
+                if not model.fits_single_call(pdf_text):
+                    print(f"PDF '{pdf_filename}' er for stor for ett kall; kjør den uten --batch.")
+                    continue
+                batch.add(f"{company}/{pdf_filename}", pdf_text,
+                          {"company": company, "filename": pdf_filename})
+
+        if not batch.requests:
+            print("Ingen uleste PDF-filer å sende inn.")
+            return
+        batch.submit()
+
+    status = batch.wait(poll_interval) if wait else batch.poll()
+    if status not in FINAL_STATUSES:
+        print(f"Batch {batch.batch_id} har status '{status}'. Kjør igjen senere for å hente resultater.")
+        return
+
+    for custom_id, content in batch.results().items():
+        if content is None:
+            continue  # blir stående som ulest og kan tas i en ny batch
+        meta = batch.requests[custom_id]["meta"]
+        # Samme skjemakontroll som ved vanlig kjøring; teksten ligger normalt i PDF-tekstcachen
+        pdf_path = os.path.join(Settings().pdf_root, meta["company"], meta["filename"])
+        with usage_labels(company=meta["company"], document=meta["filename"]):
+            batch.record_usage(custom_id)
+            data = enforce_schema(instructions, extract_pdf_text(meta["company"], pdf_path), content)
+        save_result(meta["filename"], content, data,
+                    meta=result_meta(instructions, KPISchema.load(instructions), meta["company"], meta["filename"]))
+        mark_pdf_as_read(PDFHandler(meta["company"]), meta["filename"])
+        batch.mark_collected(custom_id)
+
+    print(f"Batch {batch.batch_id}: {len(batch.state['collected'])}/{len(batch.requests)} resultater lagret.")
+    if batch.state["failed"]:
+        if resubmit_failed:
+            batch.resubmit_failed()
+            print("Kjør igjen med samme --batch-navn for å hente resultatene.")
+        else:
+            print(f"{len(batch.state['failed'])} forespørsler feilet; send dem på nytt med --resubmit-failed.")
 
 
+def _find_pdf(stem: str, meta: dict | None) -> tuple[str, str | list] | None:
+    """
+    (selskap, sti) til PDF-en et resultat ble laget fra, eller (selskap, [stier])
+    for et pakket kvartal. Eldre resultater uten "_meta" søkes opp på filnavnet.
+    """
+    pdf_root = Settings().pdf_root
+    if meta and meta.get("pdfs"):
+        # Pakket kvartal (se _finish_group): teksten bygges fra alle PDF-ene
+        paths = [os.path.join(pdf_root, meta["company"], name) for name in meta["pdfs"]]
+        return (meta["company"], paths) if all(os.path.exists(p) for p in paths) else None
+    if meta and meta.get("company") and meta.get("pdf"):
+        path = os.path.join(pdf_root, meta["company"], meta["pdf"])
+        if os.path.exists(path):
+            return meta["company"], path
+    if not os.path.isdir(pdf_root):
+        return None
+    for company in sorted(os.listdir(pdf_root)):
+        path = os.path.join(pdf_root, company, f"{stem}.pdf")
+        if os.path.exists(path):
+            return company, path
+    return None
+
+
+def recompute_results(route: str = "fixed", dry_run: bool = False, results_dir: str = "results",
+                      prefilter_tokens: int | None = None, normalize: bool = False) -> dict:
+    """
+    Kjører resultatene i 'results_dir' på nytt etter en endring i instruksjonene,
+    men bare det som faktisk er berørt (se prompt_version.affected_fields):
+    dokumenter der bare enkelte felter er endret får bare de feltene hentet på nytt
+    (ett lite kall med utdrag), resten kjøres i sin helhet. Uberørte resultater
+    røres ikke. Et nytt resultat lagres ved siden av det gamle.
+    'prefilter_tokens' og 'normalize' bør være de samme som i den opprinnelige
+    kjøringen (se document_text).
+
+    Returnerer {"none": n, "fields": n, "full": n, "missing": n} (antall dokumenter).
+    """
+    instructions_file = "LLMText/json_instructions.txt"
+    if not os.path.exists(instructions_file):
+        raise FileNotFoundError(f"Instruksjonsfilen '{instructions_file}' ble ikke funnet.")
+    instructions = load_instructions(instructions_file)
+    schema = KPISchema.load(instructions)
+    current = prompt_versions(instructions, schema)
+
+    counts = {"none": 0, "fields": 0, "full": 0, "missing": 0}
+    for stem, (path, data) in sorted(latest_results(results_dir).items()):
+        meta = data.get(META_KEY)
+        action, fields = affected_fields(meta, current)
+        if action == "none":
+            counts["none"] += 1
+            continue
+        found = _find_pdf(stem, meta)
+        if found is None:
+            print(f"Fant ikke PDF-en for '{path}'; hoppes over.")
+            counts["missing"] += 1
+            continue
+        counts[action] += 1
+        company, pdf_path = found
+        pdf_filename = meta["pdf"] if isinstance(pdf_path, list) else os.path.basename(pdf_path)
+        print(f"{pdf_filename}: " + (f"henter {', '.join(fields)} på nytt" if action == "fields" else "kjøres på nytt"))
+        if dry_run:
+            continue
+
+        if isinstance(pdf_path, list):
+            pdf_text = pack_documents({os.path.basename(p): extract_pdf_text(company, p, prefilter_tokens, normalize)
+                                       for p in pdf_path})[0]
+        else:
+            pdf_text = extract_pdf_text(company, pdf_path, prefilter_tokens, normalize)
+        with usage_labels(company=company, document=pdf_filename):
+            if action == "full":
+                raw_response = analyze_pdf_text(instructions, pdf_text, route, document=pdf_filename)
+                result = enforce_schema(instructions, pdf_text, raw_response)
+            else:
+                model = LLMRegistry().get_model(OpenAIModel, instructions, REPAIR_MODEL, json_mode=True)
+                result = {key: value for key, value in data.items() if key != META_KEY and key in schema.fields}
+                result.update(schema.fetch_fields(model, pdf_text, {key: "instruksjonene for feltet er endret"
+                                                                     for key in fields}, stage="recompute"))
+                result, problems = schema.validate(result)
+                if problems:
+                    print(f"Felter som fortsatt er ugyldige: {problems}")
+                raw_response = json.dumps(result, ensure_ascii=False)
+        new_meta = result_meta(instructions, schema, company, pdf_filename)
+        if isinstance(pdf_path, list):
+            new_meta["pdfs"] = meta["pdfs"]
+        save_result(pdf_filename, raw_response, result, new_meta)
+
+    print(f"Recompute: {counts['none']} uendret, {counts['fields']} med enkeltfelter, "
+          f"{counts['full']} kjørt på nytt, {counts['missing']} uten PDF"
+          + (" (tørrkjøring)" if dry_run else ""))
+    return counts
+
 
 def download_pdfs_urls(company: str, report_urls: list) -> None:
     pdf_handler = PDFHandler(company)
@@ -107,18 +628,133 @@ def download_pdfs_urls(company: str, report_urls: list) -> None:
             pdf_handler.download_pdf(url, filename)
 
 
+def parse_cli(argv=None):
+    ap = argparse.ArgumentParser(
+        description="Last ned og analyser rapport-PDF-er for et selskap."
+    )
+    ap.add_argument(
+        "companies", nargs="*", default=["Svedberg"],
+        help="Selskapsnavn slik de står i operation/ReportURLs.csv"
+    )
+    ap.add_argument(
+        "-w", "--workers", type=int, default=1,
+        help="Antall PDF-er som behandles samtidig (1 = én etter én)"
+    )
+    ap.add_argument(
+        "--batch", metavar="NAVN",
+        help="Send uleste PDF-er via batch-endepunktet (gjenopptas med samme navn)"
+    )
+    ap.add_argument(
+        "--no-wait", action="store_true",
+        help="Med --batch: poll én gang og avslutt i stedet for å vente på batchen"
+    )
+    ap.add_argument(
+        "--poll-interval", type=float, default=60.0,
+        help="Med --batch: sekunder mellom hver statussjekk"
+    )
+    ap.add_argument(
+        "--resubmit-failed", action="store_true",
+        help="Med --batch: send forespørsler som feilet eller gikk ut på tid inn på nytt under samme navn"
+    )
+    ap.add_argument(
+        "--llm-base-url", metavar="URL",
+        help="Send alle LLM-kall til en annen OpenAI-kompatibel server, "
+             "f.eks. mock_llm_server.py på http://127.0.0.1:8089/v1"
+    )
+    ap.add_argument(
+        "--budget-usd", type=float,
+        help="Maks estimert kostnad (USD) for kjøringen; billigste PDF-er tas først"
+    )
+    ap.add_argument(
+        "--budget-tokens", type=int,
+        help="Maks tokens for kjøringen; billigste PDF-er tas først"
+    )
+    ap.add_argument(
+        "--usage-report", choices=("company", "document", "model", "stage", "run"),
+        help="Skriv ut token-/kostnadsforbruk gruppert på dette og avslutt"
+    )
+    ap.add_argument(
+        "--route", choices=ROUTES, default="fixed",
+        help="Modellvalg per PDF: fixed = gpt-4o, router = OpenAI/DeepSeek etter latens/feilrate "
+             "med failover og hedging, dispatch = modell-tier etter dokumentstørrelse"
+    )
+    ap.add_argument(
+        "--recompute", action="store_true",
+        help="Kjør bare resultatene i results/ som er berørt av endringer i instruksjonene "
+             "på nytt (bare endrede felter der det går) og avslutt; bruk samme --prefilter/--normalize "
+             "som i den opprinnelige kjøringen"
+    )
+    ap.add_argument(
+        "--dry-run", action="store_true",
+        help="Med --recompute: vis hva som ville blitt kjørt, uten LLM-kall"
+    )
+    ap.add_argument(
+        "--pack", action="store_true",
+        help="Pakk rapport, presentasjon o.l. fra samme kvartal i én LLM-kjøring "
+             "uten gjentatt tekst, og lagre ett samlet resultat per kvartal"
+    )
+    ap.add_argument(
+        "--prefilter", nargs="?", type=int, const=Settings().prefilter_tokens, metavar="TOKENS",
+        help="Send bare de mest KPI-relevante sidene (tall og KPI-ord på norsk/svensk/engelsk) "
+             f"innenfor et token-budsjett (standard {Settings().prefilter_tokens})"
+    )
+    ap.add_argument(
+        "--normalize", action="store_true",
+        help="Fjern gjentatte topp-/bunntekster, sidetall, orddeling og juridisk standardtekst "
+             "før teksten sendes (besparelsen logges per PDF)"
+    )
+    return ap.parse_args(argv)
+
+
+def use_llm_base_url(base_url: str) -> None:
+    """Peker både OpenAI- og DeepSeek-klientene mot 'base_url' (f.eks. en lokal testserver)."""
+    base_url = base_url.rstrip("/")
+    openai.api_base = base_url
+    DeepSeekModel.api_url = f"{base_url}/chat/completions"
+
+
+def print_usage_report(group_by: str) -> None:
+    """Forbruk fra forbruksregnskapet (budget_ledger), gruppert på 'group_by'."""
+    rows = BudgetLedger.default().usage_summary(group_by)
+    if not rows:
+        print("Ingen kall er ført i forbruksregnskapet ennå.")
+        return
+    print(f"{group_by:<40} {'kall':>6} {'input':>10} {'output':>10} {'USD':>10}")
+    for row in rows:
+        print(f"{str(row[group_by]):<40} {row['calls']:>6} {row['prompt_tokens']:>10} "
+              f"{row['completion_tokens']:>10} {row['cost']:>10.4f}")
+
 
 if __name__ == "__main__":
-    # Eksempel: Kjør for "Svedberg"
-    company = "Svedberg"
+    args = parse_cli()
+    if args.usage_report:
+        print_usage_report(args.usage_report)
+        raise SystemExit(0)
+    if args.llm_base_url:
+        use_llm_base_url(args.llm_base_url)
+    if args.recompute:
+        recompute_results(route=args.route, dry_run=args.dry_run,
+                          prefilter_tokens=args.prefilter, normalize=args.normalize)
+        raise SystemExit(0)
 
-    # 1) Hent URL-er for "Svedberg" fra URLHandler
-    url_handler = URLHandler()
-    touch_urls = url_handler.get_urls_for_company(company)
-    print(f"URL-er for {company}: {touch_urls}")
+    for company in args.companies:
+        # 1) Hent URL-er for selskapet fra URLHandler
+        url_handler = URLHandler()
+        touch_urls = url_handler.get_urls_for_company(company)
+        print(f"URL-er for {company}: {touch_urls}")
 
-    # 2) Last ned PDF-ene (om nødvendig)
-    download_pdfs_urls(company, touch_urls)
+        # 2) Last ned PDF-ene (om nødvendig)
+        download_pdfs_urls(company, touch_urls)
 
-    # 3) Kjør analyse for hver ulest PDF individuelt
-    run_analysis_for_company(company)
+    # 3) Kjør analyse for hver ulest PDF
+    if args.batch:
+        run_batch_for_companies(args.companies, args.batch,
+                                wait=not args.no_wait, poll_interval=args.poll_interval,
+                                resubmit_failed=args.resubmit_failed)
+    else:
+        scheduler = None
+        if args.budget_usd is not None or args.budget_tokens is not None:
+            scheduler = BudgetScheduler(max_cost=args.budget_usd, max_tokens=args.budget_tokens)
+        for company in args.companies:
+            run_analysis_for_company(company, workers=args.workers, route=args.route, scheduler=scheduler,
+                                     pack=args.pack, prefilter_tokens=args.prefilter, normalize=args.normalize)
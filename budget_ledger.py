@@ -0,0 +1,373 @@
+"""
+Felles rate-limit- og budsjettregnskap for alle AI_KPI-prosesser på maskinen.
+
+Hver prosess (f.eks. én per selskapsgruppe) har sin egen RateLimiter, men
+kvoten hos provideren er felles. Denne ledgeren ligger i en SQLite-fil og
+trekkes fra før hvert LLM-kall, uansett prosess:
+
+- globale forespørsler og tokens per minutt (glidende 60-sekundersvindu);
+  grensene starter på Settings().llm_rate_limits og oppdateres fra
+  x-ratelimit-limit-*-headerne providerne sender, felles for alle prosesser
+- daglig tak på estimert kostnad i USD
+- rettferdig fordeling: hver aktive worker får høyst sin andel av
+  minuttkvoten, så én prosess ikke sulter ut de andre
+- forbruk per kall (tokens og kostnad), merket med selskap, PDF, modell og
+  steg i pipelinen, så man kan se hva hvert selskap/dokument koster
+
+SQLite sin BEGIN IMMEDIATE gir en skrivelås på tvers av prosesser, så
+sjekk-og-trekk skjer atomisk.
+"""
+import os
+import time
+import socket
+import sqlite3
+import asyncio
+import threading
+from datetime import date
+from contextlib import contextmanager
+from contextvars import ContextVar
+from settings import Settings
+from rate_limiter import FALLBACK_LIMITS, limit_headers
+
+# USD per million tokens (input, output); brukes til å estimere kostnad
+PRICES_PER_MTOK = {
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "gpt-4": (30.00, 60.00),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "deepseek-chat": (0.27, 1.10),
+    "deepseek-reasoner": (0.55, 2.19),
+}
+DEFAULT_PRICE = (2.50, 10.00)
+BATCH_DISCOUNT = 0.5  # batch-endepunktet koster halvparten av vanlige kall
+
+WINDOW = 60.0  # sekunder
+WORKER_TIMEOUT = 60.0  # en worker regnes som aktiv så lenge den har spurt siste minutt
+MAX_POLL = 2.0  # sjekk igjen minst så ofte; korreksjoner fra andre kall kan frigjøre kvote tidligere
+
+
+# Etiketter (company, document, stage, run, ...) som følger med hvert kall i forbruksregnskapet
+_usage_labels = ContextVar("usage_labels", default={})
+LABELS = ("company", "document", "stage", "run")
+
+
+@contextmanager
+def usage_labels(**labels):
+    """
+    Merker alle LLM-kall i blokken, f.eks. with usage_labels(company="X", document="a.pdf").
+    Nøstede blokker arver og overstyrer. Følger med inn i asyncio-oppgaver, men ikke
+    inn i tråder i en ThreadPoolExecutor; send current_labels() videre dit.
+    """
+    token = _usage_labels.set({**_usage_labels.get(), **labels})
+    try:
+        yield
+    finally:
+        _usage_labels.reset(token)
+
+
+def current_labels() -> dict:
+    return dict(_usage_labels.get())
+
+
+class BudgetExceeded(RuntimeError):
+    """Dagens kostnadstak er nådd; ingen flere kall før i morgen (eller høyere tak)."""
+
+
+def model_price(model_name: str) -> tuple:
+    """(input, output) USD per million tokens; prefiks-treff dekker daterte varianter."""
+    if model_name in PRICES_PER_MTOK:
+        return PRICES_PER_MTOK[model_name]
+    for name in sorted(PRICES_PER_MTOK, key=len, reverse=True):
+        if model_name.startswith(name):
+            return PRICES_PER_MTOK[name]
+    return DEFAULT_PRICE
+
+
+def estimate_cost(model_name: str, prompt_tokens: int, completion_tokens: int = 0) -> float:
+    """Estimert kostnad i USD for ett kall."""
+    price_in, price_out = model_price(model_name)
+    return (prompt_tokens * price_in + completion_tokens * price_out) / 1_000_000
+
+
+class BudgetLedger:
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, db_path: str, daily_spend_cap: float | None = None, limits: dict | None = None,
+                 worker_id: str | None = None):
+        """
+        :param db_path: SQLite-fil som deles av alle prosesser
+        :param daily_spend_cap: Maks estimert kostnad (USD) per dag, None = uten tak
+        :param limits: {provider: (rpm, tpm)} til headerne sier noe annet, standard Settings().llm_rate_limits
+        :param worker_id: Navn på denne prosessen i regnskapet, standard host:pid
+        """
+        self.db_path = db_path
+        self.daily_spend_cap = daily_spend_cap
+        self.limits = limits or Settings().llm_rate_limits
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self._local = threading.local()
+        self._observed = {}  # sist lagrede grenser fra headere, så vi bare skriver ved endring
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS usage (
+                    ts REAL, provider TEXT, worker TEXT, requests INTEGER, tokens INTEGER
+                );
+                CREATE INDEX IF NOT EXISTS usage_ts ON usage (provider, ts);
+                CREATE TABLE IF NOT EXISTS spend (
+                    day TEXT PRIMARY KEY, cost REAL
+                );
+                CREATE TABLE IF NOT EXISTS workers (
+                    provider TEXT, worker TEXT, last_seen REAL, PRIMARY KEY (provider, worker)
+                );
+                CREATE TABLE IF NOT EXISTS calls (
+                    ts REAL, run TEXT, company TEXT, document TEXT, stage TEXT, provider TEXT,
+                    model TEXT, prompt_tokens INTEGER, completion_tokens INTEGER, cost REAL,
+                    estimated INTEGER
+                );
+                CREATE INDEX IF NOT EXISTS calls_run ON calls (run);
+                CREATE TABLE IF NOT EXISTS limits (
+                    provider TEXT PRIMARY KEY, rpm REAL, tpm REAL, updated REAL
+                );
+            """)
+
+    @classmethod
+    def default(cls) -> "BudgetLedger":
+        """Den delte ledgeren konfigurert i Settings."""
+        with cls._default_lock:
+            if cls._default is None:
+                settings = Settings()
+                cls._default = cls(settings.budget_ledger_db, settings.daily_spend_cap)
+            return cls._default
+
+    def _connect(self) -> sqlite3.Connection:
+        # Én tilkobling per tråd; sqlite3-tilkoblinger kan ikke deles mellom tråder
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _limits(self, conn: sqlite3.Connection, provider: str) -> tuple:
+        """(RPM, TPM) for 'provider': det headerne har meldt, ellers de konfigurerte grensene."""
+        rpm, tpm = self.limits.get(provider, FALLBACK_LIMITS)
+        row = conn.execute("SELECT rpm, tpm FROM limits WHERE provider = ?", (provider,)).fetchone()
+        if row:
+            rpm, tpm = row[0] or rpm, row[1] or tpm
+        return rpm, tpm
+
+    def update_limits(self, provider: str, rpm: float | None = None, tpm: float | None = None) -> None:
+        """Lagrer providerens faktiske grenser, så alle prosesser bruker dem fra neste kall."""
+        known = self._observed.get(provider, (None, None))
+        rpm, tpm = rpm or known[0], tpm or known[1]
+        if (rpm, tpm) == known:
+            return
+        self._connect().execute(
+            "INSERT INTO limits (provider, rpm, tpm, updated) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(provider) DO UPDATE SET rpm = COALESCE(excluded.rpm, rpm), "
+            "tpm = COALESCE(excluded.tpm, tpm), updated = excluded.updated",
+            (provider, rpm, tpm, time.time()),
+        )
+        self._observed[provider] = (rpm, tpm)
+
+    def update_from_headers(self, provider: str, headers) -> None:
+        """Mater grensene med x-ratelimit-limit-*-headere (hvis provideren sender dem)."""
+        values = limit_headers(headers)
+        if "limit-requests" in values or "limit-tokens" in values:
+            self.update_limits(provider, values.get("limit-requests"), values.get("limit-tokens"))
+
+    def try_acquire(self, provider: str, tokens: int, est_cost: float = 0.0) -> float:
+        """
+        Forsøker å trekke én forespørsel og 'tokens' tokens fra felleskvoten.
+        Returnerer 0 hvis trukket, ellers sekunder å vente før neste forsøk.
+        Et kall større enn hele TPM-kvoten slipper gjennom når vinduet er tomt,
+        og føres med hele sitt forbruk.
+        Kaster BudgetExceeded hvis dagens kostnadstak ville blitt passert.
+        """
+        now = time.time()
+        today = date.today().isoformat()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rpm, tpm = self._limits(conn, provider)
+            if self.daily_spend_cap is not None:
+                row = conn.execute("SELECT cost FROM spend WHERE day = ?", (today,)).fetchone()
+                spent = row[0] if row else 0.0
+                if spent + est_cost > self.daily_spend_cap:
+                    raise BudgetExceeded(
+                        f"Dagens kostnadstak på ${self.daily_spend_cap:.2f} er nådd (brukt ${spent:.2f})."
+                    )
+
+            conn.execute("DELETE FROM usage WHERE ts < ?", (now - WINDOW,))
+            conn.execute(
+                "INSERT OR REPLACE INTO workers (provider, worker, last_seen) VALUES (?, ?, ?)",
+                (provider, self.worker_id, now),
+            )
+            active = conn.execute(
+                "SELECT COUNT(*) FROM workers WHERE provider = ? AND last_seen >= ?",
+                (provider, now - WORKER_TIMEOUT),
+            ).fetchone()[0]
+            used_req, used_tok = conn.execute(
+                "SELECT COALESCE(SUM(requests), 0), COALESCE(SUM(tokens), 0) FROM usage WHERE provider = ?",
+                (provider,),
+            ).fetchone()
+            mine_req, mine_tok = conn.execute(
+                "SELECT COALESCE(SUM(requests), 0), COALESCE(SUM(tokens), 0) FROM usage "
+                "WHERE provider = ? AND worker = ?",
+                (provider, self.worker_id),
+            ).fetchone()
+
+            fits_global = used_req + 1 <= rpm and (used_tok + tokens <= tpm or used_tok <= 0)
+            # Rettferdig andel; en worker får alltid minst én forespørsel per vindu
+            share_req = max(1.0, rpm / active)
+            share_tok = max(tokens, tpm / active)
+            fits_share = mine_req + 1 <= share_req and mine_tok + tokens <= share_tok
+
+            if fits_global and fits_share:
+                conn.execute(
+                    "INSERT INTO usage (ts, provider, worker, requests, tokens) VALUES (?, ?, ?, 1, ?)",
+                    (now, provider, self.worker_id, tokens),
+                )
+                if est_cost:
+                    self._add_spend(conn, today, est_cost)
+                conn.execute("COMMIT")
+                return 0.0
+
+            # Vent til nok av de eldste postene (alles, eller bare våre) har gledet ut av vinduet
+            if not fits_global:
+                rows = conn.execute(
+                    "SELECT ts, requests, tokens FROM usage WHERE provider = ? ORDER BY ts", (provider,)
+                ).fetchall()
+                over_req, over_tok = used_req + 1 - rpm, used_tok + min(tokens, tpm) - tpm
+            else:
+                rows = conn.execute(
+                    "SELECT ts, requests, tokens FROM usage WHERE provider = ? AND worker = ? ORDER BY ts",
+                    (provider, self.worker_id),
+                ).fetchall()
+                over_req, over_tok = mine_req + 1 - share_req, mine_tok + tokens - share_tok
+            conn.execute("COMMIT")
+            return min(MAX_POLL, max(0.05, self._time_until_freed(rows, over_req, over_tok, now)))
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _time_until_freed(rows: list, over_req: float, over_tok: float, now: float) -> float:
+        """Sekunder til de eldste postene i 'rows' har frigjort minst over_req/over_tok."""
+        freed_req = freed_tok = 0
+        for ts, req, tok in rows:
+            freed_req += req
+            freed_tok += tok
+            if freed_req >= over_req and freed_tok >= over_tok:
+                return ts + WINDOW - now
+        return WINDOW
+
+    @staticmethod
+    def _add_spend(conn, day: str, cost: float) -> None:
+        conn.execute(
+            "INSERT INTO spend (day, cost) VALUES (?, ?) "
+            "ON CONFLICT(day) DO UPDATE SET cost = cost + excluded.cost",
+            (day, cost),
+        )
+
+    def acquire(self, provider: str, tokens: int, est_cost: float = 0.0) -> None:
+        """Blokkerer til kvoten tillater kallet."""
+        while True:
+            wait = self.try_acquire(provider, tokens, est_cost)
+            if wait == 0:
+                return
+            time.sleep(wait)
+
+    async def aacquire(self, provider: str, tokens: int, est_cost: float = 0.0) -> None:
+        """
+        Som acquire(), men venter med asyncio.sleep. SQLite-skrivingen (som kan vente
+        på låsen til andre prosesser) kjøres i en tråd, så event-loopen ikke blokkeres.
+        """
+        while True:
+            wait = await asyncio.to_thread(self.try_acquire, provider, tokens, est_cost)
+            if wait == 0:
+                return
+            await asyncio.sleep(wait)
+
+    def record(self, provider: str, estimated_tokens: int, actual_tokens: int | None,
+               estimated_cost: float = 0.0, actual_cost: float | None = None) -> None:
+        """Korrigerer regnskapet med faktisk forbruk fra svarets 'usage'-blokk."""
+        token_diff = (actual_tokens - estimated_tokens) if actual_tokens is not None else 0
+        cost_diff = (actual_cost - estimated_cost) if actual_cost is not None else 0.0
+        if not token_diff and not cost_diff:
+            return
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if token_diff:
+                conn.execute(
+                    "INSERT INTO usage (ts, provider, worker, requests, tokens) VALUES (?, ?, ?, 0, ?)",
+                    (time.time(), provider, self.worker_id, token_diff),
+                )
+            if cost_diff:
+                self._add_spend(conn, date.today().isoformat(), cost_diff)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def record_call(self, provider: str, model: str, prompt_tokens: int, completion_tokens: int,
+                    cost: float, estimated: bool = False) -> None:
+        """
+        Fører ett kall i forbruksregnskapet, merket med etikettene fra usage_labels().
+        'estimated' er True når provideren ikke sendte usage (f.eks. avbrutt strømming).
+        """
+        labels = current_labels()
+        self._connect().execute(
+            "INSERT INTO calls (ts, run, company, document, stage, provider, model, "
+            "prompt_tokens, completion_tokens, cost, estimated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (time.time(), labels.get("run"), labels.get("company"), labels.get("document"),
+             labels.get("stage", "single"), provider, model, prompt_tokens, completion_tokens, cost,
+             int(estimated)),
+        )
+
+    def usage_summary(self, group_by: str = "company", **filters) -> list[dict]:
+        """
+        Summerer forbruket gruppert på 'group_by' (company, document, stage, run eller model).
+        'filters' begrenser utvalget, f.eks. usage_summary("document", company="Svedberg").
+        """
+        columns = LABELS + ("model", "provider")
+        if group_by not in columns:
+            raise ValueError(f"Kan ikke gruppere på '{group_by}'; velg en av {columns}.")
+        unknown = set(filters) - set(columns)
+        if unknown:
+            raise ValueError(f"Ukjente filtre: {sorted(unknown)}")
+        where = " AND ".join(f"{name} = ?" for name in filters) or "1"
+        rows = self._connect().execute(
+            f"SELECT {group_by}, COUNT(*), SUM(prompt_tokens), SUM(completion_tokens), SUM(cost) "
+            f"FROM calls WHERE {where} GROUP BY {group_by} ORDER BY SUM(cost) DESC",
+            tuple(filters.values()),
+        ).fetchall()
+        return [
+            {group_by: key, "calls": calls, "prompt_tokens": prompt or 0,
+             "completion_tokens": completion or 0, "cost": cost or 0.0}
+            for key, calls, prompt, completion, cost in rows
+        ]
+
+    def usage_totals(self, **filters) -> tuple[int, float]:
+        """(tokens, kostnad) totalt for kall som matcher 'filters', f.eks. run="..."."""
+        unknown = set(filters) - set(LABELS + ("model", "provider"))
+        if unknown:
+            raise ValueError(f"Ukjente filtre: {sorted(unknown)}")
+        where = " AND ".join(f"{name} = ?" for name in filters) or "1"
+        tokens, cost = self._connect().execute(
+            f"SELECT COALESCE(SUM(prompt_tokens + completion_tokens), 0), COALESCE(SUM(cost), 0) "
+            f"FROM calls WHERE {where}",
+            tuple(filters.values()),
+        ).fetchone()
+        return tokens, cost
+
+    def spent_today(self) -> float:
+        row = self._connect().execute(
+            "SELECT cost FROM spend WHERE day = ?", (date.today().isoformat(),)
+        ).fetchone()
+        return row[0] if row else 0.0
@@ -0,0 +1,82 @@
+"""
+Budsjettstyrt kø: billigste dokumenter først, stopp rent når budsjettet er brukt.
+
+Hvert dokument får et estimat (tokens og USD) før det sendes. Før et dokument
+startes sjekkes faktisk forbruk så langt i kjøringen (fra forbruksregnskapet i
+BudgetLedger, merket med kjøringens run-ID) pluss estimatene for dokumenter som
+er underveis. Får ikke dokumentet plass, hoppes det over og blir stående som
+ulest til neste kjøring.
+"""
+import uuid
+import threading
+from budget_ledger import BudgetLedger, estimate_cost
+from llm_model import EXPECTED_COMPLETION_TOKENS
+from token_budget import count_tokens
+
+
+class BudgetScheduler:
+    def __init__(self, max_cost: float | None = None, max_tokens: int | None = None,
+                 ledger: BudgetLedger | None = None, run_id: str | None = None):
+        """
+        :param max_cost: Maks USD for denne kjøringen (None = uten grense)
+        :param max_tokens: Maks tokens (input + output) for denne kjøringen (None = uten grense)
+        :param ledger: Forbruksregnskapet, standard BudgetLedger.default()
+        :param run_id: Etikett kallene føres under (usage_labels(run=...)); ny hvis None
+        """
+        self.max_cost = max_cost
+        self.max_tokens = max_tokens
+        self.ledger = ledger or BudgetLedger.default()
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self._lock = threading.Lock()
+        self._in_flight = {}  # nøkkel -> (tokens, kostnad)
+        self.skipped = []
+
+    @staticmethod
+    def estimate(model_name: str, instructions: str, text: str) -> tuple[int, float]:
+        """(tokens, USD) for å sende 'text' med 'instructions' i ett kall til 'model_name'."""
+        prompt = count_tokens(instructions, model_name) + count_tokens(text, model_name)
+        return (prompt + EXPECTED_COMPLETION_TOKENS,
+                estimate_cost(model_name, prompt, EXPECTED_COMPLETION_TOKENS))
+
+    @staticmethod
+    def order(items: list[dict]) -> list[dict]:
+        """Sorterer [{"key", "tokens", "cost", ...}] med billigste først."""
+        return sorted(items, key=lambda item: (item["cost"], item["tokens"]))
+
+    def spent(self) -> tuple[int, float]:
+        """Faktisk forbruk (tokens, USD) i denne kjøringen så langt."""
+        return self.ledger.usage_totals(run=self.run_id)
+
+    def try_start(self, key: str, tokens: int, cost: float) -> bool:
+        """Reserverer plass til dokumentet 'key'; False (og husket som hoppet over) hvis budsjettet ikke holder."""
+        with self._lock:
+            spent_tokens, spent_cost = self.spent()
+            pending_tokens = sum(t for t, _ in self._in_flight.values())
+            pending_cost = sum(c for _, c in self._in_flight.values())
+            if self.max_cost is not None and spent_cost + pending_cost + cost > self.max_cost:
+                self.skipped.append(key)
+                return False
+            if self.max_tokens is not None and spent_tokens + pending_tokens + tokens > self.max_tokens:
+                self.skipped.append(key)
+                return False
+            self._in_flight[key] = (tokens, cost)
+            return True
+
+    def finish(self, key: str) -> None:
+        """Dokumentet er ferdig (eller feilet); estimatet erstattes av faktisk forbruk i regnskapet."""
+        with self._lock:
+            self._in_flight.pop(key, None)
+
+    def report(self) -> str:
+        tokens, cost = self.spent()
+        limits = []
+        if self.max_cost is not None:
+            limits.append(f"${self.max_cost:.2f}")
+        if self.max_tokens is not None:
+            limits.append(f"{self.max_tokens} tokens")
+        text = f"Kjøring {self.run_id}: brukt {tokens} tokens / ${cost:.4f}"
+        if limits:
+            text += f" av budsjett {' / '.join(limits)}"
+        if self.skipped:
+            text += f"; {len(self.skipped)} dokument(er) hoppet over (budsjett)"
+        return text
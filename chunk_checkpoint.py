@@ -0,0 +1,66 @@
+import os
+import json
+import hashlib
+import threading
+from settings import Settings
+
+
+class ChunkCheckpoint:
+    """
+    Mellomresultater for chunket behandling av ett dokument, lagret på disk.
+
+    Nøkkelen er en hash av dokumentteksten sammen med modell, instruksjoner,
+    strategi og chunk-størrelse, så en ny kjøring av samme dokument med samme
+    oppsett finner igjen det som allerede er gjort (f.eks. etter en krasj eller
+    Ctrl-C på chunk 17 av 20) og bare betaler for resten.
+
+    Hvert mellomresultat lagres under et navn ("rolling", "map-3", "merge-1-0", ...).
+    Filen skrives atomisk etter hver oppdatering, og slettes når dokumentet er ferdig.
+    """
+
+    def __init__(self, key: str, directory: str | None = None):
+        self.key = key
+        self.directory = directory or Settings().checkpoint_dir
+        self.path = os.path.join(self.directory, f"{key}.json")
+        self._lock = threading.Lock()
+        self._data = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._data = json.load(f)
+            except json.JSONDecodeError:
+                self._data = {}
+
+    @classmethod
+    def for_document(cls, model_name: str, instructions: str, strategy: str,
+                     chunk_size: int, text: str, directory: str | None = None) -> "ChunkCheckpoint":
+        h = hashlib.sha256()
+        for part in (model_name, instructions, strategy, str(chunk_size), text):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+        return cls(h.hexdigest(), directory)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, name: str):
+        with self._lock:
+            return self._data.get(name)
+
+    def put(self, name: str, value) -> None:
+        with self._lock:
+            self._data[name] = value
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+    def clear(self) -> None:
+        """Sletter sjekkpunktet når dokumentet er ferdig behandlet."""
+        with self._lock:
+            self._data = {}
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
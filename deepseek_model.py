@@ -1,10 +1,31 @@
 import os
+import time
+import asyncio
 import requests
 import json
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
 from llm_model import LLMModel
+from llm_registry import LLMRegistry
+from stream_json import IncrementalJSONParser
+
+# Nettverksfeil i arun() som gir et feil-JSON-svar (som RequestException i run())
+_ASYNC_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError) if aiohttp is not None else (asyncio.TimeoutError,)
 
 class DeepSeekModel(LLMModel):
-    def __init__(self, instructions: str, model_name: str = "deepseek-chat"):
+    provider = "deepseek"
+    max_retries = 8
+    initial_wait = 2.0  # sekunder, basis for backoff ved 429
+    timeout = 120  # sekunder for et helt, ikke-strømmet svar
+    stream_timeout = (10, 60)  # (tilkobling, maks pause mellom biter) ved strømming
+    # OpenAI-kompatibel endpoint; kan pekes mot en lokal testserver (mock_llm_server.py)
+    api_url = "https://api.deepseek.com/v1/chat/completions"
+
+    def __init__(self, instructions: str, model_name: str = "deepseek-chat", use_cache: bool = True,
+                 json_mode: bool = False):
         """
         Oppsett for DeepSeek API, kompatibelt med OpenAI API.
         - Henter API-nøkkel fra `secrets.txt` (DeepSeek_Key=API_NØKKEL).
@@ -12,49 +33,183 @@ class DeepSeekModel(LLMModel):
         
         :param instructions: Systemprompt (rolle for AI-en)
         :param model_name: Modellnavn (f.eks. "deepseek-chat", "deepseek-reasoner")
+        :param use_cache: Bruk den delte svar-cachen (LLMCache)
+        :param json_mode: Be om et gyldig JSON-objekt (response_format=json_object)
         """
-        super().__init__(instructions, model_name)
+        super().__init__(instructions, model_name, use_cache, json_mode)
         
-        # Hent API-nøkkel fra secrets.txt
-        self.api_key = None
-        try:
-            with open("secrets.txt", "r", encoding="utf-8") as f:
-                for line in f:
-                    if line.startswith("DeepSeek_Key="):
-                        self.api_key = line.split("=", 1)[1].strip()
-                        break
-        except FileNotFoundError:
-            raise ValueError("Filen `secrets.txt` mangler. Opprett den og legg inn `DeepSeek_Key=DIN_API_NØKKEL`.")
-
+        # API-nøkkel og HTTP-session fra det delte registeret: secrets.txt leses
+        # én gang per prosess, og alle instanser deler én keep-alive-pool.
+        registry = LLMRegistry()
+        self.api_key = registry.get_secret("DeepSeek_Key")
         if not self.api_key:
             raise ValueError("DeepSeek API-nøkkel ikke funnet i `secrets.txt`. Sørg for at den inneholder `DeepSeek_Key=DIN_API_NØKKEL`.")
+        self.session = registry.get_session(self.provider)
 
-        self.api_url = "https://api.deepseek.com/v1/chat/completions"  # OpenAI-kompatibel endpoint
-
-    def run(self, text: str) -> str:
+    def _post(self, payload: dict, reservation: dict, stream: bool = False) -> requests.Response:
         """
-        Kalles fra main med en brukertekst, returnerer AI-generert svar.
-
-        :param text: Brukerinput
-        :return: Modellens svar i JSON-format
-        """
-        payload = {
-            "model": self.model_name,
-            "messages": [
-                {"role": "system", "content": self.instructions},  # Instruksjoner til AI-en
-                {"role": "user", "content": text}  # Brukerens melding
-            ],
-            "stream": False  # Kan settes til True for strømming
+        POST mot chat/completions med delt rate limiting og nye forsøk ved 429.
+        'reservation' kommer fra self._reserve() og trekkes fra ledger og limiter før hvert forsøk.
+        Kaster requests.exceptions.RequestException hvis kallet feiler.
+        """
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
         }
+        # Strømming: kort tilkoblings-timeout, men lang nok lese-timeout mellom bitene
+        timeout = self.stream_timeout if stream else self.timeout
+        for attempt in range(self.max_retries):
+            # Felles kvote for alle prosesser, deretter denne prosessens RPM/TPM-begrensning
+            self._wait_for_capacity(reservation)
+            response = self.session.post(self.api_url, json=payload, headers=headers,
+                                     timeout=timeout, stream=stream)
+            if response.status_code == 429 and attempt < self.max_retries - 1:
+                hint = self._on_rate_limited(response.headers)
+                wait_time = self.rate_limiter.backoff(attempt, self.initial_wait, hint)
+                print(f"DeepSeek 429 (rate limit). Venter {wait_time:.1f} sekunder før nytt forsøk...")
+                response.close()
+                time.sleep(wait_time)
+                continue
+            response.raise_for_status()  # Kaster feil hvis API-kallet feiler
+            self._update_limits(response.headers)
+            return response
+
+    def _payload(self, messages: list[dict], stream: bool) -> dict:
+        payload = {"model": self.model_name, "messages": messages, "stream": stream}
+        if self.json_mode:
+            payload["response_format"] = {"type": "json_object"}
+        return payload
 
+    def _complete(self, messages: list[dict]) -> dict:
+        """Ett vanlig (ikke-strømmet) kall; returnerer hele svar-JSON-en."""
+        reservation = self._reserve(messages)
+        response = self._post(self._payload(messages, stream=False), reservation)
+        data = response.json()
+        self._settle(reservation, data.get("usage"))
+        return data
+
+    async def _acomplete(self, messages: list[dict]) -> dict:
+        """Async variant av _complete() over den delte aiohttp-sessionen."""
+        if aiohttp is None:
+            raise ImportError("aiohttp må være installert for DeepSeekModel.arun (pip install aiohttp).")
+        session = LLMRegistry().get_async_session(self.provider)
+        payload = self._payload(messages, stream=False)
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
+        reservation = self._reserve(messages)
+        for attempt in range(self.max_retries):
+            await self._await_capacity(reservation)
+            async with session.post(self.api_url, json=payload, headers=headers,
+                                    timeout=aiohttp.ClientTimeout(total=self.timeout)) as response:
+                if response.status == 429 and attempt < self.max_retries - 1:
+                    hint = self._on_rate_limited(response.headers)
+                    wait_time = self.rate_limiter.backoff(attempt, self.initial_wait, hint)
+                    print(f"DeepSeek 429 (rate limit). Venter {wait_time:.1f} sekunder før nytt forsøk...")
+                    await asyncio.sleep(wait_time)
+                    continue
+                response.raise_for_status()
+                self._update_limits(response.headers)
+                data = await response.json(content_type=None)
+                self._settle(reservation, data.get("usage"))
+                return data
+
+    def _run_streaming(self, messages: list[dict], required_keys=None, on_field=None) -> str:
+        """
+        Strømmer svaret (SSE) og parser JSON-en inkrementelt. 'on_field(nøkkel, verdi)'
+        kalles for hvert toppnivå-felt så snart det er komplett. Når alle
+        'required_keys' er mottatt, lukkes strømmen og feltene returneres som JSON.
+        """
+        parser = IncrementalJSONParser()
 
+        cached = self.cached_response(messages, None)
+        if cached is not None:
+            content = cached["choices"][0]["message"]["content"].strip()
+            for key, value in parser.feed(content):
+                if on_field:
+                    on_field(key, value)
+            return content
+
+        parts = []
+        stopped_early = False
+        usage = None
+        reservation = self._reserve(messages)
+        response = self._post(self._payload(messages, stream=True),
+                              reservation, stream=True)
+        response.encoding = "utf-8"
         try:
-            response = requests.post(self.api_url, json=payload, headers=headers, timeout=10)
-            response.raise_for_status()  # Kaster feil hvis API-kallet feiler
-            return response.json()
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue  # tomme linjer og SSE-kommentarer (keep-alive)
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                event = json.loads(data)
+                usage = event.get("usage") or usage  # kommer i siste bit, hvis provideren sender den
+                choices = event.get("choices") or [{}]
+                delta = (choices[0].get("delta") or {}).get("content") or ""
+                if not delta:
+                    continue
+                parts.append(delta)
+                for key, value in parser.feed(delta):
+                    if on_field:
+                        on_field(key, value)
+                if required_keys and parser.has_all(required_keys):
+                    stopped_early = not parser.done
+                    break
+        finally:
+            response.close()
+            self._settle(reservation, usage, completion_text="".join(parts))
+
+        if stopped_early:
+            print(f"Alle {len(required_keys)} påkrevde felter mottatt, avslutter strømmen tidlig.")
+            return json.dumps(parser.fields, ensure_ascii=False)
+
+        content = "".join(parts).strip()
+        # Kun komplette svar caches, i samme form som et vanlig kall
+        self.store_in_cache(messages, None, {
+            "choices": [{"message": {"role": "assistant", "content": content}}]
+        })
+        return content
+
+    def run(self, text: str, stream: bool = False, required_keys=None, on_field=None) -> str:
+        """
+        Kalles fra main med en brukertekst, returnerer AI-generert svar.
+
+        :param text: Brukerinput
+        :param stream: Strøm svaret (SSE) og parse JSON-en fortløpende
+        :param required_keys: Med stream=True: stopp når disse KPI-nøklene er mottatt
+        :param on_field: Med stream=True: kalles med (nøkkel, verdi) per ferdig felt
+        :return: Modellens svar (tekst, normalt JSON)
+        """
+        messages = [
+            {"role": "system", "content": self.instructions},  # Instruksjoner til AI-en
+            {"role": "user", "content": text}  # Brukerens melding
+        ]
+
+        try:
+            if stream:
+                return self._run_streaming(messages, required_keys, on_field)
+            # Kun vellykkede svar havner i cachen; temperature=None = API-ets standard
+            data = self._cached(messages, None, lambda: self._complete(messages))
+            return data["choices"][0]["message"]["content"].strip()
         except requests.exceptions.RequestException as e:
             return json.dumps({"error": f"DeepSeek API-kall feilet: {str(e)}"})
+
+    async def arun(self, text: str) -> str:
+        """
+        Async variant av run() (uten strømming), for mange samtidige kall fra én event-loop.
+
+        :param text: Brukerinput
+        :return: Modellens svar (tekst, normalt JSON)
+        """
+        messages = [
+            {"role": "system", "content": self.instructions},
+            {"role": "user", "content": text}
+        ]
+        try:
+            data = await self._acached(messages, None, lambda: self._acomplete(messages))
+            return data["choices"][0]["message"]["content"].strip()
+        except _ASYNC_ERRORS as e:
+            return json.dumps({"error": f"DeepSeek API-kall feilet: {str(e)}"})
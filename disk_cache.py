@@ -0,0 +1,135 @@
+import os
+import threading
+from abc import ABC, abstractmethod
+
+
+class DiskLRUCache(ABC):
+    """
+    Felles grunnlag for disk-cachene (LLMCache, PDFTextCache): én fil per nøkkel
+    i 'cache_dir', mtime oppdateres ved treff, og de minst nylig brukte filene
+    fjernes når mappen går over 'max_bytes'.
+
+    Skriving skjer via temp-fil + os.replace, og en fil som ikke kan leses
+    (f.eks. fjernet av en annen prosess midt i lesingen) regnes som bom, så
+    flere tråder og prosesser kan dele samme mappe.
+
+    Total størrelse telles i minnet: mappen skannes én gang ved oppstart, og
+    deretter bare når tellingen går over 'max_bytes'. Skannet gir den faktiske
+    størrelsen, så filer andre prosesser har skrevet i mellomtiden blir med da.
+
+    Subklasser setter SUFFIX, LABEL og READ_ERRORS og implementerer _load,
+    _dump og _from_settings.
+    """
+
+    SUFFIX = ""
+    LABEL = "Cache"
+    READ_ERRORS = (OSError,)
+
+    _default = None
+    _default_lock = threading.Lock()
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._total = sum(size for _, size, _ in self._entries())
+
+    @classmethod
+    def default(cls):
+        """Returnerer den delte cachen konfigurert i Settings (én per prosess)."""
+        with cls._default_lock:
+            if cls._default is None:
+                cls._default = cls._from_settings()
+            return cls._default
+
+    @classmethod
+    @abstractmethod
+    def _from_settings(cls):
+        """Cachen med mappe og størrelse fra Settings (brukes av default())."""
+
+    @abstractmethod
+    def _load(self, path: str):
+        """Leser verdien i 'path'; feil i READ_ERRORS regnes som bom."""
+
+    @abstractmethod
+    def _dump(self, path: str, value) -> None:
+        """Skriver 'value' til 'path' (en temp-fil som put() flytter på plass)."""
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}{self.SUFFIX}")
+
+    def get(self, key: str):
+        """Returnerer lagret verdi, eller None ved bom."""
+        path = self._path(key)
+        try:
+            value = self._load(path)
+            os.utime(path)  # marker som nylig brukt (LRU)
+        except self.READ_ERRORS:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def put(self, key: str, value):
+        """Lagrer 'value' og rydder opp hvis cachen er for stor. Returnerer 'value'."""
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        self._dump(tmp_path, value)
+        size = os.path.getsize(tmp_path)
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = 0
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._total += size - replaced
+            over = self._total > self.max_bytes
+        if over:
+            self._evict()
+        return value
+
+    def _entries(self) -> list:
+        """(mtime, størrelse, sti) for alle filene i cachen."""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith(self.SUFFIX):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _evict(self) -> None:
+        """Fjerner minst nylig brukte filer til cachen er under max_bytes."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        with self._lock:
+            self._total = total
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
+
+    def report(self) -> str:
+        s = self.stats()
+        return f"{self.LABEL}: {s['hits']} treff, {s['misses']} bom ({s['hit_rate']:.0%} treffrate)"
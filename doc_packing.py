@@ -0,0 +1,111 @@
+"""
+Pakking av flere dokumenter fra samme selskap og kvartal i ett LLM-kall.
+
+Et kvartal gir gjerne både rapport, presentasjon og noen ganger en engelsk
+utgave ("Kitron 2024 Q4 Report.pdf", "Kitron 2024 Q4 Presentation.pdf").
+I stedet for å sende hver av dem med hele systemprompten, grupperes de etter
+periode (år + kvartal fra filnavnet) og pakkes til én tekst:
+
+- største dokument først, de andre legges etter
+- linjer som allerede har stått i et tidligere dokument i gruppen fjernes
+  (korte linjer som "MNOK" eller "2024" beholdes, de gir tabellene mening)
+- et dokument der nesten alle tallene allerede finnes i gruppen (typisk en
+  oversettelse) droppes helt
+
+Den pakkede teksten går gjennom den vanlige størrelsesplanleggingen i
+OpenAIModel.run, så gruppen sendes i ett kall når den får plass, ellers i
+så få chunks som mulig. Resultatet er én samlet KPI-post per gruppe.
+"""
+import re
+from collections import defaultdict
+
+
+MIN_DEDUP_CHARS = 40  # kortere linjer dedupliseres ikke
+DUPLICATE_NUMBER_OVERLAP = 0.9  # andel av tallene som må finnes fra før for at et dokument er et duplikat
+MIN_NUMBERS_FOR_DUPLICATE = 20  # dokumenter med færre tall vurderes ikke som duplikater
+
+_YEAR = re.compile(r"(?<!\d)(20\d{2})(?!\d)")
+_QUARTER_PATTERNS = [
+    re.compile(r"(?<![a-z0-9])q([1-4])(?!\d)", re.IGNORECASE),
+    re.compile(r"(?<!\d)([1-4])q(?![a-z])", re.IGNORECASE),
+    re.compile(r"(?<!\d)([1-4])\.?[\s_-]*(?:kvartal|quarter)", re.IGNORECASE),
+]
+_QUARTER_WORDS = {"first": 1, "second": 2, "third": 3, "fourth": 4,
+                  "første": 1, "andre": 2, "tredje": 3, "fjerde": 4}
+_QUARTER_WORD = re.compile(r"(first|second|third|fourth|første|andre|tredje|fjerde)[\s_-]*(?:quarter|kvartal)",
+                           re.IGNORECASE)
+_NUMBER = re.compile(r"\d[\d\s.,]*\d|\d")
+
+
+def document_period(filename: str) -> str | None:
+    """"2024Q4" fra filnavn som "Kitron 2024 Q4 Report.pdf" eller "q4-2024.pdf"; None hvis uklart."""
+    year = _YEAR.search(filename)
+    if not year:
+        return None
+    # Fjern året først, så "2024" ikke leses som kvartal "4Q"
+    rest = filename[:year.start()] + " " + filename[year.end():]
+    for pattern in _QUARTER_PATTERNS:
+        match = pattern.search(rest)
+        if match:
+            return f"{year.group(1)}Q{match.group(1)}"
+    match = _QUARTER_WORD.search(rest)
+    if match:
+        return f"{year.group(1)}Q{_QUARTER_WORDS[match.group(1).lower()]}"
+    return None
+
+
+def group_by_period(filenames: list[str]) -> dict:
+    """
+    {periode: [filnavn]} for filnavn med gjenkjent periode. Filnavn uten periode
+    får hver sin gruppe med filnavnet som nøkkel, og sendes alene som før.
+    """
+    groups = defaultdict(list)
+    for filename in filenames:
+        groups[document_period(filename) or filename].append(filename)
+    return dict(groups)
+
+
+def _normalize(line: str) -> str:
+    return " ".join(line.split()).casefold()
+
+
+def _numbers(text: str) -> set:
+    return {re.sub(r"\s", "", n) for n in _NUMBER.findall(text) if len(n.strip()) >= 3}
+
+
+def pack_documents(texts: dict) -> tuple[str, dict]:
+    """
+    Pakker {filnavn: tekst} til én tekst med kryssdokument-duplikater fjernet.
+    Returnerer (tekst, statistikk) der statistikk har "chars_in", "chars_out",
+    "dropped_lines" og "dropped_documents".
+    """
+    seen_lines = set()
+    seen_numbers = set()
+    parts = []
+    stats = {"chars_in": 0, "chars_out": 0, "dropped_lines": 0, "dropped_documents": []}
+
+    for filename, text in sorted(texts.items(), key=lambda item: -len(item[1])):
+        stats["chars_in"] += len(text)
+        if not text.strip():
+            continue
+        numbers = _numbers(text)
+        if parts and len(numbers) >= MIN_NUMBERS_FOR_DUPLICATE \
+                and len(numbers & seen_numbers) / len(numbers) >= DUPLICATE_NUMBER_OVERLAP:
+            stats["dropped_documents"].append(filename)
+            continue
+
+        kept = []
+        for line in text.splitlines():
+            key = _normalize(line)
+            if len(key) >= MIN_DEDUP_CHARS:
+                if key in seen_lines:
+                    stats["dropped_lines"] += 1
+                    continue
+                seen_lines.add(key)
+            kept.append(line)
+        seen_numbers |= numbers
+        parts.append(f"\n--- Innhold fra {filename} ---\n" + "\n".join(kept))
+
+    packed = "".join(parts)
+    stats["chars_out"] = len(packed)
+    return packed, stats
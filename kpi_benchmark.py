@@ -0,0 +1,259 @@
+"""
+Benchmark av KPI-uthenting: treffsikkerhet mot kostnad og latens.
+
+Gullsettet ligger i Settings().gold_dir: for hvert dokument en PDF (eller
+ferdig uthentet .txt) og en .json med håndverifiserte KPI-er med samme navn.
+Hver konfigurasjon (modell, strategi, chunk-størrelse) kjøres på alle
+dokumentene, og rapporten viser per konfigurasjon:
+
+- andel riktige felter (tall med relativ toleranse, tekst normalisert)
+- tokens, kall og estimert kostnad (fra forbruksregnskapet i BudgetLedger)
+- veggklokketid
+
+Svarene går via den vanlige svar-cachen, så en ny kjøring av samme
+konfigurasjon er gratis. Da gjenbrukes tokens/kall/tid fra forrige måling
+(Settings().benchmark_results), mens treffsikkerheten regnes ut på nytt.
+Finnes det ingen lagret måling, kjøres første runde utenom svar-cachen, så en
+cache som er varm fra produksjon ikke måles som gratis og øyeblikkelig.
+Konfigurasjoner som likevel ikke ble målt, anbefales ikke.
+
+    python kpi_benchmark.py --config gpt-4o-mini:single --config gpt-4o:map_reduce:4000 \\
+        --config deepseek-chat:single --min-accuracy 0.9
+"""
+import os
+import json
+import time
+import uuid
+import hashlib
+import argparse
+from settings import Settings
+from llm_registry import LLMRegistry
+from openai_model import OpenAIModel
+from deepseek_model import DeepSeekModel
+from pdf_handler import PDFHandler
+from budget_ledger import BudgetLedger, usage_labels
+from kpi_schema import parse_response, to_number
+
+
+STRATEGIES = ("single", "rolling", "map_reduce")
+REL_TOLERANCE = 0.01  # tall regnes som riktige innenfor 1 %
+MAX_SCORED_TEXT = 200  # lengre tekstfelter (f.eks. oppsummeringer) scores ikke
+
+
+def parse_config(spec: str) -> dict:
+    """'modell:strategi[:chunk_size]' -> {"model", "strategy", "chunk_size"}."""
+    parts = spec.split(":")
+    if len(parts) not in (2, 3) or parts[1] not in STRATEGIES:
+        raise ValueError(f"Ugyldig konfigurasjon {spec!r}; bruk modell:{'|'.join(STRATEGIES)}[:chunk_size]")
+    if parts[1] != "single" and parts[0].startswith("deepseek"):
+        raise ValueError(f"Chunking er bare støttet for OpenAI-modeller ({spec!r}).")
+    return {
+        "model": parts[0],
+        "strategy": parts[1],
+        "chunk_size": int(parts[2]) if len(parts) == 3 else None,
+    }
+
+
+def config_name(config: dict) -> str:
+    name = f"{config['model']}:{config['strategy']}"
+    return f"{name}:{config['chunk_size']}" if config["chunk_size"] else name
+
+
+def _normalize_text(value) -> str:
+    return " ".join(str(value).split()).casefold()
+
+
+def score_fields(predicted: dict, gold: dict, rel_tol: float = REL_TOLERANCE) -> dict:
+    """
+    {felt: True/False} for hvert felt i 'gold' som scores.
+    null i gullsettet betyr at KPI-en ikke står i rapporten, og krever null (eller manglende felt).
+    """
+    scores = {}
+    for key, expected in gold.items():
+        actual = predicted.get(key)
+        if expected is None:
+            scores[key] = actual is None
+        elif isinstance(expected, bool) or isinstance(expected, (list, dict)):
+            scores[key] = actual == expected
+        elif isinstance(expected, (int, float)):
+            number = to_number(actual) if actual is not None else None
+            scores[key] = number is not None and abs(number - expected) <= rel_tol * max(abs(expected), 1e-9)
+        elif isinstance(expected, str) and len(expected) > MAX_SCORED_TEXT:
+            continue
+        else:
+            scores[key] = actual is not None and _normalize_text(actual) == _normalize_text(expected)
+    return scores
+
+
+def load_gold_set(gold_dir: str) -> list[dict]:
+    """[{"name", "text", "gold"}] for alle dokumenter i 'gold_dir' som har både tekst og fasit."""
+    docs = []
+    for filename in sorted(os.listdir(gold_dir)):
+        name, ext = os.path.splitext(filename)
+        if ext != ".json" or name.startswith("."):
+            continue
+        txt_path = os.path.join(gold_dir, f"{name}.txt")
+        pdf_path = os.path.join(gold_dir, f"{name}.pdf")
+        if os.path.exists(txt_path):
+            with open(txt_path, "r", encoding="utf-8") as f:
+                text = f.read()
+        elif os.path.exists(pdf_path):
+            text = PDFHandler("gold").extract_text_from_pdf(pdf_path)
+        else:
+            print(f"Fasit '{filename}' mangler {name}.pdf/.txt; hoppes over.")
+            continue
+        with open(os.path.join(gold_dir, filename), "r", encoding="utf-8") as f:
+            docs.append({"name": name, "text": text, "gold": json.load(f)})
+    return docs
+
+
+class KPIBenchmark:
+    def __init__(self, instructions: str, docs: list[dict], results_path: str | None = None,
+                 ledger: BudgetLedger | None = None):
+        """
+        :param instructions: Systemprompten som brukes i produksjon
+        :param docs: Gullsettet, se load_gold_set()
+        :param results_path: JSON-fil med tidligere målinger (for gratis replay)
+        """
+        self.instructions = instructions
+        self.docs = docs
+        self.results_path = results_path or Settings().benchmark_results
+        self.ledger = ledger or BudgetLedger.default()
+        self.measurements = {}
+        if os.path.exists(self.results_path):
+            with open(self.results_path, "r", encoding="utf-8") as f:
+                self.measurements = json.load(f)
+
+    def _save_measurements(self) -> None:
+        os.makedirs(os.path.dirname(self.results_path) or ".", exist_ok=True)
+        tmp_path = self.results_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.measurements, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.results_path)
+
+    def model_for(self, config: dict, use_cache: bool = True):
+        model_cls = DeepSeekModel if config["model"].startswith("deepseek") else OpenAIModel
+        return LLMRegistry().get_model(model_cls, self.instructions, config["model"], json_mode=True,
+                                       use_cache=use_cache)
+
+    @staticmethod
+    def run_config(model, config: dict, text: str) -> str:
+        if config["strategy"] == "single":
+            return model.run(text)
+        return model.run(text, split_into_parts=True, chunk_size=config["chunk_size"],
+                         strategy=config["strategy"])
+
+    def _measure(self, config: dict, doc: dict) -> dict:
+        """
+        Kjører én konfigurasjon på ett dokument; gjenbruker forrige måling ved full cache-replay.
+        Uten lagret måling går kallene utenom svar-cachen, så de faktisk blir målt.
+        """
+        key = "|".join([config_name(config), doc["name"],
+                        hashlib.sha256((self.instructions + doc["text"]).encode("utf-8")).hexdigest()[:16]])
+        stored = key in self.measurements
+        run_id = f"bench-{uuid.uuid4().hex[:12]}"
+        start = time.perf_counter()
+        with usage_labels(run=run_id, company="benchmark", document=doc["name"]):
+            raw = self.run_config(self.model_for(config, use_cache=stored), config, doc["text"])
+        wall = time.perf_counter() - start
+        rows = self.ledger.usage_summary("run", run=run_id)
+        calls = rows[0]["calls"] if rows else 0
+        tokens, cost = self.ledger.usage_totals(run=run_id)
+
+        measurement = {"tokens": tokens, "calls": calls, "cost": cost, "wall": wall, "replayed": False,
+                       "unmeasured": False}
+        if calls == 0 and stored:
+            measurement = dict(self.measurements[key], replayed=True, unmeasured=False)
+        elif calls > 0:
+            self.measurements[key] = measurement
+        else:
+            measurement["unmeasured"] = True  # ingen kall ført og ingen tidligere måling
+        measurement["raw"] = raw
+        return measurement
+
+    def run(self, configs: list[dict]) -> list[dict]:
+        """Én rad per konfigurasjon med treffsikkerhet, tokens, kall, kostnad og tid."""
+        report = []
+        for config in configs:
+            name = config_name(config)
+            print(f"\n== {name} ==")
+            row = {"config": name, "correct": 0, "fields": 0, "tokens": 0, "calls": 0,
+                   "cost": 0.0, "wall": 0.0, "replayed": 0, "unmeasured": 0, "failed": 0, "per_field": {}}
+            for doc in self.docs:
+                try:
+                    m = self._measure(config, doc)
+                except Exception as e:
+                    print(f"{doc['name']}: feilet ({e})")
+                    row["failed"] += 1
+                    continue
+                predicted = parse_response(m["raw"]) or {}
+                scores = score_fields(predicted, doc["gold"])
+                row["correct"] += sum(scores.values())
+                row["fields"] += len(scores)
+                for field, ok in scores.items():
+                    hits, total = row["per_field"].get(field, (0, 0))
+                    row["per_field"][field] = (hits + ok, total + 1)
+                for metric in ("tokens", "calls", "cost", "wall"):
+                    row[metric] += m[metric]
+                row["replayed"] += m["replayed"]
+                row["unmeasured"] += m["unmeasured"]
+                print(f"{doc['name']}: {sum(scores.values())}/{len(scores)} felter riktige, "
+                      f"{m['calls']} kall, {m['wall']:.1f}s{' (replay)' if m['replayed'] else ''}")
+            row["accuracy"] = row["correct"] / row["fields"] if row["fields"] else 0.0
+            report.append(row)
+        self._save_measurements()
+        return report
+
+
+def recommend(report: list[dict], min_accuracy: float) -> dict | None:
+    """
+    Billigste (deretter raskeste) konfigurasjon som når 'min_accuracy' uten feilede
+    dokumenter. Konfigurasjoner med umålte dokumenter (kostnad/tid ukjent) tas ikke med.
+    """
+    good = [r for r in report if r["accuracy"] >= min_accuracy and not r["failed"] and not r.get("unmeasured")]
+    return min(good, key=lambda r: (r["cost"], r["wall"])) if good else None
+
+
+def format_report(report: list[dict]) -> str:
+    lines = [f"{'konfigurasjon':<32} {'riktig':>8} {'tokens':>9} {'kall':>6} {'USD':>9} {'tid (s)':>8}"]
+    for r in sorted(report, key=lambda r: (-r["accuracy"], r["cost"])):
+        note = f"  ({r['replayed']} replay)" if r["replayed"] else ""
+        if r["failed"]:
+            note += f"  ({r['failed']} feilet)"
+        if r.get("unmeasured"):
+            note += f"  ({r['unmeasured']} umålt)"
+        lines.append(
+            f"{r['config']:<32} {r['accuracy']:>7.1%} {r['tokens']:>9} {r['calls']:>6} "
+            f"{r['cost']:>9.4f} {r['wall']:>8.1f}{note}"
+        )
+    return "\n".join(lines)
+
+
+def parse_cli(argv=None):
+    ap = argparse.ArgumentParser(description="Sammenlign treffsikkerhet, kostnad og tid for KPI-uthenting.")
+    ap.add_argument("--config", action="append", required=True, metavar="MODELL:STRATEGI[:CHUNK]",
+                    help=f"Konfigurasjon å teste, f.eks. gpt-4o:map_reduce:4000 ({', '.join(STRATEGIES)})")
+    ap.add_argument("--gold-dir", default=None, help="Mappe med gullsettet (standard Settings().gold_dir)")
+    ap.add_argument("--instructions", default="LLMText/json_instructions.txt")
+    ap.add_argument("--min-accuracy", type=float, default=0.9,
+                    help="Treffsikkerhet som kreves for å anbefale en konfigurasjon")
+    return ap.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_cli()
+    with open(args.instructions, "r", encoding="utf-8") as f:
+        instructions = f.read()
+    docs = load_gold_set(args.gold_dir or Settings().gold_dir)
+    if not docs:
+        raise SystemExit("Fant ingen dokumenter med fasit i gullsettet.")
+
+    benchmark = KPIBenchmark(instructions, docs)
+    report = benchmark.run([parse_config(spec) for spec in args.config])
+    print()
+    print(format_report(report))
+    best = recommend(report, args.min_accuracy)
+    if best:
+        print(f"\nAnbefalt: {best['config']} ({best['accuracy']:.1%} riktig, ${best['cost']:.4f}, {best['wall']:.1f}s)")
+    else:
+        print(f"\nIngen konfigurasjon nådde {args.min_accuracy:.0%} riktige felter.")
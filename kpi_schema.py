@@ -0,0 +1,277 @@
+"""
+KPI-skjema: lokal validering av LLM-svaret og målrettet reparasjon.
+
+Skjemaet er {felt: type}, der type er "number", "integer", "string",
+"boolean", "array" eller "object". Det leses fra Settings().kpi_schema_file
+hvis filen finnes, ellers utledes det fra JSON-eksempelet i instruksjonene
+(json_instructions.txt), f.eks. {"omsetning": 0, "500tegnoppsummering": ""}.
+Tall i eksempelet er plassholdere, så både 0 og 0.0 gir "number"; "integer"
+brukes bare når skjemafilen sier det eksplisitt.
+
+null godtas for alle felter (KPI-en står ikke i rapporten). Felter som
+mangler eller har feil type, og som ikke kan rettes lokalt (f.eks. "1 234,5"
+-> 1234.5), hentes med ett lite oppfølgingskall som bare ber om de feltene,
+med utdrag fra teksten der feltnavnene nevnes, i stedet for å sende hele
+dokumentet på nytt.
+"""
+import os
+import re
+import json
+from settings import Settings
+from budget_ledger import usage_labels
+from token_budget import count_tokens
+
+
+TYPES = ("number", "integer", "string", "boolean", "array", "object")
+
+REPAIR_EXCERPT_TOKENS = 3000  # maks tokens med dokumenttekst i et reparasjonskall
+EXCERPT_WINDOW = 600  # tegn på hver side av et treff på feltnavnet
+
+
+def _type_of_example(value) -> str:
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, (int, float)):
+        return "number"  # 0 er en plassholder, ikke et krav om heltall
+    if isinstance(value, list):
+        return "array"
+    if isinstance(value, dict):
+        return "object"
+    return "string"
+
+
+def _find_json_objects(text: str):
+    """Gir alle toppnivå {...}-blokker i 'text' som lar seg parse som JSON-objekter."""
+    for _, _, obj in json_object_spans(text):
+        yield obj
+
+
+def json_object_spans(text: str):
+    """Som _find_json_objects, men gir (start, slutt, objekt), så blokkene kan tas ut av teksten."""
+    depth = 0
+    start = None
+    in_string = False
+    escaped = False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"' and depth > 0:
+            in_string = True
+        elif ch == "{":
+            if depth == 0:
+                start = i
+            depth += 1
+        elif ch == "}" and depth > 0:
+            depth -= 1
+            if depth == 0:
+                try:
+                    obj = json.loads(text[start:i+1])
+                except json.JSONDecodeError:
+                    continue
+                if isinstance(obj, dict):
+                    yield start, i + 1, obj
+
+
+def parse_response(raw: str) -> dict | None:
+    """Parser LLM-svaret; tåler kodeblokker og tekst rundt JSON-objektet."""
+    try:
+        data = json.loads(raw)
+        return data if isinstance(data, dict) else None
+    except (TypeError, json.JSONDecodeError):
+        pass
+    for obj in _find_json_objects(raw or ""):
+        return obj
+    return None
+
+
+def to_number(value, integer: bool = False):
+    """Tolker "1 234,5", "12,5 %", "-3.2 MNOK" osv. Returnerer None hvis det ikke går."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        number = value
+    elif isinstance(value, str):
+        cleaned = value.strip().replace(" ", "").replace(" ", "")
+        cleaned = cleaned.replace("−", "-")
+        match = re.fullmatch(r"([-+]?[\d.,]+)\s*(%|[A-Za-z]{0,5})", cleaned)
+        if not match:
+            return None
+        digits = match.group(1)
+        if "," in digits and "." in digits:
+            # Den siste separatoren er desimaltegnet
+            if digits.rfind(",") > digits.rfind("."):
+                digits = digits.replace(".", "").replace(",", ".")
+            else:
+                digits = digits.replace(",", "")
+        elif digits.count(",") > 1 or digits.count(".") > 1:
+            # Samme skilletegn flere ganger er tusenskille ("1,234,567", "1.234.567")
+            digits = digits.replace(",", "").replace(".", "")
+        elif "," in digits:
+            digits = digits.replace(",", ".")
+        try:
+            number = float(digits)
+        except ValueError:
+            return None
+    else:
+        return None
+    if integer:
+        return int(number) if float(number).is_integer() else None
+    return number
+
+
+class KPISchema:
+    def __init__(self, fields: dict):
+        """:param fields: {feltnavn: type}, der type er en av TYPES"""
+        unknown = {k: t for k, t in fields.items() if t not in TYPES}
+        if unknown:
+            raise ValueError(f"Ukjente typer i KPI-skjemaet: {unknown}")
+        self.fields = dict(fields)
+
+    @classmethod
+    def from_file(cls, path: str) -> "KPISchema":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    @classmethod
+    def from_instructions(cls, instructions: str) -> "KPISchema | None":
+        """Utleder skjemaet fra det største JSON-eksempelet i instruksjonene, om det finnes."""
+        examples = list(_find_json_objects(instructions))
+        if not examples:
+            return None
+        example = max(examples, key=len)
+        return cls({key: _type_of_example(value) for key, value in example.items()})
+
+    @classmethod
+    def load(cls, instructions: str) -> "KPISchema | None":
+        """Skjemafilen i Settings hvis den finnes, ellers utledet fra instruksjonene."""
+        path = Settings().kpi_schema_file
+        if path and os.path.exists(path):
+            return cls.from_file(path)
+        return cls.from_instructions(instructions)
+
+    def validate(self, data: dict) -> tuple[dict, dict]:
+        """
+        Retter det som kan rettes lokalt og returnerer (data, problemer),
+        der problemer er {felt: beskrivelse} for felter som må hentes på nytt.
+        Felter utenfor skjemaet beholdes som de er.
+        """
+        cleaned = dict(data)
+        problems = {}
+        for key, expected in self.fields.items():
+            if key not in data:
+                problems[key] = "mangler"
+                continue
+            value = data[key]
+            if value is None:
+                continue
+            if expected in ("number", "integer"):
+                number = to_number(value, integer=(expected == "integer"))
+                if number is None:
+                    problems[key] = f"forventet {expected}, fikk {value!r}"
+                else:
+                    cleaned[key] = number
+            elif expected == "string":
+                if isinstance(value, (dict, list)):
+                    problems[key] = f"forventet string, fikk {type(value).__name__}"
+                else:
+                    cleaned[key] = str(value)
+            elif expected == "boolean" and not isinstance(value, bool):
+                problems[key] = f"forventet boolean, fikk {value!r}"
+            elif expected == "array" and not isinstance(value, list):
+                problems[key] = f"forventet array, fikk {type(value).__name__}"
+            elif expected == "object" and not isinstance(value, dict):
+                problems[key] = f"forventet object, fikk {type(value).__name__}"
+        return cleaned, problems
+
+    def excerpt(self, text: str, fields: list[str], model_name: str,
+                max_tokens: int = REPAIR_EXCERPT_TOKENS) -> str:
+        """
+        Utdrag av 'text' rundt stedene feltnavnene (eller ordene i dem) nevnes,
+        innenfor 'max_tokens'. Uten treff brukes starten av teksten.
+        """
+        words = set()
+        for field in fields:
+            words.update(w for w in re.split(r"[_\W\d]+", field.lower()) if len(w) >= 4)
+        spans = []
+        lowered = text.lower()
+        for word in words:
+            for match in re.finditer(re.escape(word), lowered):
+                spans.append((max(0, match.start() - EXCERPT_WINDOW),
+                              min(len(text), match.end() + EXCERPT_WINDOW)))
+        spans.sort()
+
+        merged = []
+        for start, end in spans:
+            if merged and start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+
+        parts = []
+        used = 0
+        for start, end in merged:
+            part = text[start:end]
+            tokens = count_tokens(part, model_name)
+            if used + tokens > max_tokens:
+                break
+            parts.append(part)
+            used += tokens
+        if not parts:
+            # Ingen treff: start av teksten (ofte nøkkeltall/høydepunkter)
+            approx_chars = int(max_tokens * 3.5)
+            return text[:approx_chars]
+        return "\n[...]\n".join(parts)
+
+    def repair_prompt(self, problems: dict, excerpt: str) -> str:
+        wanted = {key: self.fields[key] for key in problems}
+        described = "\n".join(f"- {key}: {reason}" for key, reason in problems.items())
+        return (
+            "Et tidligere svar manglet eller hadde ugyldige verdier for disse feltene:\n"
+            f"{described}\n\n"
+            "Svar KUN med et JSON-objekt med nøyaktig disse nøklene og typene "
+            f"(null hvis verdien ikke finnes i teksten):\n{json.dumps(wanted, ensure_ascii=False)}\n\n"
+            f"Relevante utdrag fra dokumentet:\n{excerpt}"
+        )
+
+    def fetch_fields(self, model, text: str, problems: dict, stage: str = "repair") -> dict:
+        """
+        Henter bare feltene i 'problems' ({felt: grunn}) med ett lite kall til 'model',
+        med utdrag av 'text'. Returnerer de feltene svaret inneholdt (uvalidert).
+        """
+        excerpt = self.excerpt(text, list(problems), model.model_name)
+        with usage_labels(stage=stage):
+            patch = parse_response(model.run(self.repair_prompt(problems, excerpt)))
+        return {key: value for key, value in (patch or {}).items() if key in problems}
+
+    def enforce(self, model, text: str, raw_response: str, max_rounds: int = 1) -> tuple[dict | None, dict]:
+        """
+        Parser og validerer 'raw_response', og reparerer feil felter med små kall til 'model'.
+        Returnerer (data, gjenstående problemer). data er None bare hvis ingenting
+        kunne parses og reparasjonen heller ikke ga noe.
+        """
+        data = parse_response(raw_response)
+        if data is None:
+            print("Kunne ikke parse JSON fra LLM-respons; ber om alle felter på nytt fra utdrag.")
+            data, problems = {}, {key: "mangler (svaret var ikke gyldig JSON)" for key in self.fields}
+        else:
+            data, problems = self.validate(data)
+
+        for _ in range(max_rounds):
+            if not problems:
+                break
+            print(f"Reparerer {len(problems)} felt(er): {', '.join(problems)}")
+            patch = self.fetch_fields(model, text, problems)
+            if not patch:
+                break
+            data.update(patch)
+            data, problems = self.validate(data)
+
+        if not data and problems:
+            return None, problems
+        return data, problems
@@ -0,0 +1,335 @@
+"""
+KPI-uthenting som en langtlevende tjeneste med et lokalt HTTP-API.
+
+Hver kjøring av AI_KPI.py betaler importen av openai/PyPDF2/requests, leser
+innstillingene på nytt og avslutter. Tjenesten holder i stedet modellene
+(LLMRegistry), HTTP-poolene, svar-cachen og en prosesspool for tekstuthenting
+varme, så ventetiden per dokument bare er selve arbeidet.
+
+API (JSON inn og ut):
+
+    POST /jobs          {"path": "pdf/tickers/Kitron/q4.pdf"}
+                        {"url": "https://.../q4.pdf", "company": "Kitron"}
+                        valgfritt "company" og "route" (fixed|router|dispatch)
+                        -> 202 {"id": "...", "status": "queued"}
+    GET  /jobs/<id>     status (queued|running|done|skipped|failed), og "result"
+                        (KPI-JSON) og "result_path" når jobben er ferdig
+    GET  /jobs          alle jobber uten resultatene
+    GET  /health        {"status": "ok", "queued": n, "running": n}
+
+"path" må ligge under Settings().pdf_root, og "company" må være et rent
+mappenavn (uten / eller ..); ellers svarer tjenesten 400.
+
+Resultatene lagres også i results/ og PDF-en merkes som lest, akkurat som
+med AI_KPI.py. Instruksjonsfilen leses på nytt når den endres.
+
+    python kpi_service.py --port 8090 --workers 4
+    python kpi_service.py --socket /tmp/kpi.sock
+    curl -X POST localhost:8090/jobs -d '{"path": "pdf/tickers/Kitron/q4.pdf"}'
+"""
+import os
+import json
+import time
+import uuid
+import argparse
+import threading
+import socketserver
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from settings import Settings
+from pdf_handler import PDFHandler
+from llm_cache import LLMCache
+from AI_KPI import ROUTES, load_instructions, extract_pdf_text, _finish_pdf, use_llm_base_url
+
+
+MAX_JOBS = 1000  # ferdige jobber utover dette glemmes (eldste først); resultatene ligger i results/
+MAX_BODY_BYTES = 64 * 1024
+
+
+def _check_company(company: str) -> None:
+    """'company' blir en mappe under pdf_root, så det må være ett rent mappenavn."""
+    separators = [sep for sep in (os.sep, os.altsep, "/") if sep]
+    if not company.strip() or ".." in company or any(sep in company for sep in separators):
+        raise ValueError(f"Ugyldig selskapsnavn {company!r}.")
+
+
+def _pdf_under_root(path: str) -> str:
+    """Den fulle stien til 'path', som må være en PDF under Settings().pdf_root."""
+    root = os.path.realpath(Settings().pdf_root)
+    resolved = os.path.realpath(path)
+    if os.path.commonpath([root, resolved]) != root:
+        raise ValueError(f"'path' må ligge under {Settings().pdf_root}.")
+    if not (resolved.lower().endswith(".pdf") and os.path.isfile(resolved)):
+        raise ValueError(f"Fant ingen PDF på {path!r}.")
+    return resolved
+
+
+class KPIService:
+    def __init__(self, instructions_file: str = "LLMText/json_instructions.txt", workers: int = 4,
+                 route: str = "fixed", extract_workers: int | None = None,
+                 prefilter_tokens: int | None = None, normalize: bool = False):
+        """
+        :param workers: Antall dokumenter som analyseres samtidig
+        :param route: Standard modellvalg (se AI_KPI.analyze_pdf_text); kan overstyres per jobb
+        :param extract_workers: Prosesser for PDF-uthenting (standard = workers; 0 = i jobbtråden)
+        :param prefilter_tokens: Send bare de mest KPI-relevante sidene innenfor så mange tokens
+        :param normalize: Rens teksten for topp-/bunntekster o.l. først (text_normalizer.py)
+        """
+        if route not in ROUTES:
+            raise ValueError(f"Ukjent route {route!r}; bruk {', '.join(ROUTES)}")
+        self.instructions_file = instructions_file
+        self.route = route
+        self.prefilter_tokens = prefilter_tokens
+        self.normalize = normalize
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._instructions = None
+        self._instructions_mtime = None
+        self._llm_pool = ThreadPoolExecutor(max_workers=workers)
+        extract_workers = workers if extract_workers is None else extract_workers
+        self._extract_pool = ProcessPoolExecutor(max_workers=extract_workers) if extract_workers > 0 else None
+
+    def instructions(self) -> str:
+        """Instruksjonene, lest på nytt bare når filen er endret."""
+        mtime = os.path.getmtime(self.instructions_file)
+        with self._lock:
+            if mtime != self._instructions_mtime:
+                self._instructions = load_instructions(self.instructions_file)
+                self._instructions_mtime = mtime
+            return self._instructions
+
+    def submit(self, path: str | None = None, url: str | None = None, company: str | None = None,
+               route: str | None = None) -> dict:
+        """Legger en PDF (lokal sti eller URL) i kø. ValueError ved ugyldig forespørsel."""
+        if bool(path) == bool(url):
+            raise ValueError("Oppgi enten 'path' eller 'url'.")
+        if url and not company:
+            raise ValueError("'company' må oppgis sammen med 'url'.")
+        if company is not None:
+            _check_company(company)
+        if path:
+            path = _pdf_under_root(path)
+        route = route or self.route
+        if route not in ROUTES:
+            raise ValueError(f"Ukjent route {route!r}; bruk {', '.join(ROUTES)}")
+
+        job = {
+            "id": uuid.uuid4().hex[:12],
+            "status": "queued",
+            "path": path,
+            "url": url,
+            "company": company or os.path.basename(os.path.dirname(path)),
+            "route": route,
+            "submitted": time.time(),
+            "finished": None,
+            "error": None,
+            "result_path": None,
+            "result": None,
+        }
+        with self._lock:
+            self._jobs[job["id"]] = job
+            self._forget_old_jobs()
+        self._llm_pool.submit(self._run, job["id"])
+        return self.job(job["id"], with_result=False)
+
+    def _forget_old_jobs(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job["finished"] is not None]
+        for job_id in finished[:max(0, len(self._jobs) - MAX_JOBS)]:
+            del self._jobs[job_id]
+
+    def job(self, job_id: str, with_result: bool = True) -> dict | None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job = dict(job)
+        if not with_result:
+            job.pop("result")
+        return job
+
+    def jobs(self) -> list[dict]:
+        with self._lock:
+            ids = list(self._jobs)
+        return [self.job(job_id, with_result=False) for job_id in ids]
+
+    def counts(self) -> dict:
+        with self._lock:
+            statuses = [job["status"] for job in self._jobs.values()]
+        return {status: statuses.count(status) for status in ("queued", "running")}
+
+    def _update(self, job_id: str, **fields) -> None:
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    def _run(self, job_id: str) -> None:
+        job = self.job(job_id)
+        self._update(job_id, status="running")
+        try:
+            company = job["company"]
+            pdf_handler = PDFHandler(company)
+            if job["url"]:
+                pdf_filename = pdf_handler._extract_filename_from_url(job["url"])
+                if not pdf_handler.is_pdf_downloaded(pdf_filename) \
+                        and not pdf_handler.download_pdf(job["url"], pdf_filename):
+                    raise RuntimeError(f"Kunne ikke laste ned {job['url']}")
+                path = os.path.join(Settings().pdf_root, company, pdf_filename)
+            else:
+                path = job["path"]
+                pdf_filename = os.path.basename(path)
+
+            if self._extract_pool is not None:
+                pdf_text = self._extract_pool.submit(extract_pdf_text, company, path,
+                                                     self.prefilter_tokens, self.normalize).result()
+            else:
+                pdf_text = extract_pdf_text(company, path, self.prefilter_tokens, self.normalize)
+            result_path = _finish_pdf(pdf_handler, self.instructions(), pdf_filename, pdf_text,
+                                      job["route"], company)
+
+            result = None
+            if result_path:
+                with open(result_path, "r", encoding="utf-8") as f:
+                    result = json.load(f)
+            self._update(job_id, status="done" if result_path else "skipped", result_path=result_path,
+                         result=result, finished=time.time())
+        except Exception as e:
+            print(f"Jobb {job_id} feilet: {e}")
+            self._update(job_id, status="failed", error=str(e), finished=time.time())
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._llm_pool.shutdown(wait=wait)
+        if self._extract_pool is not None:
+            self._extract_pool.shutdown(wait=wait)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    @property
+    def service(self) -> KPIService:
+        return self.server.service
+
+    def _send_json(self, status: int, obj) -> None:
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = self.path.split("?")[0].rstrip("/")
+        if path == "/health":
+            self._send_json(200, dict(status="ok", **self.service.counts()))
+        elif path == "/jobs":
+            self._send_json(200, self.service.jobs())
+        elif path.startswith("/jobs/"):
+            job = self.service.job(path[len("/jobs/"):])
+            if job is None:
+                self._send_json(404, {"error": "ukjent jobb"})
+            else:
+                self._send_json(200, job)
+        else:
+            self._send_json(404, {"error": "ukjent sti"})
+
+    def do_POST(self):
+        if self.path.split("?")[0].rstrip("/") != "/jobs":
+            self._send_json(404, {"error": "ukjent sti"})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            self._send_json(413, {"error": "for stor forespørsel"})
+            return
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(body, dict):
+                raise ValueError("forventet et JSON-objekt")
+            job = self.service.submit(path=body.get("path"), url=body.get("url"),
+                                      company=body.get("company"), route=body.get("route"))
+        except ValueError as e:  # json.JSONDecodeError er en ValueError
+            self._send_json(400, {"error": str(e)})
+            return
+        self._send_json(202, job)
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class KPIServer:
+    """HTTP-front for en KPIService, på TCP (host/port, port=0 velger en ledig) eller en Unix-socket."""
+
+    def __init__(self, service: KPIService, host: str = "127.0.0.1", port: int = 0,
+                 socket_path: str | None = None):
+        self.socket_path = socket_path
+        if socket_path:
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+            self.httpd = _UnixHTTPServer(socket_path, _Handler)
+        else:
+            self.httpd = ThreadingHTTPServer((host, port), _Handler)
+            self.httpd.daemon_threads = True
+        self.httpd.service = service
+        self._thread = None
+
+    @property
+    def address(self) -> str:
+        if self.socket_path:
+            return f"unix:{self.socket_path}"
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "KPIServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.socket_path and os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def parse_cli(argv=None):
+    ap = argparse.ArgumentParser(description="KPI-uthenting som tjeneste med lokalt HTTP-API.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8090)
+    ap.add_argument("--socket", metavar="STI", help="Lytt på en Unix-socket i stedet for TCP")
+    ap.add_argument("-w", "--workers", type=int, default=4, help="Dokumenter som analyseres samtidig")
+    ap.add_argument("--route", choices=ROUTES, default="fixed", help="Standard modellvalg per PDF")
+    ap.add_argument("--instructions", default="LLMText/json_instructions.txt")
+    ap.add_argument("--prefilter", nargs="?", type=int, const=Settings().prefilter_tokens, metavar="TOKENS",
+                    help="Send bare de mest KPI-relevante sidene innenfor et token-budsjett")
+    ap.add_argument("--normalize", action="store_true",
+                    help="Fjern topp-/bunntekster, sidetall, orddeling og juridisk standardtekst først")
+    ap.add_argument("--llm-base-url", metavar="URL", help="Send LLM-kall til en annen OpenAI-kompatibel server")
+    return ap.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_cli()
+    if args.llm_base_url:
+        use_llm_base_url(args.llm_base_url)
+    service = KPIService(args.instructions, workers=args.workers, route=args.route,
+                         prefilter_tokens=args.prefilter, normalize=args.normalize)
+    service.instructions()  # feil tidlig hvis instruksjonsfilen mangler
+    server = KPIServer(service, args.host, args.port, socket_path=args.socket)
+    print(f"KPI-tjeneste på {server.address} (Ctrl-C for å stoppe)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        service.shutdown(wait=False)
+        print(LLMCache.default().report())
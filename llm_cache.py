@@ -0,0 +1,71 @@
+import json
+import hashlib
+from settings import Settings
+from disk_cache import DiskLRUCache
+
+
+class LLMCache(DiskLRUCache):
+    """
+    Innholdsadressert disk-cache for LLM-svar, delt av alle LLMModel-subklasser.
+
+    Nøkkelen er (provider, model_name, hash av instruksjoner, hash av meldingslisten,
+    temperature). Hvert svar lagres som én JSON-fil i cache-mappen. Filens mtime
+    oppdateres ved treff, slik at de minst nylig brukte filene fjernes først når
+    mappen går over 'max_bytes' (se DiskLRUCache).
+    """
+
+    SUFFIX = ".json"
+    LABEL = "LLM-cache"
+    READ_ERRORS = (FileNotFoundError, json.JSONDecodeError)
+
+    _default = None
+
+    @classmethod
+    def _from_settings(cls) -> "LLMCache":
+        settings = Settings()
+        return cls(settings.llm_cache_dir, settings.llm_cache_max_bytes)
+
+    @staticmethod
+    def _hash(value) -> str:
+        if not isinstance(value, str):
+            value = json.dumps(value, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+    def make_key(self, provider: str, model_name: str, instructions: str,
+                 messages: list[dict], temperature: float | None, options: dict | None = None) -> str:
+        """
+        Bygger cache-nøkkelen for ett kall. temperature=None betyr providerens standard.
+        'options' er andre parametre som påvirker svaret (f.eks. JSON-modus).
+        """
+        parts = [
+            provider,
+            model_name,
+            self._hash(instructions),
+            self._hash(messages),
+            repr(None if temperature is None else float(temperature)),
+        ]
+        if options:
+            parts.append(self._hash(options))
+        return self._hash("|".join(parts))
+
+    def _load(self, path: str):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _dump(self, path: str, value) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(value, f, ensure_ascii=False)
+
+    def put(self, key: str, value):
+        """
+        Lagrer et svar og rydder opp hvis cachen er for stor.
+        Returnerer verdien normalisert til rene JSON-typer, slik at treff og bom gir samme form.
+        """
+        return super().put(key, json.loads(json.dumps(value, ensure_ascii=False)))
+
+    def cached_call(self, key: str, call):
+        """Returnerer svaret for 'key' fra cachen, eller kjører 'call()' og lagrer resultatet."""
+        value = self.get(key)
+        if value is not None:
+            return value
+        return self.put(key, call())
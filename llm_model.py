@@ -1,14 +1,134 @@
 # llm_model.py
+import asyncio
 from abc import ABC, abstractmethod
+from llm_cache import LLMCache
+from rate_limiter import RateLimiter
+from budget_ledger import BudgetLedger, estimate_cost
+from token_budget import count_tokens, MESSAGE_OVERHEAD
+
+# Antatt lengde på svaret når vi reserverer tokens før kallet (KPI-JSON)
+EXPECTED_COMPLETION_TOKENS = 1000
 
 class LLMModel(ABC):
-    def __init__(self, instructions: str, model_name: str):
+    # Brukes i cache-nøkkelen; overstyres av hver konkret klasse
+    provider = "generic"
+
+    def __init__(self, instructions: str, model_name: str, use_cache: bool = True, json_mode: bool = False):
         """
         Lagre instruksjoner (systemprompt) i selve objektet.
         Alle konkrete LLM-klasser vil arve dette.
+        Med use_cache=True deles en disk-cache for svar mellom alle modeller.
+        Med json_mode=True ber vi provideren om å svare med et gyldig JSON-objekt.
         """
         self.instructions = instructions
         self.model_name = model_name
+        self.json_mode = json_mode
+        self.cache = LLMCache.default() if use_cache else None
+        # Delt mellom alle instanser av samme provider
+        self.rate_limiter = RateLimiter.for_provider(self.provider)
+        # Delt mellom alle prosesser på maskinen (SQLite)
+        self.ledger = BudgetLedger.default()
+
+    def _reserve(self, messages: list[dict]) -> dict:
+        """Estimerte tokens (input + forventet svar) og kostnad for ett kall."""
+        prompt = sum(count_tokens(m["content"], self.model_name) + MESSAGE_OVERHEAD for m in messages)
+        return {
+            "prompt": prompt,
+            "tokens": prompt + EXPECTED_COMPLETION_TOKENS,
+            "cost": estimate_cost(self.model_name, prompt, EXPECTED_COMPLETION_TOKENS),
+            "charged": False,
+        }
+
+    def _wait_for_capacity(self, reservation: dict) -> None:
+        """
+        Kalles før hvert forsøk: trekker fra den felles ledgeren (alle prosesser)
+        og deretter fra prosessens egen rate limiter. Kostnaden trekkes bare én gang.
+        """
+        cost = 0.0 if reservation["charged"] else reservation["cost"]
+        self.ledger.acquire(self.provider, reservation["tokens"], cost)
+        reservation["charged"] = True
+        self.rate_limiter.acquire(reservation["tokens"])
+
+    async def _await_capacity(self, reservation: dict) -> None:
+        """Async variant av _wait_for_capacity()."""
+        cost = 0.0 if reservation["charged"] else reservation["cost"]
+        await self.ledger.aacquire(self.provider, reservation["tokens"], cost)
+        reservation["charged"] = True
+        await self.rate_limiter.aacquire(reservation["tokens"])
+
+    def _update_limits(self, headers) -> None:
+        """Mater prosessens limiter og den felles ledgeren med providerens x-ratelimit-*-headere."""
+        self.rate_limiter.update_from_headers(headers)
+        self.ledger.update_from_headers(self.provider, headers)
+
+    def _on_rate_limited(self, headers) -> float | None:
+        """Kalles ved 429; returnerer providerens anbefalte ventetid, om den finnes."""
+        self.ledger.update_from_headers(self.provider, headers)
+        return self.rate_limiter.on_rate_limited(headers)
+
+    def _settle(self, reservation: dict, usage: dict | None, completion_text: str | None = None) -> None:
+        """
+        Korrigerer limiter og ledger med faktisk forbruk fra svarets 'usage'-blokk,
+        og fører kallet i forbruksregnskapet (se budget_ledger.usage_labels).
+        Uten usage-blokk estimeres forbruket fra meldingene og eventuelt 'completion_text'.
+        """
+        usage = usage or {}
+        actual_tokens = usage.get("total_tokens")
+        actual_cost = None
+        if usage.get("prompt_tokens") is not None and usage.get("completion_tokens") is not None:
+            actual_cost = estimate_cost(self.model_name, usage["prompt_tokens"], usage["completion_tokens"])
+        self.rate_limiter.record_usage(reservation["tokens"], actual_tokens)
+        self.ledger.record(self.provider, reservation["tokens"], actual_tokens,
+                           reservation["cost"], actual_cost)
+
+        if actual_cost is not None:
+            self.ledger.record_call(self.provider, self.model_name, usage["prompt_tokens"],
+                                    usage["completion_tokens"], actual_cost)
+        else:
+            completion = (count_tokens(completion_text, self.model_name) if completion_text is not None
+                          else EXPECTED_COMPLETION_TOKENS)
+            self.ledger.record_call(self.provider, self.model_name, reservation["prompt"], completion,
+                                    estimate_cost(self.model_name, reservation["prompt"], completion),
+                                    estimated=True)
+
+    def _cache_key(self, messages: list[dict], temperature: float | None) -> str:
+        options = {"json_mode": True} if self.json_mode else None
+        return self.cache.make_key(self.provider, self.model_name, self.instructions, messages,
+                                   temperature, options)
+
+    def _cached(self, messages: list[dict], temperature: float, call):
+        """
+        Kjører 'call()' (selve API-kallet) via svar-cachen.
+        Samme provider, modell, instruksjoner, meldinger og temperature gir samme svar.
+        """
+        if self.cache is None:
+            return call()
+        key = self._cache_key(messages, temperature)
+        return self.cache.cached_call(key, call)
+
+    async def _acached(self, messages: list[dict], temperature: float, acall):
+        """Som _cached(), men 'acall()' returnerer en coroutine (async API-kall)."""
+        if self.cache is None:
+            return await acall()
+        key = self._cache_key(messages, temperature)
+        value = self.cache.get(key)
+        if value is not None:
+            return value
+        return self.cache.put(key, await acall())
+
+    def cached_response(self, messages: list[dict], temperature: float):
+        """Returnerer et cachet svar uten å kalle API-et, eller None."""
+        if self.cache is None:
+            return None
+        key = self._cache_key(messages, temperature)
+        return self.cache.get(key)
+
+    def store_in_cache(self, messages: list[dict], temperature: float, response) -> None:
+        """Legger et svar hentet på annen måte (f.eks. fra en batch) inn i svar-cachen."""
+        if self.cache is None:
+            return
+        key = self._cache_key(messages, temperature)
+        self.cache.put(key, response)
 
     @abstractmethod
     def run(self, text: str) -> str:
@@ -17,3 +137,11 @@ class LLMModel(ABC):
         og returnerer råtekstsvar fra LLM-en.
         """
         pass
+
+    async def arun(self, text: str) -> str:
+        """
+        Async variant av run(). Subklasser med async HTTP-klient overstyrer denne;
+        standardimplementasjonen kjører run() i en tråd. Start event-loopen med
+        LLMRegistry().run_async(...), så aiohttp-sessionene lukkes etterpå.
+        """
+        return await asyncio.to_thread(self.run, text)
@@ -0,0 +1,134 @@
+import asyncio
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class LLMRegistry:
+    """
+    Felles oppsett for alle LLM-klienter i prosessen (singleton, som Settings).
+
+    - Leser secrets.txt én gang og gir ut nøkler per navn (OAI_Key, DeepSeek_Key, ...).
+    - Holder én requests.Session per provider med keep-alive-pool, så TCP/TLS-
+      tilkoblinger gjenbrukes mellom kall og tråder. For async-kall finnes en
+      aiohttp.ClientSession per provider og event-loop.
+    - Deler ut gjenbrukbare modellinstanser: samme klasse, modell og instruksjoner
+      gir samme objekt. Modellene har ingen per-kall-tilstand og er trådsikre.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    POOL_SIZE = 32
+    ASYNC_POOL_SIZE = 100  # samtidige tilkoblinger per provider; resten køes i aiohttp
+    SECRETS_FILE = "secrets.txt"
+
+    def __new__(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = super(LLMRegistry, cls).__new__(cls)
+                cls._instance.__initialize()
+            return cls._instance
+
+    def __initialize(self):
+        self.__lock = threading.Lock()
+        self.__secrets = None
+        self.__sessions = {}
+        self.__async_sessions = {}
+        self.__models = {}
+
+    def _load_secrets(self) -> dict:
+        secrets = {}
+        try:
+            with open(self.SECRETS_FILE, "r", encoding="utf-8") as f:
+                for line in f:
+                    if "=" in line:
+                        name, value = line.split("=", 1)
+                        secrets[name.strip()] = value.strip()
+        except FileNotFoundError:
+            pass
+        return secrets
+
+    def get_secret(self, name: str) -> str | None:
+        """Returnerer verdien for 'name' fra secrets.txt (lest kun første gang), eller None."""
+        with self.__lock:
+            if self.__secrets is None:
+                self.__secrets = self._load_secrets()
+            return self.__secrets.get(name) or None
+
+    def get_session(self, provider: str) -> requests.Session:
+        """Delt keep-alive-session for 'provider'."""
+        with self.__lock:
+            session = self.__sessions.get(provider)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self.__sessions[provider] = session
+            return session
+
+    def get_async_session(self, provider: str) -> "aiohttp.ClientSession":
+        """Delt aiohttp-session for 'provider' i den kjørende event-loopen."""
+        if aiohttp is None:
+            raise ImportError("aiohttp må være installert for async-kall (pip install aiohttp).")
+        key = (provider, asyncio.get_running_loop())
+        with self.__lock:
+            session = self.__async_sessions.get(key)
+            if session is None or session.closed:
+                session = aiohttp.ClientSession(
+                    connector=aiohttp.TCPConnector(limit=self.ASYNC_POOL_SIZE)
+                )
+                self.__async_sessions[key] = session
+            return session
+
+    def get_model(self, model_cls, instructions: str, model_name: str = None, **kwargs):
+        """
+        Returnerer en gjenbrukbar instans av 'model_cls' for (model_name, instructions).
+        Første kall oppretter den; senere kall gir samme objekt.
+        """
+        key = (model_cls, model_name, instructions, tuple(sorted(kwargs.items())))
+        with self.__lock:
+            model = self.__models.get(key)
+        if model is not None:
+            return model
+
+        if model_name is not None:
+            kwargs["model_name"] = model_name
+        model = model_cls(instructions=instructions, **kwargs)
+        with self.__lock:
+            # En annen tråd kan ha rukket å lage den; behold den første
+            return self.__models.setdefault(key, model)
+
+    def close(self) -> None:
+        """Lukker alle sessions (f.eks. ved avslutning av en langvarig tjeneste)."""
+        with self.__lock:
+            for session in self.__sessions.values():
+                session.close()
+            self.__sessions.clear()
+
+    async def aclose(self) -> None:
+        """Lukker aiohttp-sessions som hører til den kjørende event-loopen."""
+        loop = asyncio.get_running_loop()
+        with self.__lock:
+            keys = [k for k in self.__async_sessions if k[1] is loop]
+            sessions = [self.__async_sessions.pop(k) for k in keys]
+        for session in sessions:
+            await session.close()
+
+    def run_async(self, coro):
+        """
+        Som asyncio.run(coro), men lukker loopens aiohttp-sessions til slutt.
+        Bruk denne som inngang til arun()-kall, f.eks.
+        LLMRegistry().run_async(model.arun(tekst)).
+        """
+        async def _main():
+            try:
+                return await coro
+            finally:
+                await self.aclose()
+        return asyncio.run(_main())
@@ -0,0 +1,273 @@
+"""
+Ruter LLM-kall mellom flere providere (f.eks. OpenAI og DeepSeek).
+
+For hver backend holdes et glidende utvalg av de siste kallene: latens
+(p50/p95) og feilrate. Hvert kall går først til backenden som har gjort det
+best i det siste, og faller over til neste ved feil. Med hedge=True sendes en
+duplikatforespørsel til neste backend hvis den første ikke har svart innen sin
+egen p95, og det første vellykkede svaret vinner; da stopper ikke én treg
+forespørsel hele batchen.
+"""
+import time
+import json
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from llm_model import LLMModel
+from llm_registry import LLMRegistry
+from budget_ledger import usage_labels, current_labels
+
+
+WINDOW_SIZE = 50  # antall siste kall statistikken bygger på
+MIN_SAMPLES = 5  # færre kall enn dette: backenden prøves før den rangeres
+MAX_ERROR_RATE = 0.5  # over dette havner backenden bakerst i køen
+ERROR_PENALTY = 4.0  # hvor mye feilraten straffer latensen i rangeringen
+
+
+def _is_error_response(text: str) -> bool:
+    """DeepSeekModel returnerer {"error": ...} i stedet for å kaste ved nettverksfeil."""
+    try:
+        data = json.loads(text)
+    except (TypeError, ValueError):
+        return False
+    return isinstance(data, dict) and set(data) == {"error"}
+
+
+class BackendError(RuntimeError):
+    """En backend svarte med en feilmelding i stedet for et resultat."""
+
+
+class ProviderStats:
+    """Latens og feilrate for de siste WINDOW_SIZE kallene til én backend."""
+
+    def __init__(self, window: int = WINDOW_SIZE):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def record(self, latency: float, ok: bool) -> None:
+        with self.lock:
+            self.outcomes.append(ok)
+            if ok:
+                self.latencies.append(latency)
+
+    def _percentile(self, q: float) -> float | None:
+        with self.lock:
+            values = sorted(self.latencies)
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    @property
+    def samples(self) -> int:
+        return len(self.outcomes)
+
+    @property
+    def p50(self) -> float | None:
+        return self._percentile(0.50)
+
+    @property
+    def p95(self) -> float | None:
+        return self._percentile(0.95)
+
+    @property
+    def error_rate(self) -> float:
+        with self.lock:
+            if not self.outcomes:
+                return 0.0
+            return 1 - sum(self.outcomes) / len(self.outcomes)
+
+    def score(self) -> float:
+        """Lavere er bedre. Backender uten nok historikk får 0 så de blir prøvd."""
+        if self.samples < MIN_SAMPLES:
+            return 0.0
+        p50 = self.p50 if self.p50 is not None else float("inf")
+        return p50 * (1 + ERROR_PENALTY * self.error_rate)
+
+
+class LLMRouter(LLMModel):
+    provider = "router"
+
+    def __init__(self, instructions: str, backends: list[LLMModel], hedge: bool = False,
+                 max_workers: int = 16):
+        """
+        :param instructions: Systemprompt (må være lik for alle backender)
+        :param backends: Modellene det rutes mellom, i foretrukket rekkefølge
+        :param hedge: Send duplikat til neste backend når den første går over sin p95
+        :param max_workers: Tråder for hedgede kall (ett kall kan bruke to)
+        """
+        if not backends:
+            raise ValueError("LLMRouter trenger minst én backend.")
+        # Backendene cacher selv; routeren har ingen egen cache
+        super().__init__(instructions, model_name="router", use_cache=False)
+        self.backends = list(backends)
+        self.hedge = hedge
+        self.stats = {self._name(b): ProviderStats() for b in self.backends}
+        self._pool = ThreadPoolExecutor(max_workers=max_workers) if hedge else None
+
+    @classmethod
+    def from_specs(cls, instructions: str, specs: list[tuple], model_kwargs: dict | None = None,
+                   **kwargs) -> "LLMRouter":
+        """
+        Bygger en router fra [(modellklasse, modellnavn), ...] via LLMRegistry.
+        'model_kwargs' (f.eks. json_mode=True) sendes videre til hver backend.
+        """
+        registry = LLMRegistry()
+        backends = [
+            registry.get_model(model_cls, instructions, model_name, **(model_kwargs or {}))
+            for model_cls, model_name in specs
+        ]
+        return cls(instructions, backends, **kwargs)
+
+    @staticmethod
+    def _name(backend: LLMModel) -> str:
+        return f"{backend.provider}:{backend.model_name}"
+
+    def ranked_backends(self) -> list[LLMModel]:
+        """Backendene sortert etter nylig ytelse; stabil sortering beholder foretrukket rekkefølge."""
+        def key(backend):
+            stats = self.stats[self._name(backend)]
+            unhealthy = stats.samples >= MIN_SAMPLES and stats.error_rate > MAX_ERROR_RATE
+            return (unhealthy, stats.score())
+        return sorted(self.backends, key=key)
+
+    def _hedge_after(self, backend: LLMModel) -> float | None:
+        """Sekunder før et hedge-kall sendes: backendens p95, når vi har nok historikk."""
+        stats = self.stats[self._name(backend)]
+        return stats.p95 if stats.samples >= MIN_SAMPLES else None
+
+    def report(self) -> str:
+        lines = []
+        for name, stats in self.stats.items():
+            p50, p95 = stats.p50, stats.p95
+            lines.append(
+                f"{name}: {stats.samples} kall, p50 {p50 or 0:.1f}s, p95 {p95 or 0:.1f}s, "
+                f"feilrate {stats.error_rate:.0%}"
+            )
+        return "\n".join(lines)
+
+    # ------------------------------------------------------------------
+    # Synkrone kall
+    # ------------------------------------------------------------------
+    def _timed_run(self, backend: LLMModel, text: str) -> str:
+        """Kjører ett kall mot 'backend' og fører statistikk. Kaster ved feil."""
+        stats = self.stats[self._name(backend)]
+        start = time.monotonic()
+        try:
+            result = backend.run(text)
+            if _is_error_response(result):
+                raise BackendError(result)
+        except Exception:
+            stats.record(time.monotonic() - start, ok=False)
+            raise
+        stats.record(time.monotonic() - start, ok=True)
+        return result
+
+    def run(self, text: str) -> str:
+        """
+        Sender 'text' til beste backend, med failover til de neste ved feil.
+
+        :param text: Brukerinput
+        :return: Svaret fra første backend som lyktes
+        """
+        ranked = self.ranked_backends()
+        if self.hedge and len(ranked) > 1:
+            return self._run_hedged(ranked, text)
+
+        last_error = None
+        for backend in ranked:
+            try:
+                return self._timed_run(backend, text)
+            except Exception as e:
+                print(f"{self._name(backend)} feilet ({e}), prøver neste backend.")
+                last_error = e
+        raise last_error
+
+    def _run_hedged(self, ranked: list[LLMModel], text: str) -> str:
+        """
+        Starter beste backend; har den ikke svart innen sin p95, startes neste i
+        tillegg. Første vellykkede svar vinner. Ved feil startes neste backend med
+        en gang. Tapende kall får fullføre i bakgrunnen (svaret havner i cachen).
+        """
+        pending = {}
+        queue = list(ranked)
+        last_error = None
+        labels = current_labels()  # følger ikke med inn i pool-trådene av seg selv
+
+        def _labelled_run(backend):
+            with usage_labels(**labels):
+                return self._timed_run(backend, text)
+
+        def _launch():
+            backend = queue.pop(0)
+            pending[self._pool.submit(_labelled_run, backend)] = backend
+
+        _launch()
+        while pending:
+            # Hedge bare når vi kjenner p95 for det som kjører, og det finnes flere å prøve
+            timeout = None
+            if queue and len(pending) == 1:
+                timeout = self._hedge_after(next(iter(pending.values())))
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                print(f"{self._name(next(iter(pending.values())))} over p95 ({timeout:.1f}s), sender hedge.")
+                _launch()
+                continue
+            for future in done:
+                backend = pending.pop(future)
+                try:
+                    return future.result()
+                except Exception as e:
+                    print(f"{self._name(backend)} feilet ({e}).")
+                    last_error = e
+            if not pending and queue:
+                _launch()
+        raise last_error
+
+    # ------------------------------------------------------------------
+    # Async kall
+    # ------------------------------------------------------------------
+    async def _atimed_run(self, backend: LLMModel, text: str) -> str:
+        stats = self.stats[self._name(backend)]
+        start = time.monotonic()
+        try:
+            result = await backend.arun(text)
+            if _is_error_response(result):
+                raise BackendError(result)
+        except Exception:
+            stats.record(time.monotonic() - start, ok=False)
+            raise
+        stats.record(time.monotonic() - start, ok=True)
+        return result
+
+    async def arun(self, text: str) -> str:
+        """Async variant av run(), med samme failover og hedging."""
+        queue = self.ranked_backends()
+        pending = {}
+        last_error = None
+
+        def _launch():
+            backend = queue.pop(0)
+            pending[asyncio.ensure_future(self._atimed_run(backend, text))] = backend
+
+        _launch()
+        while pending:
+            timeout = None
+            if self.hedge and queue and len(pending) == 1:
+                timeout = self._hedge_after(next(iter(pending.values())))
+            done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                print(f"{self._name(next(iter(pending.values())))} over p95 ({timeout:.1f}s), sender hedge.")
+                _launch()
+                continue
+            for task in done:
+                backend = pending.pop(task)
+                try:
+                    return task.result()
+                except Exception as e:
+                    print(f"{self._name(backend)} feilet ({e}).")
+                    last_error = e
+            if not pending and queue:
+                _launch()
+        raise last_error
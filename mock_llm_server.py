@@ -0,0 +1,402 @@
+"""
+Lokal, OpenAI-kompatibel stand-in for chat/completions, for lasttesting uten kostnad.
+
+Svarer på POST /v1/chat/completions (og /chat/completions) slik OpenAIModel
+og DeepSeekModel forventer, inkludert strømming (SSE) og 'usage'-blokk, og
+kan simulere det som skjer mot ekte API-er:
+
+- latens: "fixed:0.5", "uniform:0.2:1.5" eller "lognormal:1.0:0.5" (median, sigma)
+- 429: tilfeldig med en gitt sannsynlighet, og/eller når RPM/TPM-grensene
+  (glidende 60-sekundersvindu) overskrides; med retry-after og x-ratelimit-*-headere
+- kontekstlengde: 400 med "maximum context length" når meldingene er for lange
+- svar: faste JSON-objekter (brukes på rundgang), f.eks. et typisk KPI-svar
+
+Batch-endepunktene (POST /v1/files, POST /v1/batches, GET /v1/batches/<id> og
+GET /v1/files/<id>/content) er også med, så openai_batch.py og AI_KPI.py --batch
+kan kjøres mot serveren. En batch fullføres med én gang: hver linje besvares
+som et vanlig kall (uten latens), og linjer som ville gitt 429 eller
+kontekstfeil havner i error-filen.
+
+GET /stats gir tellere (forespørsler, 429, kontekstfeil, tokens).
+
+Bruk fra kommandolinjen:
+
+    python mock_llm_server.py --port 8089 --latency lognormal:2:0.6 --rate-429 0.05 --rpm 120
+    python AI_KPI.py Svedberg -w 8 --llm-base-url http://127.0.0.1:8089/v1
+
+eller i kode:
+
+    with MockLLMServer(MockConfig(latency="fixed:0.1")) as server:
+        openai.api_base = server.base_url
+"""
+import re
+import json
+import math
+import time
+import random
+import argparse
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from token_budget import count_tokens, MESSAGE_OVERHEAD
+
+
+DEFAULT_RESPONSE = {"mock": True}
+STREAM_PIECE = 16  # tegn per SSE-bit ved strømming
+
+
+def parse_latency(spec: str):
+    """Gjør "fixed:0.5", "uniform:0.2:1.5" eller "lognormal:1.0:0.5" om til en funksjon som gir sekunder."""
+    kind, *args = spec.split(":")
+    args = [float(a) for a in args]
+    if kind == "fixed" and len(args) == 1:
+        return lambda: args[0]
+    if kind == "uniform" and len(args) == 2:
+        return lambda: random.uniform(args[0], args[1])
+    if kind == "lognormal" and len(args) == 2:
+        median, sigma = args
+        return lambda: random.lognormvariate(math.log(median), sigma)
+    raise ValueError(f"Ugyldig latens-spesifikasjon: {spec!r}")
+
+
+class MockConfig:
+    def __init__(self, latency: str = "fixed:0", rate_429: float = 0.0, rpm: int | None = None,
+                 tpm: int | None = None, retry_after: float = 1.0, context_window: int = 128000,
+                 responses: list | dict | None = None):
+        """
+        :param latency: Latensfordeling per svar (se parse_latency)
+        :param rate_429: Sannsynlighet for et tilfeldig 429-svar per forespørsel
+        :param rpm: Forespørsler per minutt før 429 (None = ubegrenset)
+        :param tpm: Tokens per minutt før 429 (None = ubegrenset)
+        :param retry_after: Sekunder i retry-after-headeren ved 429
+        :param context_window: Maks tokens i meldingene før kontekstlengde-feil
+        :param responses: JSON-objekt(er) som returneres som svarinnhold, på rundgang
+        """
+        self.latency = parse_latency(latency)
+        self.rate_429 = rate_429
+        self.rpm = rpm
+        self.tpm = tpm
+        self.retry_after = retry_after
+        self.context_window = context_window
+        if responses is None:
+            responses = [DEFAULT_RESPONSE]
+        self.responses = responses if isinstance(responses, list) else [responses]
+
+
+class _State:
+    """Tellere og 60-sekundersvindu for RPM/TPM, delt av alle forespørselstråder."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.window = deque()  # (ts, tokens)
+        self.counter = 0
+        self.stats = {"requests": 0, "ok": 0, "rate_limited": 0, "context_errors": 0,
+                      "prompt_tokens": 0, "completion_tokens": 0}
+        self.files = {}  # {file_id: innhold}
+        self.batches = {}  # {batch_id: batch-objekt}
+
+    def add_file(self, content: str) -> str:
+        with self.lock:
+            file_id = f"file-mock-{len(self.files)}"
+            self.files[file_id] = content
+            return file_id
+
+    def count(self, key: str, amount: int = 1) -> None:
+        with self.lock:
+            self.stats[key] += amount
+
+    def next_response(self, responses: list):
+        with self.lock:
+            response = responses[self.counter % len(responses)]
+            self.counter += 1
+            return response
+
+    def admit(self, config: MockConfig, tokens: int) -> tuple[bool, dict]:
+        """Sjekker RPM/TPM-grensene; returnerer (sluppet inn, x-ratelimit-headere)."""
+        with self.lock:
+            now = time.time()
+            while self.window and self.window[0][0] < now - 60:
+                self.window.popleft()
+            used_req = len(self.window)
+            used_tok = sum(t for _, t in self.window)
+            reset = (self.window[0][0] + 60 - now) if self.window else 0.0
+            headers = {}
+            if config.rpm:
+                headers["x-ratelimit-limit-requests"] = str(config.rpm)
+                headers["x-ratelimit-remaining-requests"] = str(max(0, config.rpm - used_req))
+                headers["x-ratelimit-reset-requests"] = f"{reset:.3f}s"
+            if config.tpm:
+                headers["x-ratelimit-limit-tokens"] = str(config.tpm)
+                headers["x-ratelimit-remaining-tokens"] = str(max(0, config.tpm - used_tok))
+                headers["x-ratelimit-reset-tokens"] = f"{reset:.3f}s"
+            if (config.rpm and used_req + 1 > config.rpm) or (config.tpm and used_tok + tokens > config.tpm):
+                return False, headers
+            self.window.append((now, tokens))
+            return True, headers
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "MockLLM/1.0"
+    protocol_version = "HTTP/1.1"  # keep-alive, som mot ekte API-er
+
+    def log_message(self, *args):
+        pass
+
+    @property
+    def config(self) -> MockConfig:
+        return self.server.config
+
+    @property
+    def state(self) -> _State:
+        return self.server.state
+
+    def _send_json(self, status: int, obj, headers: dict | None = None) -> None:
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    @staticmethod
+    def _error_body(message: str, err_type: str, code: str) -> dict:
+        return {"error": {"message": message, "type": err_type, "param": None, "code": code}}
+
+    def _error(self, status: int, message: str, err_type: str, code: str, headers: dict | None = None) -> None:
+        self._send_json(status, self._error_body(message, err_type, code), headers)
+
+    def do_GET(self):
+        path = self.path.rstrip("/")
+        if path.endswith("/stats"):
+            with self.state.lock:
+                self._send_json(200, dict(self.state.stats))
+        elif re.search(r"/batches/[^/]+$", path):
+            batch = self.state.batches.get(path.rsplit("/", 1)[1])
+            if batch is None:
+                self._error(404, f"No batch {path}", "invalid_request_error", "not_found")
+            else:
+                self._send_json(200, batch)
+        elif re.search(r"/files/[^/]+/content$", path):
+            content = self.state.files.get(path.split("/")[-2])
+            if content is None:
+                self._error(404, f"No file {path}", "invalid_request_error", "not_found")
+                return
+            body = content.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/jsonl")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._error(404, f"Unknown path {self.path}", "invalid_request_error", "not_found")
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        path = self.path.rstrip("/")
+        if path.endswith("/files"):
+            self._upload(body)
+            return
+        if path.endswith("/batches"):
+            self._create_batch(body)
+            return
+        if not path.endswith("/chat/completions"):
+            self._error(404, f"Unknown path {self.path}", "invalid_request_error", "not_found")
+            return
+        try:
+            payload = json.loads(body)
+            payload["messages"]
+        except (ValueError, KeyError, TypeError):
+            self._error(400, "Invalid JSON body", "invalid_request_error", "invalid_body")
+            return
+
+        status, response, headers = self._complete(payload)
+        if status != 200:
+            self._send_json(status, response, headers)
+            return
+        latency = max(0.0, self.config.latency())
+        if payload.get("stream"):
+            self._stream(response["model"], response["choices"][0]["message"]["content"], latency, headers)
+            return
+        time.sleep(latency)
+        self._send_json(200, response, headers)
+
+    def _complete(self, payload: dict) -> tuple[int, dict, dict]:
+        """Ett chat/completions-kall: (status, svar- eller feilobjekt, headere). Felles for kall og batcher."""
+        self.state.count("requests")
+        model = payload.get("model", "mock")
+        messages = payload["messages"]
+        prompt_tokens = sum(count_tokens(m.get("content") or "", model) + MESSAGE_OVERHEAD for m in messages)
+
+        if prompt_tokens > self.config.context_window:
+            self.state.count("context_errors")
+            return 400, self._error_body(
+                f"This model's maximum context length is {self.config.context_window} tokens. "
+                f"However, your messages resulted in {prompt_tokens} tokens. "
+                "Please reduce the length of the messages.",
+                "invalid_request_error", "context_length_exceeded",
+            ), {}
+
+        admitted, headers = self.state.admit(self.config, prompt_tokens)
+        if not admitted or random.random() < self.config.rate_429:
+            self.state.count("rate_limited")
+            headers["retry-after"] = f"{self.config.retry_after:g}"
+            return 429, self._error_body("Rate limit reached (mock). Please try again later.", "requests",
+                                         "rate_limit_exceeded"), headers
+
+        content = json.dumps(self.state.next_response(self.config.responses), ensure_ascii=False)
+        completion_tokens = count_tokens(content, model)
+        self.state.count("ok")
+        self.state.count("prompt_tokens", prompt_tokens)
+        self.state.count("completion_tokens", completion_tokens)
+        return 200, {
+            "id": f"chatcmpl-mock-{self.state.stats['requests']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }, headers
+
+    def _upload(self, body: bytes) -> None:
+        """POST /files (multipart/form-data): lagrer delen som heter "file"."""
+        match = re.search(r"boundary=([^;]+)", self.headers.get("Content-Type", ""))
+        content = None
+        if match:
+            for part in body.split(b"--" + match.group(1).strip('"').encode("latin-1")):
+                head, _, data = part.partition(b"\r\n\r\n")
+                if b'name="file"' in head:
+                    content = data.rsplit(b"\r\n", 1)[0].decode("utf-8")
+        if content is None:
+            self._error(400, "Expected multipart upload with a 'file' part", "invalid_request_error",
+                        "invalid_body")
+            return
+        file_id = self.state.add_file(content)
+        self._send_json(200, {"id": file_id, "object": "file", "bytes": len(content), "purpose": "batch"})
+
+    def _create_batch(self, body: bytes) -> None:
+        """POST /batches: kjører alle linjene i input-filen med én gang og lagrer output-/error-filene."""
+        try:
+            request = json.loads(body)
+            lines = [json.loads(line) for line in self.state.files[request["input_file_id"]].splitlines()
+                     if line.strip()]
+        except (ValueError, KeyError, TypeError):
+            self._error(400, "Invalid batch request", "invalid_request_error", "invalid_body")
+            return
+        output, errors = [], []
+        for line in lines:
+            status, response, _ = self._complete(line["body"])
+            result = {"id": f"batch-req-{len(output) + len(errors)}", "custom_id": line["custom_id"],
+                      "response": {"status_code": status, "body": response}, "error": None}
+            (output if status == 200 else errors).append(json.dumps(result, ensure_ascii=False))
+        batch = {
+            "object": "batch",
+            "endpoint": request.get("endpoint"),
+            "input_file_id": request["input_file_id"],
+            "status": "completed",
+            "output_file_id": self.state.add_file("\n".join(output)) if output else None,
+            "error_file_id": self.state.add_file("\n".join(errors)) if errors else None,
+            "request_counts": {"total": len(lines), "completed": len(output), "failed": len(errors)},
+        }
+        with self.state.lock:
+            batch["id"] = f"batch-mock-{len(self.state.batches)}"
+            self.state.batches[batch["id"]] = batch
+        self._send_json(200, dict(batch, status="validating"))
+
+    def _stream(self, model: str, content: str, latency: float, headers: dict) -> None:
+        """SSE-svar; latensen fordeles over bitene så 'time to first token' blir realistisk."""
+        pieces = [content[i:i+STREAM_PIECE] for i in range(0, len(content), STREAM_PIECE)] or [""]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.close_connection = True
+        delay = latency / (len(pieces) + 1)
+        try:
+            for piece in pieces:
+                time.sleep(delay)
+                chunk = {"object": "chat.completion.chunk", "model": model,
+                         "choices": [{"index": 0, "delta": {"content": piece}}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # klienten stoppet strømmen tidlig
+
+
+class MockLLMServer:
+    """Kjører stand-in-serveren i en bakgrunnstråd. port=0 velger en ledig port."""
+
+    def __init__(self, config: MockConfig | None = None, host: str = "127.0.0.1", port: int = 0):
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.config = config or MockConfig()
+        self.httpd.state = _State()
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        """Tilsvarer openai.api_base, f.eks. http://127.0.0.1:8089/v1."""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    @property
+    def stats(self) -> dict:
+        with self.httpd.state.lock:
+            return dict(self.httpd.state.stats)
+
+    def start(self) -> "MockLLMServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def parse_cli(argv=None):
+    ap = argparse.ArgumentParser(description="Lokal OpenAI-kompatibel testserver for chat/completions og batcher.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8089)
+    ap.add_argument("--latency", default="lognormal:1.5:0.5",
+                    help='"fixed:S", "uniform:MIN:MAKS" eller "lognormal:MEDIAN:SIGMA" (sekunder)')
+    ap.add_argument("--rate-429", type=float, default=0.0, help="Sannsynlighet for tilfeldig 429")
+    ap.add_argument("--rpm", type=int, help="Forespørsler per minutt før 429")
+    ap.add_argument("--tpm", type=int, help="Tokens per minutt før 429")
+    ap.add_argument("--retry-after", type=float, default=1.0)
+    ap.add_argument("--context-window", type=int, default=128000)
+    ap.add_argument("--response-file", help="JSON-fil med ett svarobjekt eller en liste av dem")
+    return ap.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_cli()
+    responses = None
+    if args.response_file:
+        with open(args.response_file, "r", encoding="utf-8") as f:
+            responses = json.load(f)
+    config = MockConfig(latency=args.latency, rate_429=args.rate_429, rpm=args.rpm, tpm=args.tpm,
+                        retry_after=args.retry_after, context_window=args.context_window,
+                        responses=responses)
+    server = MockLLMServer(config, args.host, args.port)
+    print(f"Mock LLM-server på {server.base_url} (Ctrl-C for å stoppe)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(json.dumps(server.stats, indent=2))
@@ -0,0 +1,98 @@
+"""
+Velger modell-nivå (tier) etter dokumentets størrelse i tokens.
+
+En kort pressemelding trenger ikke samme modell som en 300-siders
+årsrapport. Tierne i Settings().model_tiers leses i rekkefølge, og den første
+som har plass til teksten brukes:
+
+    ("small", "openai", "gpt-4o-mini", 30000)   -> billig og rask
+    ("standard", "openai", "gpt-4o", 120000)
+    ("large", "openai", "gpt-4.1", None)        -> langt kontekstvindu, ett kall
+
+Hvilken tier som tok hvert dokument logges i Settings().dispatch_log (CSV).
+"""
+import os
+import csv
+import threading
+from datetime import datetime
+from settings import Settings
+from llm_registry import LLMRegistry
+from openai_model import OpenAIModel
+from deepseek_model import DeepSeekModel
+from token_budget import count_tokens
+
+
+MODEL_CLASSES = {
+    "openai": OpenAIModel,
+    "deepseek": DeepSeekModel,
+}
+
+LOG_FIELDS = ["timestamp", "document", "text_tokens", "tier", "provider", "model"]
+
+
+class ModelDispatcher:
+    _log_lock = threading.Lock()
+
+    def __init__(self, instructions: str, tiers: list | None = None, log_path: str | None = None,
+                 json_mode: bool = False):
+        """
+        :param instructions: Systemprompt som brukes for alle tierne
+        :param tiers: [(navn, provider, modellnavn, maks tekst-tokens eller None), ...]
+                      i stigende rekkefølge; standard Settings().model_tiers
+        :param log_path: CSV-fil der valgt tier per dokument logges
+        :param json_mode: Be modellene om å svare med et gyldig JSON-objekt
+        """
+        settings = Settings()
+        self.instructions = instructions
+        self.json_mode = json_mode
+        self.tiers = list(tiers or settings.model_tiers)
+        self.log_path = log_path or settings.dispatch_log
+        if not self.tiers:
+            raise ValueError("ModelDispatcher trenger minst én tier.")
+        for name, provider, _, _ in self.tiers:
+            if provider not in MODEL_CLASSES:
+                raise ValueError(f"Ukjent provider '{provider}' for tier '{name}'.")
+
+    def choose_tier(self, text: str) -> tuple:
+        """Returnerer (tier, text_tokens) for første tier med plass til teksten."""
+        text_tokens = count_tokens(text, self.tiers[0][2])
+        for tier in self.tiers:
+            max_tokens = tier[3]
+            if max_tokens is None or text_tokens <= max_tokens:
+                return tier, text_tokens
+        # Større enn alle grensene: største tier, som chunker selv om nødvendig
+        return self.tiers[-1], text_tokens
+
+    def model_for(self, tier: tuple):
+        _, provider, model_name, _ = tier
+        return LLMRegistry().get_model(MODEL_CLASSES[provider], self.instructions, model_name,
+                                       json_mode=self.json_mode)
+
+    def run(self, text: str, document: str = "") -> str:
+        """
+        Kjører 'text' på modellen for riktig tier og logger valget.
+
+        :param text: Dokumentteksten
+        :param document: Navn på dokumentet i loggen (f.eks. PDF-filnavn)
+        :return: Modellens svar
+        """
+        tier, text_tokens = self.choose_tier(text)
+        name, provider, model_name, _ = tier
+        print(f"{document or 'Dokument'}: {text_tokens} tokens -> tier '{name}' ({model_name})")
+        response = self.model_for(tier).run(text)
+        self._log(document, text_tokens, tier)
+        return response
+
+    def _log(self, document: str, text_tokens: int, tier: tuple) -> None:
+        name, provider, model_name, _ = tier
+        with self._log_lock:
+            os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+            new_file = not os.path.exists(self.log_path)
+            with open(self.log_path, "a", newline="", encoding="utf-8") as csvfile:
+                writer = csv.writer(csvfile)
+                if new_file:
+                    writer.writerow(LOG_FIELDS)
+                writer.writerow([
+                    datetime.now().isoformat(timespec="seconds"), document, text_tokens,
+                    name, provider, model_name,
+                ])
@@ -0,0 +1,270 @@
+"""
+Offline batch-innsending til OpenAI sitt /v1/batches-endepunkt.
+
+Flyt: add() samler forespørsler -> submit() skriver JSONL, laster opp filen og
+oppretter batchen -> poll()/wait() følger status -> results() henter output-filen
+og mapper hvert svar tilbake via custom_id.
+
+All tilstand (forespørsler, fil-/batch-ID-er og hvilke svar som er hentet ut)
+lagres i en JSON-fil, så en avbrutt kjøring kan gjenopptas: finnes batch_id
+allerede, sendes ingenting på nytt. Forespørsler som feilet eller ikke ble
+besvart (f.eks. når batchen gikk ut på tid) sendes inn på nytt under samme
+navn med resubmit_failed(); den forrige batchen legges da i "history".
+
+Forbruket i hvert svar føres i forbruksregnskapet med record_usage(), med
+stage="batch" og batchrabatten (BATCH_DISCOUNT).
+
+Endepunktene nås med requests mot openai.api_base, så en lokal stand-in-server
+kan brukes i tester ved å sette api_base.
+"""
+import os
+import json
+import time
+import openai
+from llm_registry import LLMRegistry
+from budget_ledger import BudgetLedger, BATCH_DISCOUNT, estimate_cost, usage_labels
+
+
+FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+class OpenAIBatch:
+    def __init__(self, model, state_path: str, api_base: str | None = None, session=None,
+                 ledger: BudgetLedger | None = None):
+        """
+        :param model: OpenAIModel som gir modellnavn, instruksjoner og API-nøkkel
+        :param state_path: JSON-fil med batchens tilstand (gjenopptas hvis den finnes)
+        :param api_base: Overstyrer openai.api_base (f.eks. en lokal testserver)
+        :param ledger: Forbruksregnskapet record_usage() fører i (standard BudgetLedger.default())
+        """
+        self.model = model
+        self.ledger = ledger
+        self.usage = {}  # {custom_id: usage-blokk} fra siste results()
+        self.state_path = state_path
+        self.api_base = (api_base or openai.api_base).rstrip("/")
+        self.session = session or LLMRegistry().get_session("openai")
+        self.state = {
+            "model": model.model_name,
+            "requests": {},
+            "input_path": os.path.splitext(state_path)[0] + ".input.jsonl",
+            "input_file_id": None,
+            "batch_id": None,
+            "status": None,
+            "output_file_id": None,
+            "error_file_id": None,
+            "collected": [],
+            "failed": [],
+            "resend": None,
+            "history": [],
+        }
+        if os.path.exists(state_path):
+            with open(state_path, "r", encoding="utf-8") as f:
+                self.state.update(json.load(f))
+        os.makedirs(os.path.dirname(state_path) or ".", exist_ok=True)
+
+    # ------------------------------------------------------------------
+    # Tilstand
+    # ------------------------------------------------------------------
+    @property
+    def batch_id(self) -> str | None:
+        return self.state["batch_id"]
+
+    @property
+    def requests(self) -> dict:
+        return self.state["requests"]
+
+    def _save_state(self) -> None:
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.state_path)
+
+    def _batch_ids(self) -> list:
+        """custom_id-ene i gjeldende batch: alle, eller bare de som sendes på nytt (se resubmit_failed)."""
+        if self.state["resend"] is not None:
+            return list(self.state["resend"])
+        return list(self.requests)
+
+    def _headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.model.api_key}"}
+
+    def _request(self, method: str, path: str, **kwargs):
+        response = self.session.request(
+            method, f"{self.api_base}{path}", headers=self._headers(), timeout=60, **kwargs
+        )
+        response.raise_for_status()
+        return response
+
+    # ------------------------------------------------------------------
+    # Innsending
+    # ------------------------------------------------------------------
+    def add(self, custom_id: str, text: str, meta: dict | None = None) -> bool:
+        """
+        Legger til én forespørsel. Returnerer False hvis batchen allerede er sendt
+        eller custom_id finnes fra før (gjenopptatt kjøring).
+        """
+        if self.batch_id or custom_id in self.requests:
+            return False
+        messages = self.model.build_messages(text)
+        self.requests[custom_id] = {"meta": meta or {}, "messages": messages}
+        return True
+
+    def submit(self) -> str:
+        """Skriver JSONL, laster opp filen og oppretter batchen. Idempotent."""
+        if self.batch_id:
+            print(f"Batch {self.batch_id} er allerede sendt inn, gjenopptar.")
+            return self.batch_id
+        if not self.requests:
+            raise ValueError("Ingen forespørsler å sende inn.")
+
+        batch_ids = self._batch_ids()
+        with open(self.state["input_path"], "w", encoding="utf-8") as f:
+            for custom_id, req in self.requests.items():
+                if custom_id not in batch_ids:
+                    continue
+                line = {
+                    "custom_id": custom_id,
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": {
+                        "model": self.model.model_name,
+                        "messages": req["messages"],
+                        "temperature": 0.0,
+                    },
+                }
+                if getattr(self.model, "json_mode", False):
+                    line["body"]["response_format"] = {"type": "json_object"}
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+        if not self.state["input_file_id"]:
+            with open(self.state["input_path"], "rb") as f:
+                uploaded = self._request(
+                    "POST", "/files",
+                    files={"file": (os.path.basename(self.state["input_path"]), f)},
+                    data={"purpose": "batch"},
+                ).json()
+            self.state["input_file_id"] = uploaded["id"]
+            self._save_state()
+
+        batch = self._request("POST", "/batches", json={
+            "input_file_id": self.state["input_file_id"],
+            "endpoint": "/v1/chat/completions",
+            "completion_window": "24h",
+        }).json()
+        self.state["batch_id"] = batch["id"]
+        self.state["status"] = batch.get("status")
+        self._save_state()
+        print(f"Batch {batch['id']} sendt inn med {len(batch_ids)} forespørsler.")
+        return batch["id"]
+
+    # ------------------------------------------------------------------
+    # Oppfølging
+    # ------------------------------------------------------------------
+    def poll(self) -> str:
+        """Henter og lagrer status for batchen."""
+        if not self.batch_id:
+            raise ValueError("Batchen er ikke sendt inn ennå.")
+        batch = self._request("GET", f"/batches/{self.batch_id}").json()
+        self.state["status"] = batch.get("status")
+        self.state["output_file_id"] = batch.get("output_file_id")
+        self.state["error_file_id"] = batch.get("error_file_id")
+        self._save_state()
+        counts = batch.get("request_counts") or {}
+        print(
+            f"Batch {self.batch_id}: {self.state['status']} "
+            f"({counts.get('completed', 0)}/{counts.get('total', len(self.requests))} ferdige, "
+            f"{counts.get('failed', 0)} feilet)"
+        )
+        return self.state["status"]
+
+    def wait(self, poll_interval: float = 60.0) -> str:
+        """Poller til batchen har en endelig status."""
+        while True:
+            status = self.poll()
+            if status in FINAL_STATUSES:
+                return status
+            time.sleep(poll_interval)
+
+    def _read_file(self, file_id: str) -> list[dict]:
+        content = self._request("GET", f"/files/{file_id}/content").text
+        return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+    def results(self) -> dict:
+        """
+        Returnerer {custom_id: svartekst eller None ved feil} for alle forespørsler
+        som ikke allerede er markert som hentet ut. Vellykkede svar legges også
+        i modellens svar-cache, så et senere vanlig kjør av samme tekst er gratis.
+        Har batchen en endelig status, regnes forespørsler uten svarlinje (f.eks.
+        ved "expired") også som feilet. De feilede kan sendes på nytt med
+        resubmit_failed().
+        """
+        out = {}
+        lines = []
+        for key in ("output_file_id", "error_file_id"):
+            if self.state.get(key):
+                lines.extend(self._read_file(self.state[key]))
+
+        collected = set(self.state["collected"])
+        for line in lines:
+            custom_id = line.get("custom_id")
+            if custom_id not in self.requests or custom_id in collected:
+                continue
+            response = line.get("response") or {}
+            body = response.get("body") or {}
+            if line.get("error") or response.get("status_code") != 200 or not body.get("choices"):
+                print(f"Forespørsel {custom_id} feilet i batchen: {line.get('error') or body.get('error')}")
+                out[custom_id] = None
+                continue
+            self.model.store_in_cache(self.requests[custom_id]["messages"], 0.0, body)
+            self.usage[custom_id] = body.get("usage") or {}
+            out[custom_id] = body["choices"][0]["message"]["content"].strip()
+
+        if self.state["status"] in FINAL_STATUSES:
+            for custom_id in self._batch_ids():
+                if custom_id not in collected and custom_id not in out:
+                    print(f"Forespørsel {custom_id} ble ikke besvart (batchstatus '{self.state['status']}').")
+                    out[custom_id] = None
+        self.state["failed"] = [custom_id for custom_id, content in out.items() if content is None]
+        self._save_state()
+        return out
+
+    def resubmit_failed(self) -> str | None:
+        """
+        Sender forespørslene som feilet i forrige results() inn på nytt i en ny batch
+        under samme tilstandsfil. Returnerer den nye batch-ID-en, eller None hvis
+        ingenting feilet.
+        """
+        if self.state["status"] not in FINAL_STATUSES:
+            raise ValueError(f"Batch {self.batch_id} er ikke ferdig (status '{self.state['status']}').")
+        failed = [custom_id for custom_id in self.state["failed"] if custom_id not in self.state["collected"]]
+        if not failed:
+            return None
+        self.state["history"].append({key: self.state[key] for key in
+                                      ("batch_id", "status", "input_file_id", "output_file_id", "error_file_id")})
+        self.state.update(batch_id=None, status=None, input_file_id=None, output_file_id=None,
+                          error_file_id=None, failed=[], resend=failed)
+        self._save_state()
+        print(f"Sender {len(failed)} feilede forespørsler på nytt.")
+        return self.submit()
+
+    def record_usage(self, custom_id: str) -> None:
+        """
+        Fører forbruket for custom_id (fra siste results()) i forbruksregnskapet under
+        gjeldende usage_labels, med stage="batch" og prisen etter batchrabatten.
+        """
+        usage = self.usage.get(custom_id)
+        if not usage:
+            return
+        prompt_tokens = usage.get("prompt_tokens") or 0
+        completion_tokens = usage.get("completion_tokens") or 0
+        cost = estimate_cost(self.model.model_name, prompt_tokens, completion_tokens) * BATCH_DISCOUNT
+        ledger = self.ledger or BudgetLedger.default()
+        ledger.record("openai", 0, None, 0.0, cost)  # bare dagens kostnad; batcher bruker ikke RPM/TPM
+        with usage_labels(stage="batch"):
+            ledger.record_call("openai", self.model.model_name, prompt_tokens, completion_tokens, cost)
+
+    def mark_collected(self, custom_id: str) -> None:
+        """Markerer at svaret for custom_id er lagret, så det ikke behandles igjen."""
+        if custom_id not in self.state["collected"]:
+            self.state["collected"].append(custom_id)
+            self._save_state()
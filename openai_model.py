@@ -1,122 +1,270 @@
 import time
+import asyncio
 import openai
+from concurrent.futures import ThreadPoolExecutor
 from openai.error import InvalidRequestError, RateLimitError
 
 from llm_model import LLMModel  # Your original parent class
+from llm_registry import LLMRegistry
+from token_budget import plan_request, split_by_tokens
+from chunk_checkpoint import ChunkCheckpoint
+from budget_ledger import usage_labels, current_labels
 
 class OpenAIModel(LLMModel):
-    def __init__(self, instructions: str, model_name: str = "gpt-3.5-turbo"):
+    provider = "openai"
+
+    def __init__(self, instructions: str, model_name: str = "gpt-3.5-turbo", use_cache: bool = True,
+                 json_mode: bool = False):
         """
         Example: Hides OpenAI-specific setup (API key, model name, etc.).
         'instructions' is stored in self.instructions for use as the system prompt.
+        Prefer LLMRegistry().get_model(OpenAIModel, ...) to reuse instances.
+        With json_mode=True every call asks for a JSON object (response_format=json_object).
         """
-        super().__init__(instructions, model_name)  # Store instructions in self.instructions
-        
-        # Read API key from secrets.txt
-        openai.api_key = None
-        with open("secrets.txt", "r", encoding="utf-8") as f:
-            for line in f:
-                if line.startswith("OAI_Key="):
-                    openai.api_key = line.split("=", 1)[1].strip()
-                    break
+        super().__init__(instructions, model_name, use_cache, json_mode)  # Store instructions in self.instructions
         
-        if not openai.api_key:
+        # API key and HTTP session come from the shared registry: secrets.txt is
+        # read once per process, and all instances share one keep-alive pool.
+        registry = LLMRegistry()
+        self.api_key = registry.get_secret("OAI_Key")
+        if not self.api_key:
             raise ValueError("OpenAI API key not found in secrets.txt. Make sure it contains `OAI_Key=YOUR_KEY`.")
+        openai.requestssession = registry.get_session(self.provider)
 
     def _safe_openai_call(
         self,
         messages: list[dict],
         temperature: float = 0.0,
-        max_retries: int = 5,
-        initial_wait: float = 8.0  # seconds
+        max_retries: int = 8,
+        initial_wait: float = 2.0,  # seconds
+        stage: str = "single"
     ):
         """
         Calls openai.ChatCompletion.create with retries on RateLimitError.
         - 'max_retries': how many times to try before giving up
-        - 'initial_wait': how many seconds to wait on first retry
-          (could also do exponential backoff).
+        - 'initial_wait': base for the jittered exponential backoff
+        - 'stage': pipeline step the call is booked under in the usage ledger
+        Every attempt first draws from the machine-wide ledger (budget_ledger.py)
+        and the shared in-process RPM/TPM limiter (rate_limiter.py).
+        Successful responses are served from / stored in the shared response cache.
+        """
+        with usage_labels(stage=stage):
+            return self._cached(
+                messages,
+                temperature,
+                lambda: self._call_with_retries(messages, temperature, max_retries, initial_wait),
+            )
+
+    def _response_format(self, messages: list[dict]) -> dict:
+        """
+        Extra request parameters for JSON mode (empty when it is off).
+        The API rejects json_object unless the messages mention JSON, so such
+        calls (e.g. free-text rolling summaries) are sent without it.
         """
+        if not self.json_mode or not any("json" in m["content"].lower() for m in messages):
+            return {}
+        return {"response_format": {"type": "json_object"}}
+
+    def _call_with_retries(
+        self,
+        messages: list[dict],
+        temperature: float,
+        max_retries: int,
+        initial_wait: float
+    ):
+        """The actual (uncached) API call with RateLimitError retries."""
+        reservation = self._reserve(messages)
         for attempt in range(max_retries):
+            self._wait_for_capacity(reservation)
             try:
                 response = openai.ChatCompletion.create(
+                    api_key=self.api_key,  # per call, so instances don't share a global key
                     model=self.model_name,
                     messages=messages,
-                    temperature=temperature
+                    temperature=temperature,
+                    **self._response_format(messages)
                 )
+                self._settle(reservation, response.get("usage"))
                 return response
             except RateLimitError as e:
+                # The openai 0.x client only exposes headers on errors, so this is
+                # where the limiter learns the real limits and reset times.
+                hint = self._on_rate_limited(getattr(e, "headers", None))
+
                 # If we're out of retries, re-raise the error
                 if attempt == max_retries - 1:
                     raise
-                
-                # Otherwise, wait a bit and try again
-                # You can do exponential backoff if you prefer:
-                # wait_time = initial_wait * (2 ** attempt)
-                wait_time = initial_wait
-                print(f"RateLimitError: {e}. Waiting {wait_time} seconds before retry...")
+
+                wait_time = self.rate_limiter.backoff(attempt, initial_wait, hint)
+                print(f"RateLimitError: {e}. Waiting {wait_time:.1f} seconds before retry...")
                 time.sleep(wait_time)
         
         # If we somehow exit the loop (shouldn't happen normally), raise
         raise RuntimeError("Exhausted all retries for OpenAI call.")
 
+    async def _asafe_openai_call(
+        self,
+        messages: list[dict],
+        temperature: float = 0.0,
+        max_retries: int = 8,
+        initial_wait: float = 2.0,  # seconds
+        stage: str = "single"
+    ):
+        """Async version of '_safe_openai_call' (openai.ChatCompletion.acreate)."""
+        with usage_labels(stage=stage):
+            return await self._acached(
+                messages,
+                temperature,
+                lambda: self._acall_with_retries(messages, temperature, max_retries, initial_wait),
+            )
+
+    async def _acall_with_retries(
+        self,
+        messages: list[dict],
+        temperature: float,
+        max_retries: int,
+        initial_wait: float
+    ):
+        """Async version of '_call_with_retries'; waits with asyncio.sleep."""
+        # One pooled aiohttp session per event loop instead of one per request
+        openai.aiosession.set(LLMRegistry().get_async_session(self.provider))
+        reservation = self._reserve(messages)
+        for attempt in range(max_retries):
+            await self._await_capacity(reservation)
+            try:
+                response = await openai.ChatCompletion.acreate(
+                    api_key=self.api_key,
+                    model=self.model_name,
+                    messages=messages,
+                    temperature=temperature,
+                    **self._response_format(messages)
+                )
+                self._settle(reservation, response.get("usage"))
+                return response
+            except RateLimitError as e:
+                hint = self._on_rate_limited(getattr(e, "headers", None))
+                if attempt == max_retries - 1:
+                    raise
+                wait_time = self.rate_limiter.backoff(attempt, initial_wait, hint)
+                print(f"RateLimitError: {e}. Waiting {wait_time:.1f} seconds before retry...")
+                await asyncio.sleep(wait_time)
+
+        raise RuntimeError("Exhausted all retries for OpenAI call.")
+
     def _chunk_text(self, text: str, chunk_size: int = 2000) -> list[str]:
         """
-        Splits 'text' into chunks of approximately 'chunk_size' words.
-        You can adjust 'chunk_size' to fit your token or word limit needs.
+        Splits 'text' into chunks of at most 'chunk_size' tokens
+        (counted with the tokenizer for self.model_name, see token_budget).
         """
-        words = text.split()
-        chunks = []
-        for i in range(0, len(words), chunk_size):
-            chunk = " ".join(words[i : i+chunk_size])
-            chunks.append(chunk)
-        return chunks
+        return split_by_tokens(text, chunk_size, self.model_name)
+
+    def build_messages(self, text: str) -> list[dict]:
+        """The message list for a single call (also used for batch requests)."""
+        return [
+            {"role": "system", "content": self.instructions},
+            {"role": "user", "content": text}
+        ]
+
+    def fits_single_call(self, text: str) -> bool:
+        """True if 'text' fits in one call for this model (see token_budget)."""
+        return plan_request(self.model_name, self.instructions, text)["mode"] == "single"
 
     def _run_single_call(self, text: str) -> str:
         """
         Basic single-call approach to get the model's response.
         Raises InvalidRequestError or RateLimitError if something goes wrong.
         """
-        messages = [
-            {"role": "system", "content": self.instructions},
-            {"role": "user", "content": text}
-        ]
+        messages = self.build_messages(text)
         response = self._safe_openai_call(messages, temperature=0.0)
         return response["choices"][0]["message"]["content"].strip()
 
-    def _run_chunked(self, text: str, chunk_size: int = 2000) -> str:
+    def _run_chunked(
+        self,
+        text: str,
+        chunk_size: int | None = None,
+        strategy: str = "rolling",
+        max_workers: int = 8,
+        merge_fanin: int = 4
+    ) -> str:
         """
-        Splits the text into chunks, summarizing incrementally, then
-        returns a single final result at the end.
+        Splits the text into chunks and returns a single final result.
+        'chunk_size' is in tokens; None picks the largest size that fits the model.
+        - strategy="rolling": summarize incrementally, one chunk after the other.
+        - strategy="map_reduce": extract from all chunks concurrently, then merge
+          the partial extractions in a tree (see '_run_map_reduce').
+        Each chunk's intermediate result is checkpointed to disk (chunk_checkpoint.py),
+        so a rerun after a crash continues where the previous run stopped.
         """
+        if chunk_size is None:
+            chunk_size = plan_request(self.model_name, self.instructions, text, strategy)["chunk_tokens"]
         chunks = self._chunk_text(text, chunk_size=chunk_size)
-        summary_so_far = ""
+        checkpoint = self._open_checkpoint(text, strategy, chunk_size)
+        if strategy == "map_reduce":
+            answer = self._run_map_reduce(chunks, max_workers=max_workers, merge_fanin=merge_fanin,
+                                          checkpoint=checkpoint)
+            checkpoint.clear()
+            return answer
+        if strategy != "rolling":
+            raise ValueError(f"Unknown chunking strategy: {strategy!r}")
+
+        start, summary_so_far = self._rolling_resume_point(checkpoint)
 
         # --- STEP A: Summarize each chunk ---
-        for i, chunk in enumerate(chunks):
-            messages = [
-                {
-                    "role": "system",
-                    "content": (
-                        f"{self.instructions}\n\n"
-                        "You will receive text in chunks. Your job is to incorporate each chunk "
-                        "into an ongoing summary, preserving the important details."
-                    )
-                },
-                {
-                    "role": "assistant",
-                    "content": f"Current summary so far:\n{summary_so_far}"
-                },
-                {
-                    "role": "user",
-                    "content": f"Here is chunk #{i+1}:\n{chunk}\n\nUpdate the summary."
-                }
-            ]
-            response = self._safe_openai_call(messages, temperature=0.0)
+        for i in range(start, len(chunks)):
+            messages = self._rolling_messages(i, chunks[i], summary_so_far)
+            response = self._safe_openai_call(messages, temperature=0.0, stage="rolling")
             updated_summary = response["choices"][0]["message"]["content"].strip()
             summary_so_far = updated_summary
+            checkpoint.put("rolling", {"index": i, "summary": summary_so_far})
 
         # --- STEP B: Final step (one last call) ---
-        final_messages = [
+        final_response = self._safe_openai_call(self._final_messages(summary_so_far), temperature=0.0,
+                                                stage="final")
+        final_answer = final_response["choices"][0]["message"]["content"].strip()
+        checkpoint.clear()
+        return final_answer
+
+    def _open_checkpoint(self, text: str, strategy: str, chunk_size: int) -> ChunkCheckpoint:
+        """Checkpoint for this document + model + instructions + strategy + chunk size."""
+        checkpoint = ChunkCheckpoint.for_document(
+            self.model_name, self.instructions, strategy, chunk_size, text
+        )
+        if len(checkpoint):
+            print(f"Resuming from checkpoint {checkpoint.key[:12]} ({len(checkpoint)} saved steps).")
+        return checkpoint
+
+    @staticmethod
+    def _rolling_resume_point(checkpoint: ChunkCheckpoint) -> tuple[int, str]:
+        """(next chunk index, summary so far) for the rolling strategy."""
+        state = checkpoint.get("rolling")
+        if not state:
+            return 0, ""
+        return state["index"] + 1, state["summary"]
+
+    def _rolling_messages(self, index: int, chunk: str, summary_so_far: str) -> list[dict]:
+        """Messages for one step of the rolling summary."""
+        return [
+            {
+                "role": "system",
+                "content": (
+                    f"{self.instructions}\n\n"
+                    "You will receive text in chunks. Your job is to incorporate each chunk "
+                    "into an ongoing summary, preserving the important details."
+                )
+            },
+            {
+                "role": "assistant",
+                "content": f"Current summary so far:\n{summary_so_far}"
+            },
+            {
+                "role": "user",
+                "content": f"Here is chunk #{index+1}:\n{chunk}\n\nUpdate the summary."
+            }
+        ]
+
+    def _final_messages(self, summary_so_far: str) -> list[dict]:
+        """Messages for the final call after the rolling summary."""
+        return [
             {
                 "role": "system",
                 "content": (
@@ -134,32 +282,145 @@ class OpenAIModel(LLMModel):
                 "content": "Please provide the final answer or output."
             }
         ]
-        final_response = self._safe_openai_call(final_messages, temperature=0.0)
-        final_answer = final_response["choices"][0]["message"]["content"].strip()
-        return final_answer
 
-    def run(self, text: str, split_into_parts: bool = False, chunk_size: int = 2000) -> str:
+    def _extract_messages(self, index: int, total: int, chunk: str) -> list[dict]:
+        """Map step: extract what this one chunk contains, independent of the others."""
+        return [
+            {
+                "role": "system",
+                "content": (
+                    f"{self.instructions}\n\n"
+                    "You will receive one part of a longer document. Extract only what this "
+                    "part contains, in the requested output format. Leave out or set to null "
+                    "anything that is not found in this part."
+                )
+            },
+            {
+                "role": "user",
+                "content": f"Here is part #{index+1} of {total}:\n{chunk}"
+            }
+        ]
+
+    def _merge_messages(self, partials: list[str]) -> list[dict]:
+        """Reduce step: merge several partial extractions into one."""
+        joined = "\n\n".join(
+            f"--- Partial result #{i+1} ---\n{p}" for i, p in enumerate(partials)
+        )
+        return [
+            {
+                "role": "system",
+                "content": (
+                    f"{self.instructions}\n\n"
+                    "You will receive partial results extracted from different parts of the "
+                    "same document. Merge them into one result in the requested output format. "
+                    "Prefer concrete values over missing ones, and do not invent anything."
+                )
+            },
+            {
+                "role": "user",
+                "content": joined
+            }
+        ]
+
+    def _extract_from_chunk(self, index: int, total: int, chunk: str) -> str:
+        response = self._safe_openai_call(self._extract_messages(index, total, chunk), temperature=0.0,
+                                          stage="map")
+        return response["choices"][0]["message"]["content"].strip()
+
+    def _merge_partials(self, partials: list[str]) -> str:
+        if len(partials) == 1:
+            return partials[0]
+        response = self._safe_openai_call(self._merge_messages(partials), temperature=0.0, stage="merge")
+        return response["choices"][0]["message"]["content"].strip()
+
+    def _run_map_reduce(
+        self,
+        chunks: list[str],
+        max_workers: int = 8,
+        merge_fanin: int = 4,
+        checkpoint: ChunkCheckpoint | None = None
+    ) -> str:
         """
-        If 'split_into_parts' is False, try a single-call approach.
-        Otherwise, or if the single call fails due to context length,
-        run chunk-based summarization. We wrap calls in '_safe_openai_call'
-        to automatically retry on RateLimitError.
+        Runs the extraction for all chunks concurrently (map), then merges
+        the partial results 'merge_fanin' at a time, level by level, until
+        one result is left (reduce). Wall-clock time grows with
+        log(len(chunks)) instead of len(chunks).
+        With a 'checkpoint', every finished map/merge step is saved and
+        skipped on the next run.
         """
-        if not split_into_parts:
-            # Try single-call approach
+        if merge_fanin < 2:
+            raise ValueError("merge_fanin must be at least 2.")
+        if not chunks:
+            return ""
+
+        # Etikettene (selskap, PDF, ...) følger ikke med inn i pool-trådene av seg selv
+        labels = current_labels()
+
+        def _step(name, call):
+            done = checkpoint.get(name) if checkpoint is not None else None
+            if done is not None:
+                return done
+            with usage_labels(**labels):
+                result = call()
+            if checkpoint is not None:
+                checkpoint.put(name, result)
+            return result
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            total = len(chunks)
+            level = list(pool.map(
+                lambda args: _step(f"map-{args[0]}", lambda: self._extract_from_chunk(args[0], total, args[1])),
+                enumerate(chunks)
+            ))
+            depth = 0
+            while len(level) > 1:
+                depth += 1
+                groups = [level[i : i+merge_fanin] for i in range(0, len(level), merge_fanin)]
+                level = list(pool.map(
+                    lambda args, d=depth: _step(f"merge-{d}-{args[0]}", lambda: self._merge_partials(args[1])),
+                    enumerate(groups)
+                ))
+        return level[0]
+
+    def run(
+        self,
+        text: str,
+        split_into_parts: bool = False,
+        chunk_size: int | None = None,
+        strategy: str = "rolling"
+    ) -> str:
+        """
+        Sizes the request up front (see token_budget.plan_request):
+        if the text fits the model's context window, a single call is made;
+        otherwise, or if 'split_into_parts' is True, chunk-based processing
+        with the given 'strategy' ("rolling" or "map_reduce") is used.
+        'chunk_size' (tokens) overrides the computed chunk size.
+        We wrap calls in '_safe_openai_call' to automatically retry on RateLimitError.
+        """
+        plan = plan_request(self.model_name, self.instructions, text, strategy)
+        if chunk_size is None:
+            chunk_size = plan["chunk_tokens"]
+
+        if not split_into_parts and plan["mode"] == "single":
             try:
                 return self._run_single_call(text)
             except InvalidRequestError as e:
                 if "maximum context length" not in str(e):
                     # If it's some other error, just raise it
                     raise
-                # If it's a context-length problem, fall back to chunked approach below
+                # The token estimate was too optimistic; fall back to chunking below
+        else:
+            print(
+                f"Text is ~{plan['text_tokens']} tokens; using {strategy} chunking "
+                f"with {chunk_size}-token chunks for {self.model_name}."
+            )
 
-        # If single-call is not used or fails, do chunk-based summarization
+        # Safety net: only reached again if the token count was underestimated
+        # (e.g. without tiktoken installed).
         min_chunk_size = 200
         while True:
             try:
-                return self._run_chunked(text, chunk_size=chunk_size)
+                return self._run_chunked(text, chunk_size=chunk_size, strategy=strategy)
             except InvalidRequestError as e:
                 # if it's not about max context length, re-raise
                 if "maximum context length" not in str(e):
@@ -172,3 +433,109 @@ class OpenAIModel(LLMModel):
                         "Even with repeated chunk-size reductions, the text is too large. "
                         "Try summarizing the text further or switch to a larger-model context."
                     )
+
+    # ------------------------------------------------------------------
+    # Async interface: same strategies, driven from one event loop
+    # ------------------------------------------------------------------
+    async def _arun_single_call(self, text: str) -> str:
+        response = await self._asafe_openai_call(self.build_messages(text), temperature=0.0)
+        return response["choices"][0]["message"]["content"].strip()
+
+    async def _arun_chunked(
+        self,
+        text: str,
+        chunk_size: int | None = None,
+        strategy: str = "rolling",
+        max_concurrency: int = 8,
+        merge_fanin: int = 4
+    ) -> str:
+        """Async version of '_run_chunked'. 'max_concurrency' bounds in-flight map/merge calls."""
+        if chunk_size is None:
+            chunk_size = plan_request(self.model_name, self.instructions, text, strategy)["chunk_tokens"]
+        chunks = self._chunk_text(text, chunk_size=chunk_size)
+        checkpoint = self._open_checkpoint(text, strategy, chunk_size)
+
+        if strategy == "rolling":
+            start, summary_so_far = self._rolling_resume_point(checkpoint)
+            for i in range(start, len(chunks)):
+                response = await self._asafe_openai_call(
+                    self._rolling_messages(i, chunks[i], summary_so_far), temperature=0.0, stage="rolling"
+                )
+                summary_so_far = response["choices"][0]["message"]["content"].strip()
+                checkpoint.put("rolling", {"index": i, "summary": summary_so_far})
+            response = await self._asafe_openai_call(self._final_messages(summary_so_far), temperature=0.0,
+                                                     stage="final")
+            checkpoint.clear()
+            return response["choices"][0]["message"]["content"].strip()
+
+        if strategy != "map_reduce":
+            raise ValueError(f"Unknown chunking strategy: {strategy!r}")
+        if merge_fanin < 2:
+            raise ValueError("merge_fanin must be at least 2.")
+        if not chunks:
+            return ""
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def _call(name, messages):
+            done = checkpoint.get(name)
+            if done is not None:
+                return done
+            async with semaphore:
+                response = await self._asafe_openai_call(messages, temperature=0.0, stage=name.split("-")[0])
+            result = response["choices"][0]["message"]["content"].strip()
+            checkpoint.put(name, result)
+            return result
+
+        async def _merge(name, group):
+            return group[0] if len(group) == 1 else await _call(name, self._merge_messages(group))
+
+        total = len(chunks)
+        level = await asyncio.gather(
+            *(_call(f"map-{i}", self._extract_messages(i, total, chunk)) for i, chunk in enumerate(chunks))
+        )
+        depth = 0
+        while len(level) > 1:
+            depth += 1
+            groups = [level[i : i+merge_fanin] for i in range(0, len(level), merge_fanin)]
+            level = await asyncio.gather(*(_merge(f"merge-{depth}-{g}", group) for g, group in enumerate(groups)))
+        checkpoint.clear()
+        return level[0]
+
+    async def arun(
+        self,
+        text: str,
+        split_into_parts: bool = False,
+        chunk_size: int | None = None,
+        strategy: str = "rolling"
+    ) -> str:
+        """Async version of 'run', with the same up-front sizing and fallbacks."""
+        plan = plan_request(self.model_name, self.instructions, text, strategy)
+        if chunk_size is None:
+            chunk_size = plan["chunk_tokens"]
+
+        if not split_into_parts and plan["mode"] == "single":
+            try:
+                return await self._arun_single_call(text)
+            except InvalidRequestError as e:
+                if "maximum context length" not in str(e):
+                    raise
+        else:
+            print(
+                f"Text is ~{plan['text_tokens']} tokens; using {strategy} chunking "
+                f"with {chunk_size}-token chunks for {self.model_name}."
+            )
+
+        min_chunk_size = 200
+        while True:
+            try:
+                return await self._arun_chunked(text, chunk_size=chunk_size, strategy=strategy)
+            except InvalidRequestError as e:
+                if "maximum context length" not in str(e):
+                    raise
+                chunk_size = int(chunk_size * 0.8)
+                if chunk_size < min_chunk_size:
+                    raise RuntimeError(
+                        "Even with repeated chunk-size reductions, the text is too large. "
+                        "Try summarizing the text further or switch to a larger-model context."
+                    )
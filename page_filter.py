@@ -0,0 +1,136 @@
+"""
+Lokal forhåndsfiltrering av sider før LLM-kallet.
+
+Kvartalsrapporter er for det meste ansvarsfraskrivelser, bærekraftstekst og
+noter; KPI-ene står på noen få sider med resultatregnskap, balanse,
+kontantstrøm og høydepunkter. Hver side får en poengsum fra
+
+- treff på KPI-ord på norsk, svensk og engelsk (hvert ord teller én gang per
+  side, så en lang fortelling som gjentar "revenue" ikke slår en tabell)
+- talltetthet (andel "ord" som er tall), som er høy i tabeller
+- minus for typiske standardtekster (disclaimer, forward-looking, ESG)
+
+og sidene med høyest poengsum tas med til token-budsjettet er brukt, i
+opprinnelig siderekkefølge og merket med sidenummer. Får hele dokumentet
+plass i budsjettet, sendes det uendret. Får ingen side plass alene, sendes
+den beste siden kuttet til budsjettet, så dokumentet aldri blir tomt.
+"""
+import re
+from token_budget import count_tokens, split_by_tokens
+
+
+# Overskrifter på regnskapsoppstillinger og nøkkeltallsider veier tyngst
+STATEMENT_KEYWORDS = (
+    # norsk
+    "resultatregnskap", "balanse", "kontantstrøm", "nøkkeltall", "høydepunkter", "hovedpunkter",
+    # svensk
+    "resultaträkning", "balansräkning", "kassaflödesanalys", "kassaflöde", "nyckeltal",
+    "väsentliga händelser", "sammandrag",
+    # engelsk
+    "income statement", "statement of income", "profit and loss", "balance sheet",
+    "statement of financial position", "cash flow", "key figures", "highlights",
+)
+KPI_KEYWORDS = (
+    # norsk
+    "omsetning", "driftsinntekter", "driftsresultat", "resultat før skatt", "årsresultat",
+    "periodens resultat", "egenkapital", "resultat per aksje", "netto rentebærende gjeld",
+    "ordreinngang", "ordrereserve", "utbytte", "ebitda", "ebit",
+    # svensk
+    "nettoomsättning", "omsättning", "rörelseresultat", "resultat före skatt", "periodens resultat",
+    "eget kapital", "resultat per aktie", "nettoskuld", "orderingång", "orderstock", "utdelning",
+    # engelsk
+    "revenue", "net sales", "operating profit", "operating income", "profit before tax",
+    "net profit", "net income", "earnings per share", "equity", "net interest-bearing debt",
+    "order intake", "order backlog", "dividend", "margin",
+)
+BOILERPLATE_KEYWORDS = (
+    "disclaimer", "forward-looking", "ansvarsfraskrivelse", "framtidsinriktad", "fremtidsrettede",
+    "sustainability", "bærekraft", "hållbarhet", "esg", "taxonomy", "taksonomi",
+)
+
+STATEMENT_WEIGHT = 3.0
+KPI_WEIGHT = 1.0
+BOILERPLATE_WEIGHT = 2.0
+DENSITY_WEIGHT = 20.0  # talltetthet 0.3 (typisk tabell) gir 6 poeng
+MIN_PAGE_CHARS = 50  # nesten tomme sider (bilder, skillesider) får 0
+
+_NUMBER = re.compile(r"^[-+−(]?\d[\d.,  ]*%?\)?$")
+
+
+def _keyword_pattern(words) -> re.Pattern:
+    # Bare grense foran ordet, så bøyde former ("omsetningen", "balansen") også treffer
+    return re.compile(r"(?<!\w)(?:" + "|".join(re.escape(w) for w in words) + r")")
+
+
+_STATEMENT_RE = _keyword_pattern(STATEMENT_KEYWORDS)
+_KPI_RE = _keyword_pattern(KPI_KEYWORDS)
+_BOILERPLATE_RE = _keyword_pattern(BOILERPLATE_KEYWORDS)
+
+
+def numeric_density(text: str) -> float:
+    words = text.split()
+    if not words:
+        return 0.0
+    return sum(1 for w in words if _NUMBER.match(w)) / len(words)
+
+
+def score_page(text: str) -> float:
+    """Hvor sannsynlig det er at siden inneholder KPI-er; 0 eller lavere betyr sannsynligvis ikke."""
+    if len(text.strip()) < MIN_PAGE_CHARS:
+        return 0.0
+    lowered = text.lower()
+    score = STATEMENT_WEIGHT * len(set(_STATEMENT_RE.findall(lowered)))
+    score += KPI_WEIGHT * len(set(_KPI_RE.findall(lowered)))
+    score -= BOILERPLATE_WEIGHT * len(set(_BOILERPLATE_RE.findall(lowered)))
+    return score + DENSITY_WEIGHT * numeric_density(text)
+
+
+def select_pages(pages: list[str], max_tokens: int, model_name: str = "gpt-4o") -> list[int]:
+    """
+    Indeksene (0-basert, stigende) til sidene med høyest poengsum som får plass i 'max_tokens'.
+    Minst én side velges så lenge det finnes sider: er selv den beste for stor,
+    returneres bare den (prefilter_pages kutter den til budsjettet).
+    """
+    scores = [score_page(page) for page in pages]
+    relevant = any(score > 0 for score in scores)
+    if relevant:
+        ranked = sorted(range(len(pages)), key=lambda i: scores[i], reverse=True)
+    else:
+        ranked = list(range(len(pages)))  # ingenting ser ut som KPI-er: ta starten av dokumentet
+    chosen = []
+    used = 0
+    for i in ranked:
+        if relevant and scores[i] <= 0:
+            break
+        tokens = count_tokens(pages[i], model_name)
+        if used + tokens > max_tokens:
+            continue  # en mindre side lenger ned kan fortsatt få plass
+        chosen.append(i)
+        used += tokens
+    if not chosen and ranked:
+        chosen.append(ranked[0])
+    return sorted(chosen)
+
+
+def prefilter_pages(pages: list[str], max_tokens: int, model_name: str = "gpt-4o") -> tuple[str, dict]:
+    """
+    Teksten som sendes til LLM: hele dokumentet hvis det får plass i 'max_tokens',
+    ellers bare de mest KPI-relevante sidene. Returnerer (tekst, statistikk) med
+    "pages_in", "pages_out", "tokens_in" og "tokens_out".
+    """
+    full = "".join(page + "\n" for page in pages if page)
+    tokens_in = count_tokens(full, model_name)
+    if tokens_in <= max_tokens:
+        return full, {"pages_in": len(pages), "pages_out": len(pages), "tokens_in": tokens_in,
+                      "tokens_out": tokens_in}
+
+    chosen = select_pages(pages, max_tokens, model_name)
+    parts = []
+    for i in chosen:
+        page = pages[i]
+        if count_tokens(page, model_name) > max_tokens:
+            page = split_by_tokens(page, max_tokens, model_name)[0]
+        parts.append(f"--- Side {i + 1} ---\n{page}\n")
+    text = "".join(parts)
+    return text, {"pages_in": len(pages), "pages_out": len(chosen), "tokens_in": tokens_in,
+                  "tokens_out": count_tokens(text, model_name)}
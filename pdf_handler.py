@@ -1,9 +1,13 @@
 import os
 import csv
+import json
+import mmap
 import PyPDF2
 import requests
 from urllib.parse import urlparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from settings import Settings
+from pdf_text_cache import PDFTextCache
 
 """
 PDFHandler er en klasse designet for å håndtere nedlasting, lagring, og lesing av PDF-rapporter 
@@ -33,6 +37,113 @@ lagre og analysere kvartalsrapporter eller årsrapporter for ulike selskaper. De
 også brukes i andre sammenhenger der systematisk håndtering av PDF-dokumenter er nødvendig.
 """
 
+# Bumpes når uthentingen (eller formatet i PDFTextCache) endres, så gamle tekster ikke gjenbrukes.
+# Cachen lagrer sidene som en JSON-liste, så sidegrensene er tilgjengelige (se page_filter.py).
+EXTRACTOR_VERSION = f"pypdf2-{PyPDF2.__version__}-2"
+
+# Sider per jobb når én stor PDF deles opp mellom prosesser
+PAGES_PER_TASK = 25
+
+
+def _page_count(pdf_file: str) -> int:
+    with open(pdf_file, "rb") as f:
+        return len(PyPDF2.PdfReader(f).pages)
+
+
+def iter_pdf_pages(pdf_file: str, start: int = 0, stop: int | None = None):
+    """
+    Yields (page_no, text) for the pages of 'pdf_file' one at a time, with
+    page_no 1-based as in a PDF viewer ('start'/'stop' are 0-based indices).
+    The file is memory-mapped rather than read into memory, and each page
+    is parsed only when it is asked for, so a caller that stops early never
+    pays for the rest of the document and memory stays flat with report size.
+    """
+    with open(pdf_file, "rb") as f:
+        try:
+            stream = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # tom fil; la PyPDF2 gi den vanlige feilen
+            stream = None
+        try:
+            pages = PyPDF2.PdfReader(stream if stream is not None else f).pages
+            stop = len(pages) if stop is None else min(stop, len(pages))
+            for i in range(start, stop):
+                yield i + 1, pages[i].extract_text() or ""
+        finally:
+            if stream is not None:
+                stream.close()
+
+
+def _extract_pages(pdf_file: str, start: int = 0, stop: int | None = None) -> list[str]:
+    """Text of pages [start, stop) in order. Module-level so it can run in a ProcessPoolExecutor."""
+    return [text for _, text in iter_pdf_pages(pdf_file, start, stop)]
+
+
+def join_pages(pages) -> str:
+    """The document text for a list of page texts, as returned by extract_text_from_pdf."""
+    return "".join(page + "\n" for page in pages if page)
+
+
+def iter_extracted_pages(pdf_files: list[str], workers: int | None = None,
+                         pages_per_task: int = PAGES_PER_TASK):
+    """
+    Extracts text from many PDFs on a process pool, splitting each file into
+    page ranges of 'pages_per_task' so one large report also uses every core.
+    Yields (pdf_file, [page text, ...], error) as each file completes; exactly
+    one of pages/error is None. Page order within a file is preserved, and the
+    pages are identical to PDFHandler.extract_pages (and share its PDFTextCache
+    entries).
+    """
+    cache = PDFTextCache.default()
+    pending = {}
+    for pdf_file in pdf_files:
+        try:
+            key = cache.make_key(pdf_file, EXTRACTOR_VERSION)
+        except OSError as e:
+            yield pdf_file, None, e
+            continue
+        cached = cache.get(key)
+        if cached is not None:
+            yield pdf_file, json.loads(cached), None
+        else:
+            pending[pdf_file] = key
+    if not pending:
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        parts = {}
+        for pdf_file in pending:
+            try:
+                page_count = _page_count(pdf_file)
+            except Exception as e:
+                yield pdf_file, None, e
+                continue
+            ranges = [(start, min(start + pages_per_task, page_count))
+                      for start in range(0, page_count, pages_per_task)]
+            parts[pdf_file] = [None] * len(ranges)
+            if not ranges:
+                cache.put(pending[pdf_file], "[]")
+                yield pdf_file, [], None
+            for i, (start, stop) in enumerate(ranges):
+                futures[pool.submit(_extract_pages, pdf_file, start, stop)] = (pdf_file, i)
+
+        failed = set()
+        for future in as_completed(futures):
+            pdf_file, i = futures[future]
+            if pdf_file in failed:
+                continue
+            try:
+                parts[pdf_file][i] = future.result()
+            except Exception as e:
+                failed.add(pdf_file)
+                yield pdf_file, None, e
+                continue
+            if all(part is not None for part in parts[pdf_file]):
+                pages = [page for part in parts[pdf_file] for page in part]
+                cache.put(pending[pdf_file], json.dumps(pages, ensure_ascii=False))
+                yield pdf_file, pages, None
+
+
 class PDFHandler:
     def __init__(self, ticker: str):
         self.__ticker = ticker
@@ -70,14 +181,14 @@ class PDFHandler:
         read_files = self._get_read_files()
         all_files = [f for f in os.listdir(self.__ticker_path) if f.endswith(".pdf")]
 
-        combined_text = ""
+        parts = []
         newly_read_files = []
 
         for filename in all_files:
             if filename not in read_files:
                 file_path = os.path.join(self.__ticker_path, filename)
-                pdf_text = self.extract_text_from_pdf(file_path)
-                combined_text += f"\n--- Innhold fra {filename} ---\n" + pdf_text
+                parts.append(f"\n--- Innhold fra {filename} ---\n")
+                parts.append(self.extract_text_from_pdf(file_path))
                 newly_read_files.append(filename)
                 read_files.add(filename)
 
@@ -89,18 +200,29 @@ class PDFHandler:
             for f in already_read_files:
                 print(f)
 
-        return combined_text
+        return "".join(parts)
 
-    def extract_text_from_pdf(self, pdf_file: str) -> str:
-        """Extracts text from a PDF file using PyPDF2."""
-        text = ""
-        with open(pdf_file, "rb") as f:
-            reader = PyPDF2.PdfReader(f)
-            for page in reader.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
-        return text
+    def extract_text_from_pdf(self, pdf_file: str, workers: int = 1) -> str:
+        """
+        Extracts text from a PDF file using PyPDF2.
+        Results are cached on disk by file content (see PDFTextCache), so
+        reruns and retries of the same file skip the parsing.
+        With workers > 1, page ranges are extracted in parallel processes
+        (see iter_extracted_pages); the text is the same.
+        """
+        return join_pages(self.extract_pages(pdf_file, workers))
+
+    def extract_pages(self, pdf_file: str, workers: int = 1) -> list[str]:
+        """The text of each page, cached like extract_text_from_pdf."""
+        if workers > 1:
+            _, pages, error = next(iter_extracted_pages([pdf_file], workers))
+            if error is not None:
+                raise error
+            return pages
+        cached = PDFTextCache.default().cached_text(
+            pdf_file, EXTRACTOR_VERSION, lambda: json.dumps(_extract_pages(pdf_file), ensure_ascii=False)
+        )
+        return json.loads(cached)
 
     def _extract_filename_from_url(self, url: str) -> str:
         """Extracts the filename from a URL."""
@@ -164,11 +286,16 @@ class PDFHandler:
         return read_files
 
     def _update_read_files(self, read_files: set):
-        """Updates the CSV file with the processed filenames."""
-        with open(self.__read_files_csv, "w", newline="", encoding="utf-8") as csvfile:
+        """
+        Updates the CSV file with the processed filenames.
+        Writes to a temp file and renames it, so an interrupted run never leaves a truncated CSV.
+        """
+        tmp_csv = self.__read_files_csv + ".tmp"
+        with open(tmp_csv, "w", newline="", encoding="utf-8") as csvfile:
             writer = csv.writer(csvfile)
             for f in sorted(read_files):
                 writer.writerow([f])
+        os.replace(tmp_csv, self.__read_files_csv)
 
     def test_functions(self):
         """
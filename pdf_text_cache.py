@@ -0,0 +1,52 @@
+import gzip
+import hashlib
+from settings import Settings
+from disk_cache import DiskLRUCache
+
+
+class PDFTextCache(DiskLRUCache):
+    """
+    Disk-cache for tekst hentet ut av PDF-er, så samme fil ikke parses på nytt
+    ved omkjøringer, retries eller read_and_combine_pdfs.
+
+    Nøkkelen er hash av filens innhold pluss uttrekkerens versjon, så en fil som
+    endres eller en ny uthentingsmetode gir ny nøkkel, mens samme PDF under et
+    annet navn eller i en annen mappe gir treff. Teksten lagres gzip-komprimert,
+    én fil per nøkkel, med samme LRU-opprydding som LLMCache (se DiskLRUCache).
+    """
+
+    SUFFIX = ".txt.gz"
+    LABEL = "PDF-tekstcache"
+    READ_ERRORS = (OSError, EOFError, UnicodeDecodeError)
+
+    _default = None
+
+    @classmethod
+    def _from_settings(cls) -> "PDFTextCache":
+        settings = Settings()
+        return cls(settings.pdf_text_cache_dir, settings.pdf_text_cache_max_bytes)
+
+    @staticmethod
+    def make_key(pdf_file: str, extractor_version: str) -> str:
+        digest = hashlib.sha256()
+        with open(pdf_file, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        digest.update(f"|{extractor_version}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def _load(self, path: str) -> str:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return f.read()
+
+    def _dump(self, path: str, text: str) -> None:
+        with gzip.open(path, "wt", encoding="utf-8", compresslevel=6) as f:
+            f.write(text)
+
+    def cached_text(self, pdf_file: str, extractor_version: str, extract) -> str:
+        """Teksten for 'pdf_file' fra cachen, eller 'extract()' som så lagres."""
+        key = self.make_key(pdf_file, extractor_version)
+        text = self.get(key)
+        if text is not None:
+            return text
+        return self.put(key, extract())
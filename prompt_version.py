@@ -0,0 +1,146 @@
+"""
+Versjonering av resultater mot instruksjonene de ble laget med.
+
+Hvert resultat i results/ får en "_meta"-nøkkel med:
+
+- instructions_hash: hash av hele json_instructions.txt
+- global_version: hash av linjene i instruksjonene som ikke nevner noe KPI-felt
+  (rolle, format, generelle regler)
+- field_versions: {felt: hash av felttypen i skjemaet + linjene som nevner feltet
+  som eget ord + feltets verdi i JSON-eksempelet}
+
+JSON-eksempler i instruksjonene tas ut før linjene sammenlignes og hashes per
+nøkkel, så et nytt felt i eksempelet ikke endrer versjonen til de andre feltene
+på samme linje (eller feltet foran, som får et nytt komma).
+
+Endres bare beskrivelsen av ett felt, endres bare det feltets versjon, og
+recompute (AI_KPI.py --recompute) henter bare det feltet på nytt. Endres de
+generelle linjene, eller mangler resultatet "_meta", må hele dokumentet
+kjøres på nytt. Ren omformatering (mellomrom, tomme linjer) gir ingen ny versjon.
+"""
+import os
+import re
+import json
+import hashlib
+from datetime import datetime
+from kpi_schema import json_object_spans
+
+
+META_KEY = "_meta"
+
+# <pdf-navn>_<ÅÅÅÅMMDD>_<TTMMSS>.json, slik save_result() navngir resultatene
+_RESULT_NAME = re.compile(r"^(?P<stem>.+)_(?P<stamp>\d{8}_\d{6})\.json$")
+
+
+def _fingerprint(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+
+
+def _normalized_lines(instructions: str) -> list[str]:
+    return [" ".join(line.split()) for line in instructions.splitlines() if line.strip()]
+
+
+def _split_examples(instructions: str) -> tuple[str, dict]:
+    """(instruksjonene uten JSON-eksemplene, {nøkkel: verdien i eksempelet som JSON})."""
+    parts, examples, end = [], {}, 0
+    for start, stop, obj in json_object_spans(instructions):
+        parts.append(instructions[end:start])
+        end = stop
+        for key, value in obj.items():
+            examples[key] = json.dumps(value, ensure_ascii=False, sort_keys=True)
+    parts.append(instructions[end:])
+    return "".join(parts), examples
+
+
+def _mentions(field: str, line: str) -> bool:
+    # Hele ord, så "ebit" ikke treffer linjer om "ebitda"
+    return re.search(rf"(?<!\w){re.escape(field)}(?!\w)", line, re.IGNORECASE) is not None
+
+
+def prompt_versions(instructions: str, schema=None) -> dict:
+    """
+    Versjonene for 'instructions'. Uten skjema (KPISchema) kan ikke linjer
+    knyttes til felter; da er field_versions tom og hele prompten én versjon.
+    """
+    fields = dict(schema.fields) if schema is not None else {}
+    text, examples = _split_examples(instructions)
+    lines = _normalized_lines(text)
+
+    field_versions = {}
+    mentioned = set()
+    for field, field_type in fields.items():
+        hits = [i for i, line in enumerate(lines) if _mentions(field, line)]
+        mentioned.update(hits)
+        example = [f"eksempel: {examples[field]}"] if field in examples else []
+        field_versions[field] = _fingerprint("\n".join([field_type] + [lines[i] for i in hits] + example))
+
+    general = [line for i, line in enumerate(lines) if i not in mentioned]
+    # Nøkler i eksempelet som ikke er i skjemaet hører til de generelle reglene
+    general += [f"eksempel: {key}={value}" for key, value in examples.items() if key not in fields]
+    return {
+        "instructions_hash": _fingerprint(instructions),
+        "global_version": _fingerprint("\n".join(general)),
+        "field_versions": field_versions,
+    }
+
+
+def result_meta(instructions: str, schema=None, company: str = "", pdf_filename: str = "") -> dict:
+    """"_meta"-blokken som lagres sammen med et resultat."""
+    meta = prompt_versions(instructions, schema)
+    meta.update({
+        "company": company,
+        "pdf": pdf_filename,
+        "created": datetime.now().isoformat(timespec="seconds"),
+    })
+    return meta
+
+
+def affected_fields(meta: dict | None, current: dict) -> tuple[str, list]:
+    """
+    Hva som må kjøres på nytt for et resultat med 'meta' gitt de nåværende
+    versjonene 'current' (fra prompt_versions):
+
+    ("none", [])        resultatet er oppdatert
+    ("fields", [felt])  bare disse feltene er nye eller endret
+    ("full", [])        hele dokumentet må kjøres på nytt
+    """
+    if not meta or "global_version" not in meta:
+        return "full", []
+    if meta.get("instructions_hash") == current["instructions_hash"]:
+        return "none", []
+    if meta["global_version"] != current["global_version"] or not current["field_versions"]:
+        return "full", []
+    old = meta.get("field_versions", {})
+    changed = [field for field, version in current["field_versions"].items() if old.get(field) != version]
+    if not changed:
+        # Bare felter er fjernet, eller endringen var ren omformatering
+        return "none", []
+    return "fields", changed
+
+
+def latest_results(results_dir: str = "results") -> dict:
+    """
+    {pdf-navn (uten .pdf): (sti, data)} for det nyeste resultatet per PDF i 'results_dir'.
+    Filer som ikke kan leses som JSON-objekter hoppes over.
+    """
+    latest = {}
+    if not os.path.isdir(results_dir):
+        return latest
+    for filename in sorted(os.listdir(results_dir)):
+        match = _RESULT_NAME.match(filename)
+        if not match:
+            continue
+        path = os.path.join(results_dir, filename)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Hopper over '{path}': {e}")
+            continue
+        if not isinstance(data, dict):
+            continue
+        stem = match.group("stem")
+        # Sortert på navn, så et senere tidsstempel for samme PDF overskriver et tidligere
+        if stem not in latest or filename > os.path.basename(latest[stem][0]):
+            latest[stem] = (path, data)
+    return latest
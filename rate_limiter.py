@@ -0,0 +1,194 @@
+"""
+Adaptiv rate limiter for LLM-kall, delt av alle modellinstanser i prosessen.
+
+To token-bøtter per provider: én for forespørsler per minutt (RPM) og én for
+tokens per minutt (TPM). Bøttene justeres fortløpende fra rate-limit-headerne
+providerne sender (x-ratelimit-limit-*, x-ratelimit-remaining-*,
+x-ratelimit-reset-*), og fra faktisk token-forbruk i 'usage'-blokken.
+
+Ved 429 tømmes bøtta, slik at alle tråder venter sammen i stedet for å
+hamre løs, og hvert nytt forsøk venter med eksponentiell backoff med
+"full jitter" så samtidige kall ikke prøver igjen i takt.
+"""
+import re
+import time
+import asyncio
+import random
+import threading
+from settings import Settings
+
+
+# (RPM, TPM) for providere som ikke står i Settings().llm_rate_limits
+FALLBACK_LIMITS = (60, 20000)
+
+MAX_BACKOFF = 60.0  # sekunder
+
+
+def parse_reset(value: str) -> float | None:
+    """Tolker reset-verdier som '1s', '6m0s', '120ms' eller '0.5' til sekunder."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    total = 0.0
+    matched = False
+    for amount, unit in re.findall(r"([\d.]+)\s*(ms|h|m|s)", value):
+        matched = True
+        amount = float(amount)
+        total += {"ms": amount / 1000, "s": amount, "m": amount * 60, "h": amount * 3600}[unit]
+    return total if matched else None
+
+
+def limit_headers(headers) -> dict:
+    """x-ratelimit-limit-*/x-ratelimit-remaining-* som tall, f.eks. {"limit-tokens": 30000.0}."""
+    values = {}
+    for name, value in dict(headers or {}).items():
+        name = str(name).lower()
+        if not name.startswith(("x-ratelimit-limit-", "x-ratelimit-remaining-")):
+            continue
+        try:
+            values[name[len("x-ratelimit-"):]] = float(value)
+        except (TypeError, ValueError):
+            pass
+    return values
+
+
+class TokenBucket:
+    """Klassisk token-bøtte: 'capacity' enheter, fylles med capacity per 'period' sekunder."""
+
+    def __init__(self, capacity: float, period: float = 60.0):
+        self.capacity = float(capacity)
+        self.period = period
+        self.level = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / self.period
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, amount: float) -> float:
+        """Tar 'amount' hvis mulig og returnerer 0, ellers antall sekunder å vente."""
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            amount = min(amount, self.capacity)
+            if self.level >= amount:
+                self.level -= amount
+                return 0.0
+            return (amount - self.level) / self.rate
+
+    def give_back(self, amount: float) -> None:
+        with self.lock:
+            self.level = min(self.capacity, self.level + amount)
+
+    def take_more(self, amount: float) -> None:
+        """Trekker ekstra (kan gå i minus), f.eks. når faktisk forbruk var større enn estimert."""
+        with self.lock:
+            self.level -= amount
+
+    def sync(self, limit: float | None, remaining: float | None) -> None:
+        """Justerer bøtta etter det provideren rapporterer."""
+        with self.lock:
+            self._refill(time.monotonic())
+            if limit:
+                self.capacity = float(limit)
+            if remaining is not None:
+                self.level = min(self.level, float(remaining))
+
+    def drain(self, seconds: float | None = None) -> None:
+        """Tømmer bøtta, eventuelt slik at den først er tilgjengelig igjen om 'seconds'."""
+        with self.lock:
+            self._refill(time.monotonic())
+            self.level = -(seconds * self.rate) if seconds else 0.0
+
+
+class RateLimiter:
+    """RPM + TPM-begrensning for én provider. Hent delte instanser med for_provider()."""
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, rpm: float, tpm: float):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+
+    @classmethod
+    def for_provider(cls, provider: str) -> "RateLimiter":
+        with cls._instances_lock:
+            if provider not in cls._instances:
+                rpm, tpm = Settings().llm_rate_limits.get(provider, FALLBACK_LIMITS)
+                cls._instances[provider] = cls(rpm, tpm)
+            return cls._instances[provider]
+
+    def acquire(self, tokens: int) -> None:
+        """Blokkerer til både én forespørsel og 'tokens' tokens er tilgjengelig."""
+        while True:
+            wait = self.requests.try_take(1)
+            if wait == 0:
+                wait = self.tokens.try_take(tokens)
+                if wait == 0:
+                    return
+                self.requests.give_back(1)
+            time.sleep(wait)
+
+    async def aacquire(self, tokens: int) -> None:
+        """Som acquire(), men venter med asyncio.sleep så event-loopen ikke blokkeres."""
+        while True:
+            wait = self.requests.try_take(1)
+            if wait == 0:
+                wait = self.tokens.try_take(tokens)
+                if wait == 0:
+                    return
+                self.requests.give_back(1)
+            await asyncio.sleep(wait)
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: int | None) -> None:
+        """Korrigerer TPM-bøtta med faktisk forbruk fra svarets 'usage'-blokk."""
+        if actual_tokens is None:
+            return
+        diff = actual_tokens - estimated_tokens
+        if diff > 0:
+            self.tokens.take_more(diff)
+        elif diff < 0:
+            self.tokens.give_back(-diff)
+
+    def update_from_headers(self, headers) -> None:
+        """Mater bøttene med x-ratelimit-*-headere (hvis provideren sender dem)."""
+        if not headers:
+            return
+        values = limit_headers(headers)
+        self.requests.sync(values.get("limit-requests"), values.get("remaining-requests"))
+        self.tokens.sync(values.get("limit-tokens"), values.get("remaining-tokens"))
+
+    def on_rate_limited(self, headers=None) -> float | None:
+        """
+        Kalles ved 429. Tømmer bøttene så alle tråder pauser samtidig.
+        Returnerer providerens anbefalte ventetid (retry-after / reset), om den finnes.
+        """
+        self.update_from_headers(headers)
+        h = {str(k).lower(): v for k, v in dict(headers or {}).items()}
+        retry_after = parse_reset(h.get("retry-after"))
+        reset_requests = parse_reset(h.get("x-ratelimit-reset-requests"))
+        reset_tokens = parse_reset(h.get("x-ratelimit-reset-tokens"))
+
+        self.requests.drain(reset_requests or retry_after)
+        if reset_tokens:
+            self.tokens.drain(reset_tokens)
+        hints = [v for v in (retry_after, reset_requests, reset_tokens) if v]
+        return max(hints) if hints else None
+
+    @staticmethod
+    def backoff(attempt: int, base: float = 1.0, hint: float | None = None) -> float:
+        """Eksponentiell backoff med full jitter; aldri kortere enn providerens hint."""
+        delay = random.uniform(0, min(MAX_BACKOFF, base * (2 ** attempt)))
+        if hint:
+            delay = max(delay, hint + random.uniform(0, base))
+        return delay
@@ -12,6 +12,32 @@ class Settings:
         self.__pdf_root = "pdf/tickers"
         self.__jpeg_root = "jpeg/tickers"
         self.__data_root = "data"
+        self.__llm_cache_dir = "operation/llm_cache"
+        self.__llm_cache_max_bytes = 200 * 1024 * 1024
+        self.__budget_ledger_db = "operation/budget_ledger.sqlite"
+        self.__checkpoint_dir = "operation/checkpoints"
+        self.__daily_spend_cap = None  # USD per dag for alle prosesser, None = uten tak
+        # (RPM, TPM) per provider til x-ratelimit-*-headerne har fortalt oss de faktiske grensene
+        self.__llm_rate_limits = {
+            "openai": (500, 30000),
+            "deepseek": (300, 100000),
+        }
+        # (navn, provider, modell, maks tekst-tokens) i stigende rekkefølge; None = ingen grense
+        self.__model_tiers = [
+            ("small", "openai", "gpt-4o-mini", 30000),
+            ("standard", "openai", "gpt-4o", 120000),
+            ("large", "openai", "gpt-4.1", None),
+        ]
+        self.__dispatch_log = "operation/dispatch_log.csv"
+        # {felt: type}; finnes ikke filen, utledes skjemaet fra JSON-eksempelet i instruksjonene
+        self.__kpi_schema_file = "LLMText/kpi_schema.json"
+        # Gullsett for kpi_benchmark.py: <navn>.pdf (eller .txt) + <navn>.json med verifiserte KPI-er
+        self.__gold_dir = "data/gold"
+        self.__benchmark_results = "operation/benchmark_results.json"
+        self.__pdf_text_cache_dir = "operation/pdf_text_cache"
+        self.__pdf_text_cache_max_bytes = 500 * 1024 * 1024
+        # Token-budsjett for --prefilter (bare de mest KPI-relevante sidene sendes)
+        self.__prefilter_tokens = 12000
 
     @property
     def read_files_csv(self):
@@ -28,13 +54,59 @@ class Settings:
     @property
     def data_root(self):
         return self.__data_root
-    
 
+    @property
+    def llm_cache_dir(self):
+        return self.__llm_cache_dir
 
-# Usage
-settings1 = Settings()
-settings2 = Settings()
+    @property
+    def llm_cache_max_bytes(self):
+        return self.__llm_cache_max_bytes
 
-print(settings1 is settings2)  # True
-print(settings1.read_files_csv)  # operation/read_files.csv
+    @property
+    def budget_ledger_db(self):
+        return self.__budget_ledger_db
 
+    @property
+    def daily_spend_cap(self):
+        return self.__daily_spend_cap
+
+    @property
+    def llm_rate_limits(self):
+        return self.__llm_rate_limits
+
+    @property
+    def checkpoint_dir(self):
+        return self.__checkpoint_dir
+
+    @property
+    def model_tiers(self):
+        return self.__model_tiers
+
+    @property
+    def dispatch_log(self):
+        return self.__dispatch_log
+
+    @property
+    def kpi_schema_file(self):
+        return self.__kpi_schema_file
+
+    @property
+    def gold_dir(self):
+        return self.__gold_dir
+
+    @property
+    def benchmark_results(self):
+        return self.__benchmark_results
+
+    @property
+    def pdf_text_cache_dir(self):
+        return self.__pdf_text_cache_dir
+
+    @property
+    def pdf_text_cache_max_bytes(self):
+        return self.__pdf_text_cache_max_bytes
+
+    @property
+    def prefilter_tokens(self):
+        return self.__prefilter_tokens
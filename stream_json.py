@@ -0,0 +1,97 @@
+"""
+Inkrementell JSON-parser for strømmede LLM-svar.
+
+Mates med tekstbiter etter hvert som de kommer (feed), og rapporterer hvert
+toppnivå-felt i JSON-objektet så snart verdien er komplett. Da kan kallere
+begynne å validere/lagre felter før hele svaret er mottatt, og stoppe
+strømmen når alle felter de trenger er på plass.
+
+Tekst før første '{' (f.eks. ```json) ignoreres.
+"""
+import json
+
+
+class IncrementalJSONParser:
+    def __init__(self):
+        self.text = ""
+        self.fields = {}
+        self.done = False
+        self._pos = 0
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key_start = None
+        self._key = None
+        self._value_start = None
+
+    def feed(self, chunk: str) -> list[tuple]:
+        """Legger til 'chunk' og returnerer [(nøkkel, verdi), ...] for felter som ble komplette nå."""
+        self.text += chunk
+        completed = []
+        text = self.text
+        while self._pos < len(text) and not self.done:
+            ch = text[self._pos]
+            i = self._pos
+            self._pos += 1
+
+            if not self._started:
+                if ch == "{":
+                    self._started = True
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._key_start is not None and self._key is None \
+                            and self._value_start is None:
+                        self._key = json.loads(text[self._key_start : i+1])
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1 and self._key is None:
+                    self._key_start = i
+                continue
+
+            if self._depth == 1:
+                if ch == ":" and self._key is not None and self._value_start is None:
+                    self._value_start = i + 1
+                    continue
+                if ch in ",}":
+                    field = self._finish_value(text[self._value_start : i] if self._value_start else "")
+                    if field:
+                        completed.append(field)
+                    if ch == "}":
+                        self.done = True
+                    continue
+
+            if ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+        return completed
+
+    def _finish_value(self, raw: str):
+        key = self._key
+        self._key = None
+        self._key_start = None
+        self._value_start = None
+        raw = raw.strip()
+        if key is None or not raw:
+            return None
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            return None
+        self.fields[key] = value
+        return key, value
+
+    def has_all(self, keys) -> bool:
+        """True når alle 'keys' er mottatt."""
+        return all(k in self.fields for k in keys)
@@ -0,0 +1,69 @@
+import time
+import threading
+import unittest
+from unittest import mock
+
+try:
+    import AI_KPI
+except ImportError:  # openai/requests/PyPDF2 ikke installert
+    AI_KPI = None
+
+
+@unittest.skipIf(AI_KPI is None, "openai/requests/PyPDF2 er ikke installert")
+class TestRunConcurrently(unittest.TestCase):
+
+    def setUp(self):
+        self.unread = [{"filename": f"q{i}.pdf", "full_path": f"pdf/X/q{i}.pdf"} for i in range(6)]
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+        self.finished = []
+
+    def _extracted(self, paths, workers):
+        for path in paths:
+            yield path, [f"Omsetning {path}"], None
+
+    def _finish(self, pdf_handler, instructions, pdf_filename, pdf_text, route, company, scheduler=None):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(0.05)
+        with self.lock:
+            self.running -= 1
+        if pdf_filename == "q3.pdf":
+            raise RuntimeError("LLM-kallet feilet")
+        if pdf_filename == "q4.pdf":
+            return None  # tom PDF
+        with self.lock:
+            self.finished.append(pdf_filename)
+        return f"results/{pdf_filename}.json"
+
+    def test_bounded_concurrency_and_isolated_failures(self):
+        with mock.patch.object(AI_KPI, "iter_extracted_pages", self._extracted), \
+             mock.patch.object(AI_KPI, "_finish_pdf", self._finish):
+            counts = AI_KPI._run_concurrently(mock.Mock(), "X", "instr", self.unread, workers=2)
+        self.assertLessEqual(self.peak, 2)
+        self.assertEqual(sorted(self.finished), ["q0.pdf", "q1.pdf", "q2.pdf", "q5.pdf"])
+        self.assertEqual(counts, {"done": 4, "skipped": 1, "failed": 1})
+
+    def test_packed_periods_run_concurrently(self):
+        unread = [{"filename": name, "full_path": f"pdf/X/{name}"}
+                  for name in ["q1-2024.pdf", "q2-2024.pdf", "Q2 2024 presentasjon.pdf", "q3-2024.pdf"]]
+        groups = []
+
+        def finish_group(pdf_handler, instructions, company, period, texts, route="fixed", scheduler=None):
+            self._finish(pdf_handler, instructions, period, "", route, company)
+            with self.lock:
+                groups.append((period, sorted(texts)))
+
+        with mock.patch.object(AI_KPI, "iter_extracted_pages", self._extracted), \
+             mock.patch.object(AI_KPI, "_finish_pdf", self._finish), \
+             mock.patch.object(AI_KPI, "_finish_group", finish_group):
+            AI_KPI._run_packed(mock.Mock(), "X", "instr", unread, normalize=False, workers=3)
+        self.assertGreater(self.peak, 1)
+        self.assertEqual(sorted(self.finished), ["2024Q2", "q1-2024.pdf", "q3-2024.pdf"])
+        self.assertEqual(groups, [("2024Q2", ["Q2 2024 presentasjon.pdf", "q2-2024.pdf"])])
+
+
+if __name__ == "__main__":
+    unittest.main()
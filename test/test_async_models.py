@@ -0,0 +1,73 @@
+import os
+import json
+import asyncio
+import tempfile
+import unittest
+from unittest import mock
+from mock_llm_server import MockLLMServer, MockConfig
+
+try:
+    import openai
+    from llm_registry import LLMRegistry, aiohttp
+    from budget_ledger import BudgetLedger
+    from rate_limiter import RateLimiter
+    from openai_model import OpenAIModel
+    from deepseek_model import DeepSeekModel
+except ImportError:
+    aiohttp = None
+
+
+@unittest.skipIf(aiohttp is None, "openai/aiohttp er ikke installert")
+class TestAsyncModels(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        ledger = BudgetLedger(os.path.join(self.tmp.name, "ledger.sqlite"), limits={"openai": (6000, 10 ** 7),
+                                                                                    "deepseek": (6000, 10 ** 7)})
+        self.patches = [
+            mock.patch.object(LLMRegistry, "get_secret", return_value="test"),
+            mock.patch.object(BudgetLedger, "default", return_value=ledger),
+            mock.patch.object(RateLimiter, "for_provider", side_effect=lambda provider: RateLimiter(6000, 10 ** 7)),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.tmp.cleanup()
+
+    def _run_all(self, model, texts):
+        async def _main():
+            results = await asyncio.gather(*(model.arun(text) for text in texts))
+            return results, list(LLMRegistry()._LLMRegistry__async_sessions.values())
+        return LLMRegistry().run_async(_main())
+
+    def test_deepseek_arun_closes_sessions(self):
+        config = MockConfig(responses=[{"omsetning": 1}])
+        with MockLLMServer(config) as server, \
+             mock.patch.object(DeepSeekModel, "api_url", f"{server.base_url}/chat/completions"):
+            model = DeepSeekModel("Svar med JSON.", use_cache=False)
+            results, sessions = self._run_all(model, ["a", "b", "c"])
+            self.assertEqual(server.stats["ok"], 3)
+        self.assertEqual([json.loads(r) for r in results], [{"omsetning": 1}] * 3)
+        self.assertEqual(len(sessions), 1)  # én delt session for alle kallene
+        self.assertTrue(sessions[0].closed)
+
+    def test_openai_arun(self):
+        config = MockConfig(responses=[{"omsetning": 2}])
+        with MockLLMServer(config) as server, mock.patch.object(openai, "api_base", server.base_url):
+            model = OpenAIModel("Svar med JSON.", "gpt-4o", use_cache=False)
+            results, sessions = self._run_all(model, ["a", "b"])
+        self.assertEqual([json.loads(r) for r in results], [{"omsetning": 2}] * 2)
+        self.assertTrue(all(session.closed for session in sessions))
+
+    def test_deepseek_network_error_becomes_error_json(self):
+        model = DeepSeekModel("Svar med JSON.", use_cache=False)
+        with mock.patch.object(DeepSeekModel, "api_url", "http://127.0.0.1:9/chat/completions"):
+            result = LLMRegistry().run_async(model.arun("a"))
+        self.assertIn("error", json.loads(result))
+
+
+if __name__ == "__main__":
+    unittest.main()
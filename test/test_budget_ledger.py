@@ -0,0 +1,104 @@
+import os
+import asyncio
+import tempfile
+import unittest
+from budget_ledger import BudgetLedger, BudgetExceeded, usage_labels
+from budget_scheduler import BudgetScheduler
+
+
+class TestBudgetLedger(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = os.path.join(self.tmp.name, "ledger.sqlite")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _ledger(self, worker, **kwargs):
+        return BudgetLedger(self.db, limits={"openai": (10, 10000)}, worker_id=worker, **kwargs)
+
+    def test_global_limit_is_shared_between_workers(self):
+        a, b = self._ledger("a"), self._ledger("b")
+        for _ in range(5):
+            self.assertEqual(a.try_acquire("openai", 100), 0)
+        for _ in range(5):
+            self.assertEqual(b.try_acquire("openai", 100), 0)
+        self.assertGreater(a.try_acquire("openai", 100), 0)
+        self.assertGreater(b.try_acquire("openai", 100), 0)
+
+    def test_active_workers_get_a_fair_share(self):
+        a, b = self._ledger("a"), self._ledger("b")
+        self.assertEqual(b.try_acquire("openai", 100), 0)
+        granted = 0
+        while a.try_acquire("openai", 100) == 0:
+            granted += 1
+        self.assertEqual(granted, 5)  # halvparten av 10 RPM når to workers er aktive
+
+    def test_oversized_request_is_charged_in_full(self):
+        a = self._ledger("a")
+        self.assertEqual(a.try_acquire("openai", 25000), 0)  # større enn TPM, men vinduet er tomt
+        used = a._connect().execute("SELECT SUM(tokens) FROM usage").fetchone()[0]
+        self.assertEqual(used, 25000)
+        self.assertGreater(a.try_acquire("openai", 100), 0)
+
+    def test_limits_from_headers_are_shared(self):
+        a, b = self._ledger("a"), self._ledger("b")
+        a.update_from_headers("openai", {"x-ratelimit-limit-requests": "2", "x-ratelimit-limit-tokens": "90000",
+                                         "x-ratelimit-remaining-requests": "1"})
+        self.assertEqual(b._limits(b._connect(), "openai"), (2, 90000))
+        self.assertEqual(b.try_acquire("openai", 50000), 0)  # over den konfigurerte TPM-en på 10000
+        self.assertEqual(b.try_acquire("openai", 100), 0)
+        self.assertGreater(b.try_acquire("openai", 100), 0)  # RPM = 2
+
+    def test_aacquire(self):
+        ledger = self._ledger("a")
+        asyncio.run(ledger.aacquire("openai", 100, est_cost=0.01))
+        self.assertAlmostEqual(ledger.spent_today(), 0.01)
+
+    def test_daily_spend_cap(self):
+        ledger = self._ledger("a", daily_spend_cap=1.0)
+        self.assertEqual(ledger.try_acquire("openai", 100, est_cost=0.6), 0)
+        ledger.record("openai", 100, 100, estimated_cost=0.6, actual_cost=0.5)
+        self.assertAlmostEqual(ledger.spent_today(), 0.5)
+        with self.assertRaises(BudgetExceeded):
+            ledger.try_acquire("openai", 100, est_cost=0.6)
+
+    def test_calls_are_booked_under_current_labels(self):
+        ledger = self._ledger("a")
+        with usage_labels(company="X", document="a.pdf", run="r1"):
+            ledger.record_call("openai", "gpt-4o", 1000, 100, 0.01)
+            with usage_labels(stage="repair"):
+                ledger.record_call("openai", "gpt-4o", 200, 50, 0.002)
+        with usage_labels(company="Y", document="b.pdf"):
+            ledger.record_call("deepseek", "deepseek-chat", 500, 100, 0.001)
+
+        by_company = {r["company"]: r for r in ledger.usage_summary("company")}
+        self.assertEqual(by_company["X"]["calls"], 2)
+        self.assertAlmostEqual(by_company["X"]["cost"], 0.012)
+        stages = {r["stage"] for r in ledger.usage_summary("stage", company="X")}
+        self.assertEqual(stages, {"single", "repair"})
+        self.assertEqual(ledger.usage_totals(run="r1"), (1350, 0.012))
+
+    def test_scheduler_stops_when_budget_is_reached(self):
+        ledger = self._ledger("a")
+        scheduler = BudgetScheduler(max_cost=0.05, ledger=ledger)
+        items = scheduler.order([{"key": "stor", "tokens": 9000, "cost": 0.03},
+                                 {"key": "liten", "tokens": 1000, "cost": 0.01},
+                                 {"key": "middels", "tokens": 5000, "cost": 0.02}])
+        self.assertEqual([i["key"] for i in items], ["liten", "middels", "stor"])
+
+        started = []
+        for item in items:
+            if not scheduler.try_start(item["key"], item["tokens"], item["cost"]):
+                continue
+            with usage_labels(run=scheduler.run_id):
+                ledger.record_call("openai", "gpt-4o", item["tokens"], 0, item["cost"])
+            scheduler.finish(item["key"])
+            started.append(item["key"])
+        self.assertEqual(started, ["liten", "middels"])
+        self.assertEqual(scheduler.skipped, ["stor"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import tempfile
+import unittest
+from chunk_checkpoint import ChunkCheckpoint
+
+try:
+    from openai_model import OpenAIModel
+except ImportError:
+    OpenAIModel = None
+
+
+class TestChunkCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _checkpoint(self, text="dokument", strategy="rolling"):
+        return ChunkCheckpoint.for_document("gpt-4o", "instr", strategy, 1000, text, directory=self.tmp.name)
+
+    def test_survives_reopen_and_clear_removes_it(self):
+        cp = self._checkpoint()
+        cp.put("rolling", {"index": 3, "summary": "s"})
+        self.assertEqual(self._checkpoint().get("rolling"), {"index": 3, "summary": "s"})
+        self.assertIsNone(self._checkpoint(text="annet").get("rolling"))
+        self.assertIsNone(self._checkpoint(strategy="map_reduce").get("rolling"))
+        cp.clear()
+        self.assertEqual(len(self._checkpoint()), 0)
+
+    @unittest.skipIf(OpenAIModel is None, "openai er ikke installert")
+    def test_map_reduce_resumes_after_failure(self):
+        calls = []
+
+        class _Model(OpenAIModel):
+            fail_on = None
+
+            def __init__(self):
+                pass
+
+            def _extract_from_chunk(self, index, total, chunk):
+                calls.append(chunk)
+                if chunk == self.fail_on:
+                    raise RuntimeError("nettverksfeil")
+                return chunk.upper()
+
+            def _merge_partials(self, group):
+                return group[0] if len(group) == 1 else "+".join(group)
+
+        model = _Model()
+        chunks = ["a", "b", "c", "d"]
+        model.fail_on = "d"  # siste chunk, så a, b og c alltid er ferdige når feilen kommer
+        with self.assertRaises(RuntimeError):
+            model._run_map_reduce(chunks, max_workers=1, merge_fanin=2, checkpoint=self._checkpoint())
+
+        calls.clear()
+        model.fail_on = None
+        result = model._run_map_reduce(chunks, max_workers=1, merge_fanin=2, checkpoint=self._checkpoint())
+        self.assertEqual(result, "A+B+C+D")
+        self.assertEqual(calls, ["d"])  # a, b og c ble lagret i første kjøring
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+from doc_packing import document_period, group_by_period, pack_documents
+
+SHARED = "Omsetningen i kvartalet økte med 12 prosent til 1 234 MNOK drevet av industri."
+
+
+class TestDocPacking(unittest.TestCase):
+
+    def test_period_from_filename(self):
+        self.assertEqual(document_period("Kitron 2024 Q4 Report.pdf"), "2024Q4")
+        self.assertEqual(document_period("q3-2023-presentation.pdf"), "2023Q3")
+        self.assertEqual(document_period("Rapport 2. kvartal 2024.pdf"), "2024Q2")
+        self.assertEqual(document_period("4Q 2022 results.pdf"), "2022Q4")
+        self.assertIsNone(document_period("Årsrapport 2024.pdf"))
+
+    def test_groups_by_period(self):
+        groups = group_by_period(["Kitron 2024 Q4 Report.pdf", "Kitron 2024 Q4 Presentation.pdf",
+                                  "Kitron 2024 Q3 Report.pdf", "Årsrapport 2024.pdf"])
+        self.assertEqual(sorted(groups["2024Q4"]), ["Kitron 2024 Q4 Presentation.pdf", "Kitron 2024 Q4 Report.pdf"])
+        self.assertEqual(groups["Årsrapport 2024.pdf"], ["Årsrapport 2024.pdf"])
+
+    def test_drops_repeated_lines_but_keeps_short_ones(self):
+        report = "\n".join([SHARED, "MNOK", "EBITDA ble 210 MNOK, opp fra 180 MNOK i fjor, godt hjulpet av miks."])
+        presentation = "\n".join(["Høydepunkter", "MNOK", "  " + SHARED + " "])
+        packed, stats = pack_documents({"rapport.pdf": report, "presentasjon.pdf": presentation})
+        self.assertEqual(packed.count("Omsetningen i kvartalet"), 1)
+        self.assertEqual(packed.splitlines().count("MNOK"), 2)
+        self.assertIn("Høydepunkter", packed)
+        self.assertEqual(stats["dropped_lines"], 1)
+        self.assertLess(packed.index("rapport.pdf"), packed.index("presentasjon.pdf"))
+
+    def test_drops_translated_duplicate(self):
+        numbers = [f"{100 + i * 7},{i}" for i in range(30)]
+        norsk = "\n".join(f"Linje {i}: verdien var {n} MNOK i kvartalet" for i, n in enumerate(numbers))
+        english = "\n".join(f"Line {i}: value was {n} NOKm" for i, n in enumerate(numbers))
+        packed, stats = pack_documents({"rapport.pdf": norsk, "report_en.pdf": english})
+        self.assertEqual(stats["dropped_documents"], ["report_en.pdf"])
+        self.assertNotIn("Line 0", packed)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import os
+import json
+import tempfile
+import unittest
+
+try:
+    from kpi_benchmark import KPIBenchmark, score_fields, recommend, parse_config
+    from budget_ledger import BudgetLedger
+except ImportError:  # openai/requests ikke installert
+    KPIBenchmark = None
+
+
+class _FakeModel:
+    """Svarer fra en 'cache' etter første kall, slik den ekte svar-cachen gjør."""
+
+    def __init__(self, ledger, answer):
+        self.ledger = ledger
+        self.answer = answer
+        self.seen = set()
+
+    def run(self, text, **kwargs):
+        if text not in self.seen:
+            self.seen.add(text)
+            self.ledger.record_call("openai", "gpt-4o-mini", 1000, 100, 0.0002)
+        return json.dumps(self.answer)
+
+
+@unittest.skipIf(KPIBenchmark is None, "openai/requests er ikke installert")
+class TestKPIBenchmark(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.ledger = BudgetLedger(os.path.join(self.tmp.name, "ledger.sqlite"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_score_fields(self):
+        gold = {"omsetning": 1234.5, "valuta": "NOK", "utbytte": None, "oppsummering": "x" * 500}
+        predicted = {"omsetning": "1 234,5", "valuta": " nok ", "utbytte": 2.0, "oppsummering": "annet"}
+        self.assertEqual(score_fields(predicted, gold), {"omsetning": True, "valuta": True, "utbytte": False})
+
+    def test_rerun_replays_measurements_from_first_run(self):
+        docs = [{"name": "q1", "text": "rapport", "gold": {"omsetning": 10, "ebitda": 2}}]
+        model = _FakeModel(self.ledger, {"omsetning": 10, "ebitda": 3})
+        results_path = os.path.join(self.tmp.name, "results.json")
+        config = parse_config("gpt-4o-mini:single")
+
+        def _run():
+            bench = KPIBenchmark("instr", docs, results_path=results_path, ledger=self.ledger)
+            bench.model_for = lambda cfg, use_cache=True: model
+            return bench.run([config])[0]
+
+        first, second = _run(), _run()
+        self.assertEqual(first["accuracy"], 0.5)
+        self.assertEqual(first["calls"], 1)
+        self.assertEqual(second["replayed"], 1)
+        self.assertEqual(second["calls"], 1)
+        self.assertAlmostEqual(second["cost"], first["cost"])
+
+    def test_warm_cache_is_bypassed_without_stored_measurement(self):
+        docs = [{"name": "q1", "text": "rapport", "gold": {"omsetning": 10}}]
+        warm = _FakeModel(self.ledger, {"omsetning": 10})
+        warm.seen.add("rapport")  # svaret ligger allerede i cachen fra en produksjonskjøring
+        cold = _FakeModel(self.ledger, {"omsetning": 10})
+        bench = KPIBenchmark("instr", docs, results_path=os.path.join(self.tmp.name, "r.json"), ledger=self.ledger)
+        bench.model_for = lambda cfg, use_cache=True: warm if use_cache else cold
+        row = bench.run([parse_config("gpt-4o-mini:single")])[0]
+        self.assertEqual((row["calls"], row["tokens"], row["unmeasured"]), (1, 1100, 0))
+        self.assertEqual(recommend([row], 0.9)["config"], "gpt-4o-mini:single")
+
+    def test_unmeasured_config_is_not_recommended(self):
+        docs = [{"name": "q1", "text": "rapport", "gold": {"omsetning": 10}}]
+        model = _FakeModel(self.ledger, {"omsetning": 10})
+        model.seen.add("rapport")
+        bench = KPIBenchmark("instr", docs, results_path=os.path.join(self.tmp.name, "r.json"), ledger=self.ledger)
+        bench.model_for = lambda cfg, use_cache=True: model
+        row = bench.run([parse_config("gpt-4o-mini:single")])[0]
+        self.assertEqual(row["unmeasured"], 1)
+        self.assertIsNone(recommend([row], 0.9))
+
+    def test_recommend_picks_cheapest_good_enough(self):
+        report = [
+            {"config": "dyr", "accuracy": 0.98, "cost": 1.0, "wall": 5, "failed": 0},
+            {"config": "billig", "accuracy": 0.92, "cost": 0.1, "wall": 9, "failed": 0},
+            {"config": "for_svak", "accuracy": 0.7, "cost": 0.01, "wall": 1, "failed": 0},
+        ]
+        self.assertEqual(recommend(report, 0.9)["config"], "billig")
+        self.assertIsNone(recommend(report, 0.99))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import json
+import unittest
+from kpi_schema import KPISchema, parse_response, to_number
+
+INSTRUCTIONS = """
+Du skal hente nøkkeltall fra kvartalsrapporten. Svar med JSON på formen:
+{"omsetning": 0.0, "ebitda": 0.0, "antall_ansatte": 0, "500tegnoppsummering": ""}
+"""
+
+
+class _FakeModel:
+    model_name = "gpt-4o"
+
+    def __init__(self, answer):
+        self.answer = answer
+        self.prompts = []
+
+    def run(self, text):
+        self.prompts.append(text)
+        return json.dumps(self.answer)
+
+
+class TestKPISchema(unittest.TestCase):
+
+    def setUp(self):
+        self.schema = KPISchema.from_instructions(INSTRUCTIONS)
+
+    def test_infers_fields_from_instructions(self):
+        self.assertEqual(self.schema.fields, {
+            "omsetning": "number", "ebitda": "number",
+            "antall_ansatte": "number", "500tegnoppsummering": "string",
+        })
+
+    def test_integer_placeholder_accepts_decimals(self):
+        schema = KPISchema.from_instructions('{"omsetning": 0, "500tegnoppsummering": ""}')
+        self.assertEqual(schema.fields["omsetning"], "number")
+        data, problems = schema.validate({"omsetning": "12,5", "500tegnoppsummering": "ok"})
+        self.assertEqual(problems, {})
+        self.assertEqual(data["omsetning"], 12.5)
+        self.assertEqual(schema.validate({"omsetning": 1234.5, "500tegnoppsummering": "ok"})[1], {})
+
+    def test_integer_from_schema_file_is_enforced(self):
+        schema = KPISchema({"antall_ansatte": "integer"})
+        self.assertEqual(schema.validate({"antall_ansatte": "120"}), ({"antall_ansatte": 120}, {}))
+        self.assertIn("antall_ansatte", schema.validate({"antall_ansatte": 12.5})[1])
+
+    def test_fixes_formats_locally(self):
+        data, problems = self.schema.validate({
+            "omsetning": "1 234,5", "ebitda": None, "antall_ansatte": "120", "500tegnoppsummering": "ok",
+        })
+        self.assertEqual(problems, {})
+        self.assertEqual(data["omsetning"], 1234.5)
+        self.assertEqual(data["antall_ansatte"], 120)
+
+    def test_to_number_separators(self):
+        self.assertEqual(to_number("1,234,567"), 1234567)
+        self.assertEqual(to_number("1.234.567"), 1234567)
+        self.assertEqual(to_number("1,234,567.5"), 1234567.5)
+        self.assertEqual(to_number("1.234,5"), 1234.5)
+        self.assertEqual(to_number("12,5 %"), 12.5)
+        self.assertEqual(to_number("-3.2MNOK"), -3.2)
+        self.assertEqual(to_number("1,234,567", integer=True), 1234567)
+        self.assertIsNone(to_number("ukjent"))
+
+    def test_parse_response_tolerates_code_fence(self):
+        self.assertEqual(parse_response('```json\n{"a": 1}\n```'), {"a": 1})
+        self.assertIsNone(parse_response("ingen json her"))
+
+    def test_repairs_only_bad_fields_with_excerpt(self):
+        text = "Innledning. " * 2000 + "EBITDA i kvartalet ble 55,2 MNOK. " + "Avslutning. " * 2000
+        model = _FakeModel({"ebitda": 55.2, "omsetning": 999})
+        raw = json.dumps({"omsetning": 10.0, "ebitda": "ukjent", "antall_ansatte": 3,
+                          "500tegnoppsummering": "kort"})
+        data, problems = self.schema.enforce(model, text, raw)
+        self.assertEqual(problems, {})
+        self.assertEqual(data["ebitda"], 55.2)
+        self.assertEqual(data["omsetning"], 10.0)  # ikke bedt om, ikke overskrevet
+        self.assertEqual(len(model.prompts), 1)
+        self.assertIn("55,2 MNOK", model.prompts[0])
+        self.assertLess(len(model.prompts[0]), len(text) / 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
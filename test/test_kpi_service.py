@@ -0,0 +1,98 @@
+import os
+import json
+import time
+import tempfile
+import unittest
+import urllib.error
+import urllib.request
+from unittest import mock
+
+try:
+    import kpi_service
+    from kpi_service import KPIService, KPIServer
+except ImportError:  # openai/requests/PyPDF2 ikke installert
+    kpi_service = None
+
+
+def _request(server, method, path, body=None):
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    req = urllib.request.Request(server.address + path, data=data, method=method)
+    try:
+        with urllib.request.urlopen(req, timeout=5) as resp:
+            return resp.status, json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+@unittest.skipIf(kpi_service is None, "openai/requests/PyPDF2 er ikke installert")
+class TestKPIService(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.instructions = os.path.join(self.tmp.name, "instr.txt")
+        with open(self.instructions, "w", encoding="utf-8") as f:
+            f.write("Svar med JSON.")
+        self.pdf = os.path.join(self.tmp.name, "Kitron", "q4.pdf")
+        os.makedirs(os.path.dirname(self.pdf))
+        open(self.pdf, "wb").close()
+        pdf_root = mock.patch.object(type(kpi_service.Settings()), "pdf_root", new_callable=mock.PropertyMock,
+                                     return_value=self.tmp.name)
+        pdf_root.start()
+        self.addCleanup(pdf_root.stop)
+        self.result_path = os.path.join(self.tmp.name, "q4_20250101_000000.json")
+        with open(self.result_path, "w", encoding="utf-8") as f:
+            json.dump({"omsetning": 12.5}, f)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _wait(self, server, job_id):
+        for _ in range(100):
+            status, job = _request(server, "GET", f"/jobs/{job_id}")
+            if job["status"] not in ("queued", "running"):
+                return job
+            time.sleep(0.02)
+        self.fail("jobben ble ikke ferdig")
+
+    def test_job_lifecycle(self):
+        finish = mock.Mock(return_value=self.result_path)
+        with mock.patch.object(kpi_service, "extract_pdf_text", return_value="tekst"), \
+             mock.patch.object(kpi_service, "_finish_pdf", finish):
+            service = KPIService(self.instructions, workers=2, extract_workers=0)
+            with KPIServer(service) as server:
+                status, job = _request(server, "POST", "/jobs", {"path": self.pdf})
+                self.assertEqual(status, 202)
+                done = self._wait(server, job["id"])
+                self.assertEqual(_request(server, "GET", "/jobs")[1][0]["id"], job["id"])
+            service.shutdown()
+        self.assertEqual(done["status"], "done")
+        self.assertEqual(done["company"], "Kitron")
+        self.assertEqual(done["result"], {"omsetning": 12.5})
+        self.assertEqual(finish.call_args[0][1:5], ("Svar med JSON.", "q4.pdf", "tekst", "fixed"))
+
+    def test_bad_requests(self):
+        service = KPIService(self.instructions, workers=1, extract_workers=0)
+        with KPIServer(service) as server:
+            self.assertEqual(_request(server, "POST", "/jobs", {"url": "https://x/q.pdf"})[0], 400)
+            self.assertEqual(_request(server, "POST", "/jobs", {"path": "finnes/ikke.pdf"})[0], 400)
+            self.assertEqual(_request(server, "GET", "/jobs/ukjent")[0], 404)
+        service.shutdown()
+
+    def test_rejects_paths_outside_pdf_root(self):
+        outside = tempfile.NamedTemporaryFile(suffix=".pdf")
+        self.addCleanup(outside.close)
+        service = KPIService(self.instructions, workers=1, extract_workers=0)
+        with KPIServer(service) as server:
+            for body in ({"path": outside.name},
+                         {"path": os.path.join(self.tmp.name, "Kitron", "..", "..", outside.name)},
+                         {"url": "https://x/q.pdf", "company": "../../x"},
+                         {"url": "https://x/q.pdf", "company": ".."},
+                         {"path": self.pdf, "company": "a/b"}):
+                status, reply = _request(server, "POST", "/jobs", body)
+                self.assertEqual(status, 400, body)
+        service.shutdown()
+        self.assertEqual(service.jobs(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
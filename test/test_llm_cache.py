@@ -0,0 +1,84 @@
+import os
+import time
+import tempfile
+import unittest
+from unittest import mock
+from llm_cache import LLMCache
+from disk_cache import DiskLRUCache
+
+
+class TestLLMCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = LLMCache(self.tmp.name, max_bytes=10_000)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_key_depends_on_all_parts(self):
+        msgs = [{"role": "user", "content": "hei"}]
+        base = self.cache.make_key("openai", "gpt-4o", "instr", msgs, 0.0)
+        self.assertEqual(base, self.cache.make_key("openai", "gpt-4o", "instr", msgs, 0))
+        self.assertNotEqual(base, self.cache.make_key("deepseek", "gpt-4o", "instr", msgs, 0.0))
+        self.assertNotEqual(base, self.cache.make_key("openai", "gpt-4o-mini", "instr", msgs, 0.0))
+        self.assertNotEqual(base, self.cache.make_key("openai", "gpt-4o", "other", msgs, 0.0))
+        self.assertNotEqual(base, self.cache.make_key("openai", "gpt-4o", "instr", [], 0.0))
+        self.assertNotEqual(base, self.cache.make_key("openai", "gpt-4o", "instr", msgs, 0.5))
+
+    def test_cached_call_hits_after_first_miss(self):
+        calls = []
+        def call():
+            calls.append(1)
+            return {"choices": [{"message": {"content": "{}"}}]}
+
+        first = self.cache.cached_call("k", call)
+        second = self.cache.cached_call("k", call)
+        self.assertEqual(first, second)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    def test_lru_eviction_keeps_recently_used(self):
+        cache = LLMCache(self.tmp.name, max_bytes=2500)
+        payload = "x" * 1000
+        cache.put("a", payload)
+        cache.put("b", payload)
+        old = time.time() - 100
+        os.utime(os.path.join(self.tmp.name, "a.json"), (old, old))
+        os.utime(os.path.join(self.tmp.name, "b.json"), (old + 1, old + 1))
+        cache.get("a")  # a blir nylig brukt
+        cache.put("c", payload)
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("c"))
+
+    def test_directory_is_only_scanned_when_over_budget(self):
+        cache = LLMCache(self.tmp.name, max_bytes=2500)
+        with mock.patch.object(cache, "_entries", wraps=cache._entries) as scan:
+            cache.put("a", "x" * 1000)
+            cache.put("a", "y" * 1000)  # overskriving teller ikke dobbelt
+            cache.put("b", "x" * 1000)
+            self.assertEqual(scan.call_count, 0)
+            cache.put("c", "x" * 1000)
+            self.assertEqual(scan.call_count, 1)
+        self.assertLessEqual(cache._total, 2500)
+        self.assertEqual(cache._total, sum(size for _, size, _ in cache._entries()))
+
+    def test_incomplete_subclass_fails_on_creation(self):
+        class NoDump(DiskLRUCache):
+            SUFFIX = ".txt"
+
+            @classmethod
+            def _from_settings(cls):
+                return cls("unused", 0)
+
+            def _load(self, path):
+                return None
+
+        with self.assertRaises(TypeError):
+            NoDump(self.tmp.name, max_bytes=1000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import asyncio
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from llm_registry import LLMRegistry, aiohttp
+except ImportError:  # requests ikke installert
+    LLMRegistry = None
+
+
+class _Model:
+    def __init__(self, instructions, model_name="standard", json_mode=False):
+        self.instructions = instructions
+        self.model_name = model_name
+        self.json_mode = json_mode
+
+
+@unittest.skipIf(LLMRegistry is None, "requests er ikke installert")
+class TestLLMRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        # Egen instans, så singletonen (og secrets.txt) i prosessen ikke påvirkes
+        self.registry = object.__new__(LLMRegistry)
+        self.registry._LLMRegistry__initialize()
+        self.registry.SECRETS_FILE = os.path.join(self.tmp.name, "secrets.txt")
+
+    def tearDown(self):
+        self.registry.close()
+        self.tmp.cleanup()
+
+    def test_secrets_are_read_once(self):
+        with open(self.registry.SECRETS_FILE, "w", encoding="utf-8") as f:
+            f.write("OAI_Key = sk-test\nDeepSeek_Key=\nugyldig linje\n")
+        self.assertEqual(self.registry.get_secret("OAI_Key"), "sk-test")
+        self.assertIsNone(self.registry.get_secret("DeepSeek_Key"))
+        os.remove(self.registry.SECRETS_FILE)
+        self.assertEqual(self.registry.get_secret("OAI_Key"), "sk-test")
+
+    def test_sessions_are_shared_per_provider(self):
+        session = self.registry.get_session("openai")
+        self.assertIs(self.registry.get_session("openai"), session)
+        self.assertIsNot(self.registry.get_session("deepseek"), session)
+
+    def test_models_are_reused(self):
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            models = list(pool.map(lambda _: self.registry.get_model(_Model, "instr", "gpt-4o", json_mode=True),
+                                   range(32)))
+        self.assertTrue(all(m is models[0] for m in models))
+        self.assertEqual(models[0].model_name, "gpt-4o")
+        self.assertIsNot(self.registry.get_model(_Model, "instr", "gpt-4o"), models[0])
+        self.assertIsNot(self.registry.get_model(_Model, "annet", "gpt-4o", json_mode=True), models[0])
+
+    @unittest.skipIf(LLMRegistry is None or aiohttp is None, "aiohttp er ikke installert")
+    def test_async_session_per_event_loop(self):
+        async def _sessions():
+            first = self.registry.get_async_session("openai")
+            same = self.registry.get_async_session("openai")
+            await self.registry.aclose()
+            return first, same
+
+        first, same = asyncio.run(_sessions())
+        self.assertIs(first, same)
+        self.assertTrue(first.closed)
+
+
+if __name__ == "__main__":
+    unittest.main()
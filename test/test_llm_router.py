@@ -0,0 +1,75 @@
+import os
+import time
+import json
+import asyncio
+import tempfile
+import unittest
+from llm_router import LLMRouter, MIN_SAMPLES
+from budget_ledger import BudgetLedger
+
+
+class _FakeBackend:
+    def __init__(self, provider, delay=0.0, fail=False):
+        self.provider = provider
+        self.model_name = "fake"
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+
+    def run(self, text):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.fail:
+            return json.dumps({"error": f"{self.provider} nede"})
+        return f"{self.provider}:{text}"
+
+    async def arun(self, text):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError(f"{self.provider} nede")
+        return f"{self.provider}:{text}"
+
+
+class TestLLMRouter(unittest.TestCase):
+
+    def setUp(self):
+        # LLMRouter er en LLMModel og tar BudgetLedger.default(); hold den unna operation/
+        self.tmp = tempfile.TemporaryDirectory()
+        self.previous, BudgetLedger._default = BudgetLedger._default, \
+            BudgetLedger(os.path.join(self.tmp.name, "ledger.sqlite"))
+
+    def tearDown(self):
+        BudgetLedger._default = self.previous
+        self.tmp.cleanup()
+
+    def test_fails_over_and_demotes_failing_backend(self):
+        bad, good = _FakeBackend("a", fail=True), _FakeBackend("b")
+        router = LLMRouter("instr", [bad, good])
+        for _ in range(MIN_SAMPLES):
+            self.assertEqual(router.run("x"), "b:x")
+        self.assertEqual(router.ranked_backends()[0], good)
+        bad.calls = 0
+        router.run("x")
+        self.assertEqual(bad.calls, 0)
+
+    def test_hedges_when_primary_exceeds_p95(self):
+        slow, fast = _FakeBackend("slow", delay=0.01), _FakeBackend("fast", delay=0.01)
+        router = LLMRouter("instr", [slow, fast], hedge=True)
+        # Bygg opp historikk med raske svar for begge
+        for _ in range(MIN_SAMPLES):
+            router._timed_run(slow, "x")
+            router._timed_run(fast, "x")
+        slow.delay = 1.0
+        start = time.monotonic()
+        self.assertEqual(router.run("x"), "fast:x")
+        self.assertLess(time.monotonic() - start, 0.5)
+
+    def test_async_failover(self):
+        router = LLMRouter("instr", [_FakeBackend("a", fail=True), _FakeBackend("b")], hedge=True)
+        self.assertEqual(asyncio.run(router.arun("x")), "b:x")
+        self.assertEqual(router.stats["a:fake"].error_rate, 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import json
+import time
+import unittest
+from mock_llm_server import MockLLMServer, MockConfig
+
+try:
+    import openai
+    from openai.error import InvalidRequestError, RateLimitError
+except ImportError:
+    openai = None
+
+
+def _create(server, content="hei", **kwargs):
+    return openai.ChatCompletion.create(
+        api_key="test", api_base=server.base_url, model="gpt-4o",
+        messages=[{"role": "user", "content": content}], **kwargs
+    )
+
+
+@unittest.skipIf(openai is None, "openai er ikke installert")
+class TestMockLLMServer(unittest.TestCase):
+
+    def test_canned_response_with_usage(self):
+        config = MockConfig(latency="fixed:0.05", responses=[{"omsetning": 1}, {"omsetning": 2}])
+        with MockLLMServer(config) as server:
+            start = time.monotonic()
+            first = _create(server)
+            self.assertGreaterEqual(time.monotonic() - start, 0.05)
+            second = _create(server)
+        self.assertEqual(json.loads(first["choices"][0]["message"]["content"]), {"omsetning": 1})
+        self.assertEqual(json.loads(second["choices"][0]["message"]["content"]), {"omsetning": 2})
+        self.assertGreater(first["usage"]["prompt_tokens"], 0)
+
+    def test_context_length_error_matches_openai(self):
+        with MockLLMServer(MockConfig(context_window=50)) as server:
+            with self.assertRaises(InvalidRequestError) as ctx:
+                _create(server, content="ord " * 500)
+            self.assertEqual(server.stats["context_errors"], 1)
+        self.assertIn("maximum context length", str(ctx.exception))
+
+    def test_rpm_limit_gives_429_with_headers(self):
+        with MockLLMServer(MockConfig(rpm=2, retry_after=3)) as server:
+            _create(server)
+            _create(server)
+            with self.assertRaises(RateLimitError) as ctx:
+                _create(server)
+            self.assertEqual(server.stats["rate_limited"], 1)
+        headers = {k.lower(): v for k, v in dict(ctx.exception.headers).items()}
+        self.assertEqual(headers["retry-after"], "3")
+        self.assertEqual(headers["x-ratelimit-remaining-requests"], "0")
+
+
+if __name__ == "__main__":
+    unittest.main()
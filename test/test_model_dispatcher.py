@@ -0,0 +1,48 @@
+import os
+import csv
+import tempfile
+import unittest
+
+try:
+    from model_dispatcher import ModelDispatcher
+except ImportError:
+    ModelDispatcher = None
+
+TIERS = [
+    ("small", "openai", "gpt-4o-mini", 100),
+    ("standard", "openai", "gpt-4o", 1000),
+    ("large", "openai", "gpt-4.1", None),
+]
+
+
+@unittest.skipIf(ModelDispatcher is None, "openai er ikke installert")
+class TestModelDispatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.log_path = os.path.join(self.tmp.name, "dispatch_log.csv")
+        self.dispatcher = ModelDispatcher("instr", tiers=TIERS, log_path=self.log_path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_picks_first_tier_that_fits(self):
+        self.assertEqual(self.dispatcher.choose_tier("kort tekst")[0][0], "small")
+        self.assertEqual(self.dispatcher.choose_tier("ord " * 500)[0][0], "standard")
+        self.assertEqual(self.dispatcher.choose_tier("ord " * 5000)[0][0], "large")
+
+    def test_logs_tier_per_document(self):
+        self.dispatcher._log("a.pdf", 50, TIERS[0])
+        self.dispatcher._log("b.pdf", 5000, TIERS[2])
+        with open(self.log_path, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual([(r["document"], r["tier"], r["model"]) for r in rows],
+                         [("a.pdf", "small", "gpt-4o-mini"), ("b.pdf", "large", "gpt-4.1")])
+
+    def test_rejects_unknown_provider(self):
+        with self.assertRaises(ValueError):
+            ModelDispatcher("instr", tiers=[("x", "ukjent", "m", None)], log_path=self.log_path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,181 @@
+import os
+import json
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from budget_ledger import BudgetLedger, usage_labels
+from mock_llm_server import MockLLMServer, MockConfig
+
+try:
+    from openai_batch import OpenAIBatch
+except ImportError:  # openai/requests ikke installert
+    OpenAIBatch = None
+
+
+class _BatchStandIn(BaseHTTPRequestHandler):
+    """Minimal stand-in for /files og /batches som fullfører batchen umiddelbart."""
+
+    files = {}
+    batches = {}
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, obj, raw=False):
+        body = obj.encode("utf-8") if raw else json.dumps(obj).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.path == "/v1/files":
+            start = body.index(b"\r\n\r\n", body.index(b'name="file"')) + 4
+            end = body.index(b"\r\n--", start)
+            file_id = f"file-{len(self.files)}"
+            self.files[file_id] = body[start:end].decode("utf-8")
+            self._send({"id": file_id})
+        elif self.path == "/v1/batches":
+            req = json.loads(body)
+            out_lines = []
+            for line in self.files[req["input_file_id"]].splitlines():
+                line = json.loads(line)
+                content = json.dumps({"echo": line["custom_id"]})
+                out_lines.append(json.dumps({
+                    "custom_id": line["custom_id"],
+                    "response": {"status_code": 200, "body": {
+                        "choices": [{"message": {"role": "assistant", "content": content}}],
+                        "usage": {"prompt_tokens": 1000, "completion_tokens": 100},
+                    }},
+                    "error": None,
+                }))
+            out_id = f"file-{len(self.files)}"
+            self.files[out_id] = "\n".join(out_lines)
+            batch_id = f"batch-{len(self.batches)}"
+            self.batches[batch_id] = {"id": batch_id, "status": "completed", "output_file_id": out_id}
+            self._send({"id": batch_id, "status": "validating"})
+
+    def do_GET(self):
+        if self.path.startswith("/v1/batches/"):
+            self._send(self.batches[self.path.rsplit("/", 1)[1]])
+        elif self.path.endswith("/content"):
+            self._send(self.files[self.path.split("/")[3]], raw=True)
+
+
+class _FakeModel:
+    model_name = "gpt-4o"
+    api_key = "test-key"
+
+    def __init__(self):
+        self.cached = []
+
+    def build_messages(self, text):
+        return [{"role": "system", "content": "instr"}, {"role": "user", "content": text}]
+
+    def store_in_cache(self, messages, temperature, response):
+        self.cached.append(messages)
+
+
+@unittest.skipIf(OpenAIBatch is None, "openai/requests er ikke installert")
+class TestOpenAIBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _BatchStandIn)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.api_base = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+        self.tmp = tempfile.TemporaryDirectory()
+        self.state_path = os.path.join(self.tmp.name, "backfill.json")
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.tmp.cleanup()
+
+    def test_submit_poll_and_map_results(self):
+        model = _FakeModel()
+        batch = OpenAIBatch(model, self.state_path, api_base=self.api_base)
+        batch.add("Kitron/q4.pdf", "tekst 1", {"filename": "q4.pdf"})
+        batch.add("Kitron/q3.pdf", "tekst 2", {"filename": "q3.pdf"})
+        batch.submit()
+        self.assertEqual(batch.wait(poll_interval=0), "completed")
+
+        results = batch.results()
+        self.assertEqual(json.loads(results["Kitron/q4.pdf"]), {"echo": "Kitron/q4.pdf"})
+        self.assertEqual(len(model.cached), 2)
+
+    def test_usage_is_booked_per_document_at_batch_price(self):
+        ledger = BudgetLedger(os.path.join(self.tmp.name, "ledger.sqlite"))
+        batch = OpenAIBatch(_FakeModel(), self.state_path, api_base=self.api_base, ledger=ledger)
+        batch.add("Kitron/q4.pdf", "tekst 1")
+        batch.submit()
+        batch.wait(poll_interval=0)
+        for custom_id in batch.results():
+            with usage_labels(company="Kitron", document="q4.pdf"):
+                batch.record_usage(custom_id)
+        (row,) = ledger.usage_summary("stage", company="Kitron", document="q4.pdf")
+        self.assertEqual((row["stage"], row["prompt_tokens"], row["completion_tokens"]), ("batch", 1000, 100))
+        self.assertAlmostEqual(row["cost"], (1000 * 2.50 + 100 * 10.00) / 1_000_000 * 0.5)
+        self.assertAlmostEqual(ledger.spent_today(), row["cost"])
+
+    def test_resume_does_not_resubmit(self):
+        batch = OpenAIBatch(_FakeModel(), self.state_path, api_base=self.api_base)
+        batch.add("a", "tekst")
+        batch_id = batch.submit()
+        batch.mark_collected("a")
+
+        resumed = OpenAIBatch(_FakeModel(), self.state_path, api_base=self.api_base)
+        self.assertEqual(resumed.batch_id, batch_id)
+        self.assertFalse(resumed.add("b", "ny tekst"))
+        self.assertEqual(resumed.submit(), batch_id)
+        resumed.poll()
+        self.assertEqual(resumed.results(), {})
+
+
+@unittest.skipIf(OpenAIBatch is None, "openai/requests er ikke installert")
+class TestBatchAgainstMockServer(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.state_path = os.path.join(self.tmp.name, "backfill.json")
+        self.ledger = BudgetLedger(os.path.join(self.tmp.name, "ledger.sqlite"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_mock_server_runs_batches(self):
+        with MockLLMServer(MockConfig(responses={"omsetning": 7})) as server:
+            batch = OpenAIBatch(_FakeModel(), self.state_path, api_base=server.base_url, ledger=self.ledger)
+            batch.add("a", "kort tekst")
+            batch.submit()
+            self.assertEqual(batch.wait(poll_interval=0), "completed")
+            results = batch.results()
+        self.assertEqual(json.loads(results["a"]), {"omsetning": 7})
+        self.assertEqual(batch.state["failed"], [])
+
+    def test_resubmit_sends_only_failed_items(self):
+        with MockLLMServer(MockConfig(context_window=200)) as server:
+            batch = OpenAIBatch(_FakeModel(), self.state_path, api_base=server.base_url, ledger=self.ledger)
+            batch.add("kort", "kort tekst")
+            batch.add("lang", "ord " * 1000)
+            first_id = batch.submit()
+            batch.wait(poll_interval=0)
+            results = batch.results()
+            self.assertIsNone(results["lang"])
+            self.assertEqual(batch.state["failed"], ["lang"])
+            batch.mark_collected("kort")
+
+            server.httpd.config.context_window = 128000
+            second_id = batch.resubmit_failed()
+            self.assertNotEqual(second_id, first_id)
+            self.assertEqual(batch.wait(poll_interval=0), "completed")
+            self.assertEqual(list(batch.results()), ["lang"])
+            self.assertEqual(len(server.httpd.state.files[batch.state["input_file_id"]].splitlines()), 1)
+        self.assertEqual(batch.state["failed"], [])
+        self.assertEqual(batch.state["history"][0]["batch_id"], first_id)
+        self.assertIsNone(batch.resubmit_failed())
+
+
+if __name__ == "__main__":
+    unittest.main()
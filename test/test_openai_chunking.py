@@ -0,0 +1,94 @@
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from chunk_checkpoint import ChunkCheckpoint
+
+try:
+    from openai.error import InvalidRequestError
+    from openai_model import OpenAIModel
+except ImportError:
+    OpenAIModel = None
+
+
+def _response(content):
+    return {"choices": [{"message": {"content": content}}]}
+
+
+if OpenAIModel is not None:
+    class _FakeModel(OpenAIModel):
+        """OpenAIModel uten nøkkel/nettverk: svarer ut fra hvilket steg kallet gjelder."""
+
+        def __init__(self, checkpoint_dir, context_error=False):
+            self.model_name = "gpt-4o"
+            self.instructions = "Hent KPI-er."
+            self.json_mode = False
+            self.checkpoint_dir = checkpoint_dir
+            self.context_error = context_error
+            self.calls = []
+            self._lock = threading.Lock()
+
+        def _open_checkpoint(self, text, strategy, chunk_size):
+            return ChunkCheckpoint.for_document(self.model_name, self.instructions, strategy, chunk_size, text,
+                                               directory=self.checkpoint_dir)
+
+        def _safe_openai_call(self, messages, temperature=0.0, max_retries=8, initial_wait=2.0, stage="single"):
+            with self._lock:
+                self.calls.append(stage)
+            if stage == "single" and self.context_error:
+                raise InvalidRequestError("This model's maximum context length is 128000 tokens", None)
+            user = messages[-1]["content"]
+            if stage == "rolling":
+                summary = messages[1]["content"].split("\n", 1)[1]
+                chunk = user.split("\n")[1]
+                return _response(f"{summary}|{chunk}" if summary else chunk)
+            if stage == "final":
+                return _response("FINAL:" + messages[1]["content"].split("\n", 1)[1])
+            if stage == "map":
+                return _response(user.split("\n", 1)[1].upper())
+            if stage == "merge":
+                parts = [block.split("\n", 1)[1] for block in user.split("--- Partial result") if "\n" in block]
+                return _response("+".join(p.strip() for p in parts))
+            return _response("single")
+
+
+@unittest.skipIf(OpenAIModel is None, "openai er ikke installert")
+class TestOpenAIChunking(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.model = _FakeModel(self.tmp.name)
+        self.chunks = ["a", "b", "c", "d", "e"]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_rolling_threads_summary_through_chunks(self):
+        with mock.patch.object(OpenAIModel, "_chunk_text", return_value=self.chunks):
+            result = self.model._run_chunked("tekst", chunk_size=1000, strategy="rolling")
+        self.assertEqual(result, "FINAL:a|b|c|d|e")
+        self.assertEqual(self.model.calls, ["rolling"] * 5 + ["final"])
+        self.assertEqual(len(self.model._open_checkpoint("tekst", "rolling", 1000)), 0)  # ryddet etter seg
+
+    def test_map_reduce_merges_in_a_tree(self):
+        with mock.patch.object(OpenAIModel, "_chunk_text", return_value=self.chunks):
+            result = self.model._run_chunked("tekst", chunk_size=1000, strategy="map_reduce", merge_fanin=2)
+        self.assertEqual(result, "A+B+C+D+E")
+        # 5 map-kall; nivå 1: 2 fletninger (e alene), nivå 2: 1, nivå 3: 1
+        self.assertEqual(self.model.calls.count("map"), 5)
+        self.assertEqual(self.model.calls.count("merge"), 4)
+
+    def test_unknown_strategy(self):
+        with self.assertRaises(ValueError):
+            self.model._run_chunked("tekst", chunk_size=1000, strategy="ukjent")
+
+    def test_run_falls_back_to_chunking_on_context_error(self):
+        model = _FakeModel(self.tmp.name, context_error=True)
+        with mock.patch.object(OpenAIModel, "_chunk_text", return_value=["x", "y"]):
+            result = model.run("kort tekst", strategy="map_reduce")
+        self.assertEqual(result, "X+Y")
+        self.assertEqual(model.calls[0], "single")
+
+
+if __name__ == "__main__":
+    unittest.main()
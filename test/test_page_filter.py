@@ -0,0 +1,52 @@
+import unittest
+from page_filter import score_page, select_pages, prefilter_pages
+
+DISCLAIMER = ("This presentation contains forward-looking statements. Disclaimer: the company "
+              "undertakes no obligation to update them. ") * 20
+ESG = "Vårt bærekraftsarbeid og ESG-strategi handler om mennesker, miljø og samfunn. " * 20
+INCOME = ("Resultatregnskap (MNOK)\nDriftsinntekter 1 234,5 1 100,2\nDriftsresultat (EBIT) 210,4 180,0\n"
+          "Resultat før skatt 190,1 170,3\nResultat per aksje 1,25 1,10\n")
+HIGHLIGHTS = "Highlights Q4\nRevenue up 12 % to SEK 845 million\nOperating profit SEK 92 million, margin 10,9 %\n"
+NARRATIVE = "Vi har hatt et spennende kvartal med mange nye kunder og gode samtaler i markedet. " * 20
+
+
+class TestPageFilter(unittest.TestCase):
+
+    def test_statement_pages_beat_boilerplate(self):
+        self.assertGreater(score_page(INCOME), score_page(NARRATIVE))
+        self.assertGreater(score_page(HIGHLIGHTS), score_page(ESG))
+        self.assertLess(score_page(DISCLAIMER), 0)
+
+    def test_keeps_top_pages_in_original_order(self):
+        pages = [DISCLAIMER, HIGHLIGHTS, ESG, NARRATIVE, INCOME, ESG]
+        chosen = select_pages(pages, max_tokens=200)
+        self.assertEqual(chosen, [1, 4])
+        text, stats = prefilter_pages(pages, max_tokens=200)
+        self.assertLess(text.index("--- Side 2 ---"), text.index("--- Side 5 ---"))
+        self.assertEqual(stats["pages_out"], 2)
+        self.assertLess(stats["tokens_out"], stats["tokens_in"] / 3)
+
+    def test_low_scoring_oversized_pages_keep_the_first_truncated(self):
+        pages = [NARRATIVE, ESG, NARRATIVE]
+        self.assertTrue(all(score_page(page) <= 0 for page in pages))
+        self.assertEqual(select_pages(pages, max_tokens=50), [0])
+        text, stats = prefilter_pages(pages, max_tokens=50)
+        self.assertTrue(text.startswith("--- Side 1 ---\nVi har hatt et spennende kvartal"))
+        self.assertEqual(stats["pages_out"], 1)
+        self.assertLessEqual(stats["tokens_out"], 60)
+
+    def test_oversized_best_page_is_kept_truncated(self):
+        pages = [DISCLAIMER, INCOME * 20, NARRATIVE]
+        self.assertEqual(select_pages(pages, max_tokens=100), [1])
+        text, stats = prefilter_pages(pages, max_tokens=100)
+        self.assertIn("Resultatregnskap", text)
+        self.assertLessEqual(stats["tokens_out"], 110)
+
+    def test_small_document_is_sent_unchanged(self):
+        text, stats = prefilter_pages([HIGHLIGHTS, INCOME], max_tokens=10_000)
+        self.assertEqual(text, HIGHLIGHTS + "\n" + INCOME + "\n")
+        self.assertEqual(stats["pages_out"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from pdf_text_cache import PDFTextCache
+
+try:
+    import PyPDF2
+    from pdf_handler import PDFHandler, iter_extracted_pages, iter_pdf_pages, join_pages
+except ImportError:  # PyPDF2/requests ikke installert
+    PDFHandler = None
+
+
+def make_pdf(path: str, page_texts: list[str]) -> None:
+    """Minimal PDF med én tekstlinje per side (Helvetica, bare ASCII)."""
+    objs = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in page_texts:
+        stream = f"BT /F1 12 Tf 20 100 Td ({text}) Tj ET"
+        objs.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objs.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 300 200] "
+                    f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objs)} 0 R >>")
+        kids.append(f"{len(objs)} 0 R")
+    objs[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for i, obj in enumerate(objs, 1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objs) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{o:010d} 00000 n \n" for o in offsets).encode()
+    out += f"trailer\n<< /Size {len(objs) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+@unittest.skipIf(PDFHandler is None, "PyPDF2/requests er ikke installert")
+class TestPDFExtraction(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.previous, PDFTextCache._default = PDFTextCache._default, \
+            PDFTextCache(os.path.join(self.tmp.name, "cache"), max_bytes=1_000_000)
+        self.big = os.path.join(self.tmp.name, "stor.pdf")
+        make_pdf(self.big, [f"Side {i}" for i in range(23)])
+        self.small = os.path.join(self.tmp.name, "liten.pdf")
+        make_pdf(self.small, ["Forside", "Resultat"])
+
+    def tearDown(self):
+        PDFTextCache._default = self.previous
+        self.tmp.cleanup()
+
+    def test_parallel_page_ranges_keep_order(self):
+        expected = [f"Side {i}" for i in range(23)]
+        results = {path: (pages, error) for path, pages, error in
+                   iter_extracted_pages([self.big, self.small], workers=3, pages_per_task=4)}
+        self.assertEqual(results[self.big], (expected, None))
+        self.assertEqual(results[self.small], (["Forside", "Resultat"], None))
+        # Andre runde kommer fra cachen, uten prosesspool
+        with mock.patch("pdf_handler.ProcessPoolExecutor") as pool:
+            self.assertEqual(PDFHandler("test").extract_text_from_pdf(self.big, workers=3), join_pages(expected))
+        pool.assert_not_called()
+
+    def test_serial_and_parallel_text_match(self):
+        parallel = PDFHandler("test").extract_text_from_pdf(self.big, workers=3)
+        PDFTextCache._default = PDFTextCache(os.path.join(self.tmp.name, "cache2"), max_bytes=1_000_000)
+        self.assertEqual(PDFHandler("test").extract_text_from_pdf(self.big), parallel)
+
+    def test_page_stream_stops_early(self):
+        original = PyPDF2.PageObject.extract_text
+        with mock.patch.object(PyPDF2.PageObject, "extract_text", autospec=True,
+                               side_effect=original) as extract:
+            pages = iter_pdf_pages(self.big)
+            first = [next(pages), next(pages)]
+            pages.close()
+        self.assertEqual(first, [(1, "Side 0"), (2, "Side 1")])
+        self.assertEqual(extract.call_count, 2)
+        self.assertEqual([n for n, _ in iter_pdf_pages(self.big, 20)], [21, 22, 23])
+
+    def test_broken_file_does_not_stop_others(self):
+        broken = os.path.join(self.tmp.name, "ødelagt.pdf")
+        with open(broken, "wb") as f:
+            f.write(b"ikke en pdf")
+        results = {path: error for path, _, error in iter_extracted_pages([broken, self.small], workers=2)}
+        self.assertIsNotNone(results[broken])
+        self.assertIsNone(results[self.small])
+
+
+if __name__ == "__main__":
+    unittest.main()
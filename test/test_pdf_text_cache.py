@@ -0,0 +1,80 @@
+import os
+import time
+import tempfile
+import unittest
+from pdf_text_cache import PDFTextCache
+
+try:
+    import PyPDF2
+    from pdf_handler import PDFHandler
+except ImportError:  # PyPDF2/requests ikke installert
+    PDFHandler = None
+
+
+class TestPDFTextCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = PDFTextCache(os.path.join(self.tmp.name, "cache"), max_bytes=100_000)
+        self.pdf = os.path.join(self.tmp.name, "rapport.pdf")
+        with open(self.pdf, "wb") as f:
+            f.write(b"%PDF-1.4 innhold")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_extracts_once_per_content_and_version(self):
+        calls = []
+        def extract():
+            calls.append(1)
+            return "Omsetning 1 234 MNOK"
+
+        self.assertEqual(self.cache.cached_text(self.pdf, "v1", extract), "Omsetning 1 234 MNOK")
+        self.assertEqual(self.cache.cached_text(self.pdf, "v1", extract), "Omsetning 1 234 MNOK")
+        self.assertEqual(len(calls), 1)
+        self.cache.cached_text(self.pdf, "v2", extract)
+        self.assertEqual(len(calls), 2)
+        with open(self.pdf, "ab") as f:
+            f.write(b" endret")
+        self.cache.cached_text(self.pdf, "v1", extract)
+        self.assertEqual(len(calls), 3)
+
+    def test_unreadable_entry_is_a_miss(self):
+        key = PDFTextCache.make_key(self.pdf, "v1")
+        with open(os.path.join(self.cache.cache_dir, f"{key}.txt.gz"), "wb") as f:
+            f.write(b"ikke gzip")
+        self.assertIsNone(self.cache.get(key))
+        self.assertEqual(self.cache.cached_text(self.pdf, "v1", lambda: "ny"), "ny")
+
+    def test_lru_eviction_keeps_recently_used(self):
+        cache = PDFTextCache(os.path.join(self.tmp.name, "liten"), max_bytes=10_000)
+        payload = os.urandom(600).hex()
+        cache.put("a", payload)
+        cache.put("b", payload)
+        cache.max_bytes = int(os.path.getsize(os.path.join(cache.cache_dir, "a.txt.gz")) * 2.5)
+        old = time.time() - 100
+        os.utime(os.path.join(cache.cache_dir, "a.txt.gz"), (old, old))
+        os.utime(os.path.join(cache.cache_dir, "b.txt.gz"), (old + 1, old + 1))
+        cache.get("a")
+        cache.put("c", payload)
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+
+    @unittest.skipIf(PDFHandler is None, "PyPDF2/requests er ikke installert")
+    def test_pdf_handler_uses_cache(self):
+        writer = PyPDF2.PdfWriter()
+        writer.add_blank_page(width=200, height=200)
+        with open(self.pdf, "wb") as f:
+            writer.write(f)
+        previous, PDFTextCache._default = PDFTextCache._default, self.cache
+        try:
+            handler = PDFHandler("test")
+            handler.extract_text_from_pdf(self.pdf)
+            handler.extract_text_from_pdf(self.pdf)
+        finally:
+            PDFTextCache._default = previous
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
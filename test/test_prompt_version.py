@@ -0,0 +1,75 @@
+import os
+import json
+import tempfile
+import unittest
+from kpi_schema import KPISchema
+from prompt_version import META_KEY, prompt_versions, affected_fields, latest_results
+
+INSTRUCTIONS = """Du er en finansanalytiker. Svar kun med JSON.
+omsetning: total omsetning i kvartalet, i MNOK.
+ebitda: driftsresultat før avskrivninger, i MNOK.
+{"omsetning": 0.0, "ebitda": 0.0}
+"""
+
+
+class TestPromptVersion(unittest.TestCase):
+
+    def setUp(self):
+        self.schema = KPISchema.from_instructions(INSTRUCTIONS)
+        self.old = prompt_versions(INSTRUCTIONS, self.schema)
+
+    def _affected(self, instructions):
+        return affected_fields(self.old, prompt_versions(instructions, KPISchema.from_instructions(instructions)))
+
+    def test_field_edit_only_affects_that_field(self):
+        edited = INSTRUCTIONS.replace("i MNOK.\nebitda", "i NOK (ikke MNOK).\nebitda")
+        self.assertEqual(self._affected(edited), ("fields", ["omsetning"]))
+
+    def test_new_field_is_fetched_alone(self):
+        edited = INSTRUCTIONS + "utbytte: utbytte per aksje i NOK.\n"
+        schema = KPISchema(dict(self.schema.fields, utbytte="number"))
+        self.assertEqual(affected_fields(self.old, prompt_versions(edited, schema)), ("fields", ["utbytte"]))
+
+    def test_field_that_prefixes_another_is_matched_as_a_word(self):
+        base = "Svar med JSON.\nebit: driftsresultat.\nebitda: resultat før avskrivninger.\n"
+        schema = KPISchema({"ebit": "number", "ebitda": "number"})
+        old = prompt_versions(base, schema)
+        edited = base.replace("før avskrivninger", "før av- og nedskrivninger")
+        self.assertEqual(affected_fields(old, prompt_versions(edited, schema)), ("fields", ["ebitda"]))
+
+    def test_key_added_to_one_line_example(self):
+        base = 'Svar med JSON på formen: {"omsetning": 0.0, "ebitda": 0.0}\n'
+        edited = 'Svar med JSON på formen: {"omsetning": 0.0, "ebitda": 0.0, "antall": 0}\n'
+        old = prompt_versions(base, KPISchema.from_instructions(base))
+        current = prompt_versions(edited, KPISchema.from_instructions(edited))
+        self.assertEqual(affected_fields(old, current), ("fields", ["antall"]))
+
+    def test_key_added_to_multi_line_example(self):
+        base = 'Svar med JSON:\n{\n  "omsetning": 0.0,\n  "ebitda": 0.0\n}\n'
+        edited = base.replace('"ebitda": 0.0\n', '"ebitda": 0.0,\n  "antall": 0\n')
+        old = prompt_versions(base, KPISchema.from_instructions(base))
+        current = prompt_versions(edited, KPISchema.from_instructions(edited))
+        self.assertEqual(affected_fields(old, current), ("fields", ["antall"]))
+
+    def test_general_edit_needs_full_rerun(self):
+        edited = INSTRUCTIONS.replace("finansanalytiker", "revisor")
+        self.assertEqual(self._affected(edited), ("full", []))
+        self.assertEqual(affected_fields(None, self.old), ("full", []))
+
+    def test_whitespace_only_edit_is_ignored(self):
+        edited = INSTRUCTIONS.replace("Svar kun", "Svar   kun") + "\n\n"
+        self.assertEqual(self._affected(edited), ("none", []))
+
+    def test_latest_result_per_pdf(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, value in [("rapport_20240101_120000.json", 1), ("rapport_20240301_080000.json", 2),
+                                ("annen_20240201_000000.json", 3), ("rapport.pdf_raw.txt", 0)]:
+                with open(os.path.join(tmp, name), "w", encoding="utf-8") as f:
+                    json.dump({"omsetning": value, META_KEY: self.old}, f)
+            latest = latest_results(tmp)
+        self.assertEqual(sorted(latest), ["annen", "rapport"])
+        self.assertEqual(latest["rapport"][1]["omsetning"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
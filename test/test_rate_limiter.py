@@ -0,0 +1,126 @@
+import unittest
+from unittest import mock
+from rate_limiter import TokenBucket, RateLimiter, parse_reset, MAX_BACKOFF
+
+try:
+    from openai.error import RateLimitError
+    from openai_model import OpenAIModel
+except ImportError:
+    OpenAIModel = None
+
+
+class TestParseReset(unittest.TestCase):
+
+    def test_formats(self):
+        self.assertEqual(parse_reset("1s"), 1.0)
+        self.assertEqual(parse_reset("6m0s"), 360.0)
+        self.assertEqual(parse_reset("120ms"), 0.12)
+        self.assertEqual(parse_reset("1h2m"), 3720.0)
+        self.assertEqual(parse_reset("0.5"), 0.5)
+        self.assertEqual(parse_reset(3), 3.0)
+        self.assertIsNone(parse_reset(None))
+        self.assertIsNone(parse_reset("snart"))
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_take_until_empty_then_wait(self):
+        bucket = TokenBucket(60, period=60.0)  # 1 enhet per sekund
+        self.assertEqual(bucket.try_take(50), 0)
+        self.assertEqual(bucket.try_take(10), 0)
+        self.assertAlmostEqual(bucket.try_take(5), 5.0, delta=0.1)
+
+    def test_request_larger_than_capacity_is_capped(self):
+        bucket = TokenBucket(100)
+        self.assertEqual(bucket.try_take(1000), 0)
+        self.assertLessEqual(bucket.level, 0.1)
+
+    def test_sync_and_drain(self):
+        bucket = TokenBucket(100)
+        bucket.sync(limit=1000, remaining=10)
+        self.assertEqual(bucket.capacity, 1000)
+        self.assertAlmostEqual(bucket.level, 10, delta=1)
+        bucket.drain(6.0)  # 6 s * 1000/60 per s
+        self.assertAlmostEqual(bucket.try_take(1), 6.0 + 60 / 1000, delta=0.1)
+
+    def test_take_more_and_give_back(self):
+        bucket = TokenBucket(100)
+        bucket.try_take(100)
+        bucket.take_more(50)
+        self.assertLess(bucket.level, -49)
+        bucket.give_back(1000)
+        self.assertEqual(bucket.level, 100)
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_backoff_is_bounded_and_respects_hint(self):
+        for attempt in range(12):
+            delay = RateLimiter.backoff(attempt, base=1.0)
+            self.assertGreaterEqual(delay, 0)
+            self.assertLessEqual(delay, min(MAX_BACKOFF, 2 ** attempt))
+        self.assertGreaterEqual(RateLimiter.backoff(0, base=1.0, hint=7.0), 7.0)
+
+    def test_headers_update_both_buckets(self):
+        limiter = RateLimiter(10, 1000)
+        limiter.update_from_headers({"X-RateLimit-Limit-Requests": "500", "x-ratelimit-remaining-requests": "3",
+                                     "x-ratelimit-limit-tokens": "90000", "x-ratelimit-remaining-tokens": "abc"})
+        self.assertEqual(limiter.requests.capacity, 500)
+        self.assertAlmostEqual(limiter.requests.level, 3, delta=1)
+        self.assertEqual(limiter.tokens.capacity, 90000)
+
+    def test_rate_limited_returns_longest_hint_and_drains(self):
+        limiter = RateLimiter(60, 6000)
+        hint = limiter.on_rate_limited({"retry-after": "2", "x-ratelimit-reset-tokens": "5s"})
+        self.assertEqual(hint, 5.0)
+        self.assertGreater(limiter.requests.try_take(1), 1.5)
+        self.assertGreater(limiter.tokens.try_take(1), 4.5)
+
+    def test_record_usage_corrects_estimate(self):
+        limiter = RateLimiter(60, 6000)
+        limiter.tokens.try_take(1000)
+        limiter.record_usage(1000, 400)
+        self.assertAlmostEqual(limiter.tokens.level, 5600, delta=5)
+        limiter.record_usage(1000, None)
+        self.assertAlmostEqual(limiter.tokens.level, 5600, delta=5)
+
+
+@unittest.skipIf(OpenAIModel is None, "openai er ikke installert")
+class TestOpenAIRetries(unittest.TestCase):
+
+    def _model(self):
+        model = OpenAIModel.__new__(OpenAIModel)
+        model.api_key = "test"
+        model.model_name = "gpt-4o"
+        model.instructions = "instr"
+        model.json_mode = False
+        model.cache = None
+        model.rate_limiter = RateLimiter(6000, 10 ** 6)
+        model.ledger = mock.Mock()
+        return model
+
+    def test_retries_rate_limit_with_backoff(self):
+        model = self._model()
+        ok = {"choices": [{"message": {"content": "svar"}}], "usage": None}
+        error = RateLimitError("for mange", headers={"retry-after": "0"})
+        with mock.patch("openai_model.openai.ChatCompletion.create", side_effect=[error, error, ok]) as create, \
+             mock.patch("openai_model.time") as fake_time:
+            response = model._safe_openai_call([{"role": "user", "content": "hei"}], initial_wait=0.5)
+        self.assertIs(response, ok)
+        self.assertEqual(create.call_count, 3)
+        self.assertEqual(fake_time.sleep.call_count, 2)
+        self.assertLessEqual(fake_time.sleep.call_args_list[0][0][0], 1.0)  # forsøk 0: maks 0.5 * 2**0 + jitter
+        self.assertEqual(model.ledger.acquire.call_args_list[1][0][2], 0.0)  # kostnaden trekkes bare én gang
+
+    def test_gives_up_after_max_retries(self):
+        model = self._model()
+        with mock.patch("openai_model.openai.ChatCompletion.create",
+                        side_effect=RateLimitError("for mange")) as create, \
+             mock.patch("openai_model.time"):
+            with self.assertRaises(RateLimitError):
+                model._safe_openai_call([{"role": "user", "content": "hei"}], max_retries=3)
+        self.assertEqual(create.call_count, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,30 @@
+import unittest
+from stream_json import IncrementalJSONParser
+
+
+class TestIncrementalJSONParser(unittest.TestCase):
+
+    def test_fields_complete_as_they_arrive(self):
+        text = '```json\n{"a": 1, "b": {"x": [1, "}"]}, "c": "sa \\"hei\\", ok", "d": null}\n```'
+        parser = IncrementalJSONParser()
+        seen = []
+        for i in range(0, len(text), 3):
+            seen.extend(parser.feed(text[i : i+3]))
+
+        self.assertEqual([k for k, _ in seen], ["a", "b", "c", "d"])
+        self.assertEqual(parser.fields["b"], {"x": [1, "}"]})
+        self.assertEqual(parser.fields["c"], 'sa "hei", ok')
+        self.assertTrue(parser.done)
+
+    def test_has_all_before_object_is_closed(self):
+        parser = IncrementalJSONParser()
+        parser.feed('{"omsetning": 100, "ebitda": 2')
+        self.assertFalse(parser.has_all(["omsetning", "ebitda"]))
+        parser.feed('0, "kommentar": "lang tek')
+        self.assertTrue(parser.has_all(["omsetning", "ebitda"]))
+        self.assertEqual(parser.fields["ebitda"], 20)
+        self.assertFalse(parser.done)
+
+
+if __name__ == "__main__":
+    unittest.main()
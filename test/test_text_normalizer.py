@@ -0,0 +1,60 @@
+import unittest
+from text_normalizer import normalize_pages
+
+
+def _page(n: int, body: str) -> str:
+    return f"Kitron ASA   |   Kvartalsrapport Q4 2024\n{body}\nSide {n} av 6\n"
+
+
+DISCLAIMER = ("Disclaimer\nThis report contains forward-looking statements based on current expectations.\n"
+              "The company undertakes no obligation to update any forward-looking statement.\n")
+
+
+class TestTextNormalizer(unittest.TestCase):
+
+    def setUp(self):
+        bodies = [
+            "Høydepunkter\nDriftsinntektene   økte til 1 234,5 MNOK",
+            "Driftsresultatet ble påvirket av høyere inn-\nkjøpspriser og EBITDA-\nmargin på 9,1 %",
+            "Kontantstrøm fra drifts- og\ninvesteringsaktiviteter",
+            "Resultatregnskap\nDriftsinntekter 1 234,5",
+            DISCLAIMER,
+            "Balanse\nEgenkapital 845,0\nMerk: forward-looking statements er merket.",
+        ]
+        self.pages, self.stats = normalize_pages([_page(i + 1, b) for i, b in enumerate(bodies)])
+
+    def test_strips_repeated_headers_and_page_numbers(self):
+        self.assertEqual(self.pages[0], "Høydepunkter\nDriftsinntektene økte til 1 234,5 MNOK")
+        self.assertFalse(any("Kitron ASA" in page or "av 6" in page for page in self.pages))
+        self.assertEqual(self.stats["header_footer_lines"], 12)
+
+    def test_joins_hyphenation_but_keeps_real_hyphens(self):
+        self.assertIn("innkjøpspriser", self.pages[1])
+        self.assertIn("EBITDA-\nmargin", self.pages[1])
+        self.assertIn("drifts- og\ninvesteringsaktiviteter", self.pages[2])
+
+    def test_drops_legal_boilerplate(self):
+        self.assertEqual(len(self.pages), 6)
+        self.assertEqual(self.pages[4], "")
+        self.assertEqual(self.pages[5], "Balanse\nEgenkapital 845,0")
+        self.assertEqual(self.stats["boilerplate_pages"], 1)
+        self.assertLess(self.stats["ratio"], 0.7)
+
+    def test_keeps_numeric_table_cells_at_page_edges(self):
+        table = "Resultatregnskap\nMNOK\n2024\n2023\nOmsetning 1 200 1 100\nDriftsresultat\n245\n198"
+        pages, stats = normalize_pages([table])
+        self.assertEqual(pages, [table])
+        # Nakne tall øverst/nederst på mange sider regnes ikke som gjentatt topp-/bunntekst
+        segments = [f"Segment {name}\n2024\n2023\n{n}5\n{n}8"
+                    for n, name in enumerate(["Norge", "Sverige", "Danmark", "Finland"], 1)]
+        pages, stats = normalize_pages(segments)
+        self.assertEqual(pages, segments)
+        self.assertEqual(stats["header_footer_lines"], 0)
+
+    def test_strips_bare_page_number_matching_the_page(self):
+        pages, _ = normalize_pages(["Forside\nQ4 2024\n1", "Resultat\n245\n2", "Balanse\n3\n7"])
+        self.assertEqual(pages, ["Forside\nQ4 2024", "Resultat\n245", "Balanse\n3\n7"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+from token_budget import (count_tokens, split_by_tokens, plan_request, context_window, input_budget,
+                          DEFAULT_CONTEXT_WINDOW, SUMMARY_RESERVE)
+
+
+class TestTokenBudget(unittest.TestCase):
+
+    def test_count_tokens(self):
+        self.assertEqual(count_tokens(""), 0)
+        short, long = count_tokens("Omsetning 120 MNOK"), count_tokens("Omsetning 120 MNOK " * 100)
+        self.assertGreater(short, 0)
+        self.assertGreater(long, 50 * short)
+
+    def test_context_window_prefix_match(self):
+        self.assertEqual(context_window("gpt-4o-2024-08-06"), 128000)
+        self.assertEqual(context_window("gpt-4o-mini-2024-07-18"), 128000)
+        self.assertEqual(context_window("gpt-4-0613"), 8192)
+        self.assertEqual(context_window("ukjent-modell"), DEFAULT_CONTEXT_WINDOW)
+
+    def test_split_by_tokens_respects_limit_and_keeps_text(self):
+        text = " ".join(f"linje{i} driftsresultat {i * 7} MNOK" for i in range(400))
+        chunks = split_by_tokens(text, 100)
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(count_tokens(chunk), 100)
+        self.assertEqual(" ".join(" ".join(chunks).split()), text)
+        with self.assertRaises(ValueError):
+            split_by_tokens(text, 0)
+
+    def test_plan_request_single_vs_chunked(self):
+        plan = plan_request("gpt-4", "instr", "kort tekst")
+        self.assertEqual(plan["mode"], "single")
+
+        long_text = "Omsetning 120 MNOK. " * 5000
+        plan = plan_request("gpt-4", "instr", long_text)
+        self.assertEqual(plan["mode"], "chunked")
+        self.assertEqual(plan["text_tokens"], count_tokens(long_text, "gpt-4"))
+        self.assertLess(plan["chunk_tokens"], input_budget("gpt-4", "instr"))
+
+        # Map-reduce sender ikke med oppsummeringen, så chunkene kan være større
+        map_reduce = plan_request("gpt-4", "instr", long_text, strategy="map_reduce")
+        self.assertEqual(map_reduce["chunk_tokens"] - plan["chunk_tokens"], SUMMARY_RESERVE)
+        self.assertEqual(plan_request("gpt-4o", "instr", long_text)["mode"], "single")
+
+    def test_plan_request_rejects_oversized_instructions(self):
+        with self.assertRaises(ValueError):
+            plan_request("gpt-4", "ord " * 20000, "tekst")
+
+
+if __name__ == "__main__":
+    unittest.main()
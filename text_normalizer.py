@@ -0,0 +1,126 @@
+"""
+Normalisering av PDF-tekst før den sendes (og faktureres) som tokens.
+
+PyPDF2 gir med topp- og bunntekster, sidetall, orddeling over linjeskift og
+lange rekker med mellomrom. normalize_pages() behandler alle sidene i et
+dokument samlet:
+
+- linjer som går igjen øverst eller nederst på mange sider (selskapsnavn,
+  rapporttittel, "Side 3 av 20") fjernes; tall telles som like, så
+  sidetallet ikke gjør hver linje unik
+- sidetall-linjer øverst/nederst fjernes: "Side 3", "Page 3 of 20", "3 av 20",
+  eller et nakent tall som første/siste linje når det er lik sidens nummer
+  (andre nakne tall kan være tabellceller, f.eks. et årstall eller en KPI-verdi)
+- orddeling over linjeskift slås sammen ("drifts-\\nresultat" -> "driftsresultat"),
+  men ikke foran "og"/"and"/"och" osv. ("drifts- og investeringsaktiviteter")
+- mellomrom og tomme linjer slås sammen
+- juridisk standardtekst (forward-looking statements, disclaimer, ...) fjernes:
+  hele siden hvis den nesten bare er det, ellers linjene det gjelder
+
+Antall sider er det samme etterpå (tomme sider blir ""), så sidenumrene i
+page_filter.py stemmer fortsatt.
+"""
+import re
+from collections import Counter
+from page_filter import numeric_density
+from token_budget import count_tokens
+
+
+EDGE_LINES = 3  # linjer øverst og nederst på hver side som kan være topp-/bunntekst
+MIN_REPEAT_PAGES = 3  # en linje må gå igjen på minst så mange sider ...
+REPEAT_SHARE = 0.5  # ... og minst denne andelen av sidene
+BOILERPLATE_PAGE_MARKERS = 2  # så mange ulike standardtekst-treff gjør en side med lite tall til standardtekst
+BOILERPLATE_PAGE_DENSITY = 0.05
+
+LEGAL_MARKERS = (
+    "forward-looking statement", "forward looking statement", "disclaimer", "safe harbor",
+    "undertakes no obligation", "no representation or warranty", "does not constitute an offer",
+    "ansvarsfraskrivelse", "fremtidsrettede utsagn", "utgjør ikke et tilbud",
+    "framtidsinriktad information", "framåtblickande", "utgör inte ett erbjudande",
+)
+
+_LEGAL_RE = re.compile("|".join(re.escape(m) for m in LEGAL_MARKERS))
+_PAGE_NUMBER = re.compile(r"^(?:(?:side|sida|page|s\.|p\.)\s*\d{1,4}(?:\s*(?:av|of|/|\|)\s*\d{1,4})?"
+                          r"|\d{1,4}\s*(?:av|of)\s*\d{1,4})$", re.IGNORECASE)
+# Bare mellom små bokstaver, så "EBITDA-\nmargin" og "2023-\n2024" beholder bindestreken
+_HYPHEN_BREAK = re.compile(r"([a-zæøåäö])-[ \t]*\n[ \t]*(?!(?:og|eller|samt|and|or|och)\b)([a-zæøåäö])")
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+
+def _line_key(line: str) -> str:
+    return re.sub(r"\d+", "#", " ".join(line.split()).casefold())
+
+
+def _edge_indices(lines: list[str]) -> set:
+    """Indeksene til de EDGE_LINES første og siste ikke-tomme linjene."""
+    nonempty = [i for i, line in enumerate(lines) if line.strip()]
+    return set(nonempty[:EDGE_LINES] + nonempty[-EDGE_LINES:])
+
+
+def repeated_edge_lines(split_pages: list[list[str]]) -> set:
+    """Nøkler (se _line_key) for topp-/bunnlinjer som går igjen på mange av sidene."""
+    counts = Counter()
+    for lines in split_pages:
+        counts.update({_line_key(lines[i]) for i in _edge_indices(lines)})
+    threshold = max(MIN_REPEAT_PAGES, REPEAT_SHARE * len(split_pages))
+    # Linjer uten bokstaver (nakne tall, "#") er ofte tabellceller og regnes ikke som gjentatte
+    return {key for key, n in counts.items() if n >= threshold and re.search(r"[^\W\d_]", key)}
+
+
+def _is_page_number(line: str, page_no: int, outermost: bool) -> bool:
+    """Sidetall-linje: med "Side"/"Page" o.l. eller "N av M", eller et nakent tall lik 'page_no' ytterst på siden."""
+    if _PAGE_NUMBER.match(line):
+        return True
+    return outermost and line.isdigit() and int(line) == page_no
+
+
+def _normalize_page(lines: list[str], repeated: set, stats: dict, page_no: int = 0) -> str:
+    edges = _edge_indices(lines)
+    nonempty = [i for i, line in enumerate(lines) if line.strip()]
+    outermost = {nonempty[0], nonempty[-1]} if nonempty else set()
+    body = []
+    for i, line in enumerate(lines):
+        collapsed = " ".join(line.split())
+        if i in edges and (_line_key(line) in repeated or _is_page_number(collapsed, page_no, i in outermost)):
+            stats["header_footer_lines"] += 1
+            continue
+        body.append(collapsed)
+
+    text = "\n".join(body)
+    markers = set(_LEGAL_RE.findall(text.casefold()))
+    if len(markers) >= BOILERPLATE_PAGE_MARKERS and numeric_density(text) < BOILERPLATE_PAGE_DENSITY:
+        stats["boilerplate_pages"] += 1
+        return ""
+    if markers:
+        kept = [line for line in body if not _LEGAL_RE.search(line.casefold())]
+        stats["boilerplate_lines"] += len(body) - len(kept)
+        text = "\n".join(kept)
+
+    text = _HYPHEN_BREAK.sub(r"\1\2", text)
+    return _BLANK_LINES.sub("\n\n", text).strip()
+
+
+def normalize_pages(pages: list[str], model_name: str = "gpt-4o") -> tuple[list[str], dict]:
+    """
+    Normaliserer alle sidene i ett dokument. Returnerer (sider, statistikk) med
+    "chars_in", "chars_out", "tokens_in", "tokens_out", "ratio" (tokens ut / inn),
+    "header_footer_lines", "boilerplate_lines" og "boilerplate_pages".
+    """
+    split_pages = [page.splitlines() for page in pages]
+    repeated = repeated_edge_lines(split_pages)
+    stats = {"header_footer_lines": 0, "boilerplate_lines": 0, "boilerplate_pages": 0}
+    normalized = [_normalize_page(lines, repeated, stats, page_no)
+                  for page_no, lines in enumerate(split_pages, 1)]
+
+    before = "\n".join(pages)
+    after = "\n".join(normalized)
+    stats["chars_in"], stats["chars_out"] = len(before), len(after)
+    stats["tokens_in"], stats["tokens_out"] = count_tokens(before, model_name), count_tokens(after, model_name)
+    stats["ratio"] = stats["tokens_out"] / stats["tokens_in"] if stats["tokens_in"] else 1.0
+    return normalized, stats
+
+
+def format_stats(stats: dict) -> str:
+    return (f"{stats['tokens_in']} -> {stats['tokens_out']} tokens ({1 - stats['ratio']:.0%} spart; "
+            f"{stats['header_footer_lines']} topp-/bunnlinjer, {stats['boilerplate_lines']} "
+            f"standardtekst-linjer og {stats['boilerplate_pages']} standardtekst-sider fjernet)")
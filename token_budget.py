@@ -0,0 +1,127 @@
+"""
+Token-telling og kontekstbudsjett per modell.
+
+Brukes til å velge strategi (ett kall eller chunking) og chunk-størrelse
+_før_ noe sendes til API-et, i stedet for å prøve og feile på
+"maximum context length".
+
+Bruker tiktoken hvis den er installert; ellers et konservativt estimat
+(ca. 3.5 tegn per token, som passer godt for norsk/engelsk rapporttekst).
+"""
+import math
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+# Kontekstvindu (input + output) i tokens per modell
+CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-4.1": 1047576,
+    "gpt-4.1-mini": 1047576,
+    "deepseek-chat": 64000,
+    "deepseek-reasoner": 64000,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# Tokens vi holder av til modellens svar (KPI-JSON er kort)
+OUTPUT_RESERVE = 4096
+# Tokens per melding i chat-formatet (rolle, separatorer)
+MESSAGE_OVERHEAD = 8
+# Ekstra plass i rolling-summary-modus til oppsummeringen som vokser
+SUMMARY_RESERVE = 2048
+
+CHARS_PER_TOKEN = 3.5
+
+
+def context_window(model_name: str) -> int:
+    """Slår opp kontekstvinduet; prefiks-treff dekker daterte varianter (gpt-4o-2024-08-06)."""
+    if model_name in CONTEXT_WINDOWS:
+        return CONTEXT_WINDOWS[model_name]
+    for name in sorted(CONTEXT_WINDOWS, key=len, reverse=True):
+        if model_name.startswith(name):
+            return CONTEXT_WINDOWS[name]
+    return DEFAULT_CONTEXT_WINDOW
+
+
+def _encoding(model_name: str):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model_name: str = "gpt-4o") -> int:
+    """Antall tokens i 'text' for 'model_name' (eksakt med tiktoken, ellers estimat)."""
+    enc = _encoding(model_name)
+    if enc is not None:
+        return len(enc.encode(text))
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def split_by_tokens(text: str, max_tokens: int, model_name: str = "gpt-4o") -> list[str]:
+    """Deler 'text' i biter på høyst 'max_tokens' tokens hver."""
+    if max_tokens <= 0:
+        raise ValueError("max_tokens must be positive.")
+
+    enc = _encoding(model_name)
+    if enc is not None:
+        tokens = enc.encode(text)
+        return [enc.decode(tokens[i : i+max_tokens]) for i in range(0, len(tokens), max_tokens)]
+
+    # Uten tokenizer: samle hele ord til estimatet når grensen
+    max_chars = int(max_tokens * CHARS_PER_TOKEN)
+    chunks, current, current_len = [], [], 0
+    for word in text.split():
+        if current and current_len + len(word) + 1 > max_chars:
+            chunks.append(" ".join(current))
+            current, current_len = [], 0
+        current.append(word)
+        current_len += len(word) + 1
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def input_budget(model_name: str, instructions: str, output_reserve: int = OUTPUT_RESERVE) -> int:
+    """Tokens som er igjen til brukerteksten i ett kall, etter systemprompt og svar."""
+    return (
+        context_window(model_name)
+        - count_tokens(instructions, model_name)
+        - output_reserve
+        - 2 * MESSAGE_OVERHEAD
+    )
+
+
+def plan_request(model_name: str, instructions: str, text: str, strategy: str = "rolling") -> dict:
+    """
+    Velger strategi før noe sendes.
+    Returnerer {"mode": "single"|"chunked", "text_tokens": int, "chunk_tokens": int},
+    der chunk_tokens er største chunk som får plass hvis man chunker.
+    """
+    budget = input_budget(model_name, instructions)
+    if budget <= 0:
+        raise ValueError(
+            f"The instructions alone do not fit in the context window of '{model_name}'."
+        )
+
+    text_tokens = count_tokens(text, model_name)
+
+    # Rolling summary sender med oppsummeringen i hvert kall, map-reduce gjør ikke det
+    chunk_tokens = budget - MESSAGE_OVERHEAD - 64  # 64: ledetekst rundt chunken
+    if strategy == "rolling":
+        chunk_tokens -= SUMMARY_RESERVE
+    if chunk_tokens <= 0:
+        raise ValueError(f"No room for document text in the context window of '{model_name}'.")
+
+    mode = "single" if text_tokens <= budget else "chunked"
+    return {"mode": mode, "text_tokens": text_tokens, "chunk_tokens": chunk_tokens}